@@ -0,0 +1,398 @@
+"""
+Console batch mode to create several encrypted containers listed in a manifest file.
+Containers on different physical devices get created in parallel with one worker process per device,
+containers sharing a device one after the other to avoid competing writes.
+
+luckyLUKS Copyright (c) 2014,2015,2022 Jasper van Hoorn (muzius@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details. <http://www.gnu.org/licenses/>
+"""
+
+import os
+import re
+import sys
+import json
+import getpass
+import threading
+import subprocess
+from time import monotonic
+
+from luckyLUKS.containerfile import MiB, JOURNAL_SUFFIX, get_physical_devices, parse_size
+from luckyLUKS.pbkdf import DEFAULT_PBKDF_PROFILE
+from luckyLUKS.ciphers import load_benchmarks, choose_cipher
+
+
+class ManifestException(Exception):
+    """ Raised if the manifest cannot be read or contains invalid entries """
+
+
+class BatchJob():
+
+    """ A single container of the manifest and the result of creating it """
+
+    def __init__(self, entry, base_dir):
+        """ :param entry: path, name, size and optional filesystem, format, key_file, quickformat, thin,
+                           io_priority, rate_limit, benchmark, pbkdf, cipher, perf_flags and sector_size
+            :type entry: dict
+            :param base_dir: Relative paths in the manifest are resolved from this directory
+            :type base_dir: str
+            :raises: ManifestException
+        """
+        try:
+            self.path = os.path.join(base_dir, os.path.expanduser(entry['path']))
+            self.name = entry['name']
+            self.size = parse_size(entry['size'])
+            self.rate_limit = parse_size(entry.get('rate_limit', 0))
+        except KeyError as ke:
+            raise ManifestException(_('Missing value {key} in manifest entry:\n{entry}').format(
+                key=str(ke), entry=json.dumps(entry)))
+        except ValueError as ve:
+            raise ManifestException(str(ve))
+        self.filesystem_type = entry.get('filesystem', 'ext4')
+        self.encryption_format = entry.get('format', 'LUKS')
+        self.pbkdf_profile = entry.get('pbkdf', DEFAULT_PBKDF_PROFILE)
+        # auto: the fastest cipher measured on this machine, cryptsetup default if not measured yet
+        self.cipher = entry.get('cipher', 'auto')
+        if self.cipher == 'auto':
+            results = load_benchmarks()
+            self.cipher = choose_cipher(results) if results else None
+        # dm-crypt performance flags eg ["no_read_workqueue", "no_write_workqueue"], stored in the LUKS2 header
+        self.perf_flags = entry.get('perf_flags')
+        if self.perf_flags is not None and not isinstance(self.perf_flags, list):
+            raise ManifestException(_('perf_flags must be a list in manifest entry:\n{entry}').format(
+                entry=json.dumps(entry)))
+        # 0: 4096 byte sectors if the filesystem allows it
+        self.sector_size = entry.get('sector_size', 0)
+        self.key_file = entry.get('key_file')
+        if self.key_file is not None:
+            self.key_file = os.path.join(base_dir, os.path.expanduser(self.key_file))
+        self.quickformat = bool(entry.get('quickformat', False))
+        # sparse container file with discards passed through, see WorkerHelper.create_container()
+        self.thin = bool(entry.get('thin', False))
+        self.io_priority = entry.get('io_priority', 'normal')
+        self.benchmark = bool(entry.get('benchmark', False))
+        self.passphrase = None
+        # progress and result
+        self.state = 'pending'
+        self.written = 0
+        self.rate = 0
+        self.elapsed = 0
+        self.error = None
+
+    def to_command(self):
+        """ :returns: The unattended create command for the worker process
+            :rtype: dict
+        """
+        return {'type': 'request',
+                'msg': 'create',
+                'device_name': self.name,
+                'container_path': self.path,
+                'container_size': self.size,
+                'filesystem_type': self.filesystem_type,
+                'encryption_format': self.encryption_format,
+                'pbkdf_profile': self.pbkdf_profile,
+                'cipher': self.cipher,
+                'perf_flags': self.perf_flags,
+                'sector_size': self.sector_size,
+                'key_file': self.key_file,
+                'quickformat': self.quickformat,
+                'thin': self.thin,
+                'resume': os.path.exists(self.path + JOURNAL_SUFFIX),
+                'unattended': True,
+                'io_priority': self.io_priority,
+                'rate_limit': self.rate_limit,
+                'benchmark': self.benchmark,
+                'passphrase': self.passphrase}
+
+
+def read_manifest(manifest_path):
+    """ Reads the containers to be created from a JSON manifest: either a list of entries
+        or an object with the list in `containers`. Each entry needs path, name and size,
+        filesystem (ext4), format (LUKS), key_file, quickformat (false), thin (false, sparse file),
+        io_priority ('normal' or 'background'), rate_limit (eg '50M' bytes per second),
+        benchmark (false, measure the first write), pbkdf ('fast', 'balanced' or 'paranoid'),
+        cipher ('auto' or eg 'aes-xts', 'adiantum'), perf_flags (eg ['no_read_workqueue', 'no_write_workqueue'])
+        and sector_size (512 or 4096) are optional
+        :param manifest_path: Path of the manifest file
+        :type manifest_path: str
+        :returns: One job per container
+        :rtype: list of :class:`BatchJob`
+        :raises: ManifestException
+    """
+    try:
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (IOError, ValueError) as error:
+        raise ManifestException(str(error))
+    if isinstance(manifest, dict):
+        manifest = manifest.get('containers', [])
+    if not isinstance(manifest, list) or not manifest:
+        raise ManifestException(_('No containers found in manifest {file_path}').format(file_path=manifest_path))
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = [BatchJob(entry, base_dir) for entry in manifest]
+    for attribute in ('path', 'name'):
+        values = [getattr(job, attribute) for job in jobs]
+        duplicates = sorted(set(value for value in values if values.count(value) > 1))
+        if duplicates:
+            raise ManifestException(_('Duplicate {attribute} in manifest: {values}').format(
+                attribute=attribute, values=', '.join(duplicates)))
+    for job in jobs:
+        if not os.path.isdir(os.path.dirname(job.path)):
+            raise ManifestException(_('Directory not accessible\nor path does not exist:\n\n{file_path}').format(
+                file_path=os.path.dirname(job.path)))
+    return jobs
+
+
+class BatchProvisioner():
+
+    """ Creates the containers of a manifest: one thread with its own worker process per group of physical
+        devices, jobs of a group run sequentially. The main thread prints aggregated progress.
+    """
+
+    def __init__(self, jobs, output=sys.stdout):
+        """ :param jobs: The containers to be created
+            :type jobs: list of :class:`BatchJob`
+            :param output: Progress and results get written here
+            :type output: file
+        """
+        self.jobs = jobs
+        self.output = output
+        self.workers = []
+        self._lock = threading.Lock()
+
+    def group_by_device(self):
+        """ Groups jobs that share a physical device, jobs on disjoint devices end up in different groups
+            :returns: The jobs to be run sequentially per group
+            :rtype: list of list of :class:`BatchJob`
+        """
+        groups = []  # list of (set of devices, jobs)
+        for job in self.jobs:
+            devices = set(get_physical_devices(os.path.dirname(job.path)))
+            overlapping = [group for group in groups if group[0] & devices]
+            for group in overlapping:
+                groups.remove(group)
+                devices |= group[0]
+            groups.append((devices, [j for group in overlapping for j in group[1]] + [job]))
+        return [group_jobs for __, group_jobs in groups]
+
+    def run(self):
+        """ Creates all containers, prints progress while running and a summary at the end
+            :returns: True if all containers have been created successfully
+            :rtype: bool
+        """
+        groups = self.group_by_device()
+        self.output.write(_('Creating {containers} containers on {devices} devices').format(
+            containers=len(self.jobs), devices=len(groups)) + '\n')
+        start_time = monotonic()
+        threads = [threading.Thread(target=self.run_group, args=(group,)) for group in groups]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(1)
+                self.print_status(monotonic() - start_time)
+        except KeyboardInterrupt:
+            # closing the pipes makes the workers save a checkpoint and quit, next run resumes
+            for worker in self.workers:
+                worker.stdin.close()
+            for worker in self.workers:
+                worker.wait()
+            self.output.write('\n' + _('Interrupted, run again with the same manifest to resume') + '\n')
+            return False
+        self.print_summary(monotonic() - start_time)
+        return all(job.state == 'done' for job in self.jobs)
+
+    def run_group(self, jobs):
+        """ Starts a worker process and creates the containers of one device group one after the other
+            :param jobs: The containers to be created
+            :type jobs: list of :class:`BatchJob`
+        """
+        try:
+            worker = self.spawn_worker()
+        except (OSError, IOError) as error:
+            for job in jobs:
+                job.state, job.error = 'failed', str(error)
+            return
+        try:
+            for job in jobs:
+                self.run_job(worker, job)
+        finally:
+            if not worker.stdin.closed:
+                worker.stdin.close()
+            worker.wait()
+
+    def spawn_worker(self):
+        """ Starts a worker process with sudo, the sudo credentials have to be cached already
+            :returns: The worker process
+            :rtype: :class:`subprocess.Popen`
+            :raises: IOError
+        """
+        return spawn_worker(self.register_worker)
+
+    def register_worker(self, worker):
+        """ :param worker: A started worker process, gets closed on interrupt
+            :type worker: :class:`subprocess.Popen`
+        """
+        with self._lock:
+            self.workers.append(worker)
+
+    def run_job(self, worker, job):
+        """ Sends the create command of a job to the worker and follows its progress until it finished
+            :param worker: The worker process
+            :type worker: :class:`subprocess.Popen`
+            :param job: The container to be created
+            :type job: :class:`BatchJob`
+        """
+        job.state = 'running'
+        start_time = monotonic()
+        try:
+            worker.stdin.write(json.dumps(job.to_command()) + '\n')
+            worker.stdin.flush()
+        except (IOError, ValueError) as error:  # ValueError if the pipe got closed
+            job.state, job.error = 'failed', str(error)
+            return
+        finally:
+            job.passphrase = None
+
+        while True:
+            line = worker.stdout.readline()
+            if not line:
+                job.state, job.error = 'failed', _('Worker process terminated unexpectedly')
+                break
+            try:
+                message = json.loads(line)
+                if message['type'] == 'progress':
+                    progress = message['msg']
+                    if progress.get('phase') == 'fill' and not progress.get('done'):
+                        job.written, job.rate = progress['bytes'], progress['rate']
+                    elif progress.get('phase') == 'fill':
+                        # quickformat and pool files: nothing written, kept out of the average throughput
+                        job.written, job.rate = progress.get('bytes', job.size), 0
+                    continue
+            except (ValueError, KeyError, TypeError, AttributeError):
+                # anything but a message (eg a traceback or sudo warning): later responses could belong to this job,
+                # closing the pipe makes the worker save a checkpoint and quit, the remaining jobs of the group fail
+                job.state, job.error = 'failed', _('Unexpected output from worker process:\n{output}').format(
+                    output=line.strip())
+                worker.stdin.close()
+                break
+            if message['type'] == 'error':
+                job.state, job.error = 'failed', plain_text(message['msg'])
+            else:
+                job.state = 'done'
+            break
+        job.rate = 0
+        job.elapsed = monotonic() - start_time
+
+    def print_status(self, elapsed):
+        """ Prints a single status line with the aggregate throughput of all running fills
+            :param elapsed: Seconds since the batch started
+            :type elapsed: float
+        """
+        finished = len([job for job in self.jobs if job.state in ('done', 'failed')])
+        rate = sum(job.rate for job in self.jobs)
+        written = sum(job.written for job in self.jobs)
+        total = sum(job.size for job in self.jobs)
+        self.output.write('\r' + _('{finished}/{containers} containers - {written}/{total} MB - {rate} MB/s').format(
+            finished=finished, containers=len(self.jobs), written=written // MiB, total=total // MiB,
+            rate='{0:.1f}'.format(rate / MiB)) + ' ' * 8)
+        self.output.flush()
+
+    def print_summary(self, elapsed):
+        """ Prints the result of each container, the wall time and the overall throughput
+            :param elapsed: Seconds since the batch started
+            :type elapsed: float
+        """
+        self.output.write('\n\n')
+        for job in self.jobs:
+            if job.state == 'done':
+                result = _('created in {seconds} s').format(seconds='{0:.1f}'.format(job.elapsed))
+            else:
+                result = _('failed: {error}').format(error=job.error or _('not started'))
+            self.output.write('{path} ({name}, {size} MB): {result}\n'.format(
+                path=job.path, name=job.name, size=job.size // MiB, result=result))
+        written = sum(job.written for job in self.jobs if job.state == 'done')
+        self.output.write('\n' + _('{created}/{containers} containers created in {seconds} s, '
+                                   'average {rate} MB/s').format(
+            created=len([job for job in self.jobs if job.state == 'done']), containers=len(self.jobs),
+            seconds='{0:.1f}'.format(elapsed), rate='{0:.1f}'.format(written / max(elapsed, 1e-6) / MiB)) + '\n')
+
+
+def spawn_worker(started_callback=None):
+    """ Starts a worker process with sudo, the sudo credentials have to be cached already
+        or sudo has to be configured to run luckyLUKS without password
+        :param started_callback: Gets the process before waiting for the worker to be ready
+        :type started_callback: function(:class:`subprocess.Popen`) or None
+        :returns: The worker process
+        :rtype: :class:`subprocess.Popen`
+        :raises: IOError
+    """
+    cmd = ['sudo', '-n', 'LANGUAGE=' + os.getenv("LANGUAGE", ""),
+           os.path.abspath(sys.argv[0]), '--ishelperprocess']
+    worker = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              stdout=subprocess.PIPE, universal_newlines=True)
+    if started_callback is not None:
+        started_callback(worker)
+    ack = worker.stdout.read(len('ESTABLISHED'))
+    if ack != 'ESTABLISHED':
+        worker.wait()
+        raise IOError((ack + worker.stdout.read()).strip())
+    return worker
+
+
+def plain_text(message):
+    """ Converts markup of messages meant for the GUI to plain text
+        :param message: Message with <br> and other html tags
+        :type message: str
+        :returns: The message without markup
+        :rtype: str
+    """
+    return re.sub(r'<[^>]+>', '', message.replace('<br>', '\n')).strip()
+
+
+def ask_passphrases(jobs):
+    """ Asks on the terminal for the passphrase of each container that doesn't use a key file
+        :param jobs: The containers to be created
+        :type jobs: list of :class:`BatchJob`
+    """
+    for job in jobs:
+        if job.key_file is not None:
+            continue
+        while True:
+            passphrase = getpass.getpass(_('Passphrase for {name} ({file_path}): ').format(
+                name=job.name, file_path=job.path))
+            if passphrase and passphrase == getpass.getpass(_('Repeat passphrase: ')):
+                job.passphrase = passphrase
+                break
+            sys.stdout.write(_('Passphrases empty or not matching, please retry') + '\n')
+
+
+def run(manifest_path):
+    """ Entry point of the batch mode: reads the manifest, asks for passphrases and the sudo password
+        and creates all containers
+        :param manifest_path: Path of the manifest file
+        :type manifest_path: str
+        :returns: exit code, 0 if all containers have been created successfully
+        :rtype: int
+    """
+    try:
+        jobs = read_manifest(manifest_path)
+    except ManifestException as me:
+        sys.stdout.write(plain_text(str(me)) + '\n')
+        return 1
+    ask_passphrases(jobs)
+    # cache sudo credentials once, workers get started non-interactively
+    if subprocess.call(['sudo', '-v']) != 0:
+        return 1
+    return 0 if BatchProvisioner(jobs).run() else 1
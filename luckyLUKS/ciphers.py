@@ -0,0 +1,195 @@
+"""
+Cipher choice for new LUKS containers based on `cryptsetup benchmark`: AES-XTS is fastest on
+CPUs with AES instructions, Adiantum (XChaCha20) is designed for those without. The measurements
+get cached per CPU and kernel, since they only change with the hardware or the kernel crypto drivers.
+
+luckyLUKS Copyright (c) 2014,2015,2022 Jasper van Hoorn (muzius@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details. <http://www.gnu.org/licenses/>
+"""
+
+import os
+import re
+import subprocess
+from time import time
+
+from luckyLUKS.containerfile import MiB, load_config, save_config
+
+# `  aes-xts   512b   2345.6 MiB/s   2401.2 MiB/s`, N/A if the kernel lacks the cipher
+BENCHMARK_CIPHER = re.compile(r'^\s*(\S+)\s+(\d+)b\s+([\d.]+) MiB/s\s+([\d.]+) MiB/s', re.MULTILINE)
+
+
+class CipherCandidate():
+
+    """ A cipher and key size considered safe for new containers """
+
+    def __init__(self, name, cipher, key_size, description):
+        """ :param name: Identifies the candidate in the UI, in manifests and create commands
+            :type name: str
+            :param cipher: The cipher specification for cryptsetup
+            :type cipher: str
+            :param key_size: Key size in bits
+            :type key_size: int
+            :param description: Short description shown in the UI
+            :type description: str
+        """
+        self.name = name
+        self.cipher = cipher
+        self.key_size = key_size
+        self.description = description
+
+    def cryptsetup_options(self):
+        """ :returns: Options for cryptsetup luksFormat
+            :rtype: list of str
+        """
+        return ['--cipher', self.cipher, '--key-size', str(self.key_size)]
+
+    def benchmark_command(self):
+        """ :returns: The cryptsetup benchmark command for this cipher
+            :rtype: list of str
+        """
+        return ['cryptsetup', 'benchmark'] + self.cryptsetup_options()
+
+
+CIPHER_CANDIDATES = [
+    CipherCandidate('aes-xts', 'aes-xts-plain64', 512,
+                    _('AES-256 in XTS mode, the cryptsetup default and fastest with AES instructions')),
+    CipherCandidate('adiantum', 'xchacha20,aes-adiantum-plain64', 256,
+                    _('Adiantum (XChaCha20), fast on processors without AES instructions')),
+    CipherCandidate('serpent-xts', 'serpent-xts-plain64', 512,
+                    _('Serpent in XTS mode, conservative design but slow')),
+    CipherCandidate('twofish-xts', 'twofish-xts-plain64', 512,
+                    _('Twofish in XTS mode')),
+]
+DEFAULT_CIPHER = 'aes-xts'
+# the default is kept unless another cipher is clearly faster
+SWITCH_FACTOR = 1.2
+
+
+def get_cipher(name):
+    """ Looks up a cipher candidate by name
+        :param name: The name of the candidate
+        :type name: str
+        :returns: The candidate or None if there is no candidate with this name
+        :rtype: :class:`CipherCandidate` or None
+    """
+    for candidate in CIPHER_CANDIDATES:
+        if candidate.name == name:
+            return candidate
+    return None
+
+
+def get_machine_key():
+    """ Benchmarks are valid for one CPU model and kernel
+        :returns: cpu model and kernel release
+        :rtype: str
+    """
+    model = ''
+    try:
+        with open('/proc/cpuinfo') as cpuinfo:
+            for line in cpuinfo:
+                key, __, value = line.partition(':')
+                if key.strip() in ('model name', 'Hardware', 'cpu model', 'CPU part'):
+                    model = value.strip()
+                    break
+    except IOError:
+        pass
+    return '{model} / {kernel}'.format(model=model or 'unknown', kernel=os.uname().release)
+
+
+def has_aes_instructions():
+    """ :returns: True if the cpu flags announce hardware AES (x86 `aes`, arm `aes` feature)
+        :rtype: bool
+    """
+    try:
+        with open('/proc/cpuinfo') as cpuinfo:
+            for line in cpuinfo:
+                key, __, value = line.partition(':')
+                if key.strip() in ('flags', 'Features') and 'aes' in value.split():
+                    return True
+    except IOError:
+        pass
+    return False
+
+
+def benchmark_cipher(candidate):
+    """ Measures en- and decryption speed of a cipher in memory
+        :param candidate: The cipher to be measured
+        :type candidate: :class:`CipherCandidate`
+        :returns: encryption and decryption in bytes per second, None if not supported by the kernel
+        :rtype: dict or None
+        :raises: OSError
+    """
+    try:
+        output = subprocess.check_output(candidate.benchmark_command(), stderr=subprocess.STDOUT,
+                                         universal_newlines=True)
+    except subprocess.CalledProcessError:
+        return None
+    match = BENCHMARK_CIPHER.search(output)
+    if match is None:
+        return None
+    return {'encryption': float(match.group(3)) * MiB, 'decryption': float(match.group(4)) * MiB}
+
+
+def run_benchmarks():
+    """ Measures all candidates and stores the results for this machine
+        :returns: The results per candidate name, see load_benchmarks()
+        :rtype: dict
+    """
+    results = {}
+    for candidate in CIPHER_CANDIDATES:
+        try:
+            results[candidate.name] = benchmark_cipher(candidate)
+        except OSError:
+            results[candidate.name] = None
+    config = load_config('ciphers.json')
+    config[get_machine_key()] = {'results': results, 'aes_instructions': has_aes_instructions(), 'time': time()}
+    try:
+        save_config('ciphers.json', config)
+    except (IOError, OSError):
+        pass  # measured again next time
+    return results
+
+
+def load_benchmarks():
+    """ :returns: Cached results for this machine per candidate name: encryption and decryption
+                  in bytes per second, None for ciphers not supported. None if not measured yet
+        :rtype: dict or None
+    """
+    cached = load_config('ciphers.json').get(get_machine_key())
+    return cached['results'] if cached else None
+
+
+def get_speed(results, name):
+    """ :param results: Benchmark results per candidate name
+        :type results: dict
+        :param name: The candidate
+        :type name: str
+        :returns: The slower of en- and decryption in bytes per second, 0 if not supported or measured
+        :rtype: float
+    """
+    result = (results or {}).get(name)
+    return min(result['encryption'], result['decryption']) if result else 0
+
+
+def choose_cipher(results):
+    """ Picks the fastest candidate, keeping the default unless another one is clearly faster
+        :param results: Benchmark results per candidate name
+        :type results: dict or None
+        :returns: The name of the candidate
+        :rtype: str
+    """
+    if not results:
+        return DEFAULT_CIPHER
+    fastest = max(CIPHER_CANDIDATES, key=lambda candidate: get_speed(results, candidate.name)).name
+    if get_speed(results, fastest) > get_speed(results, DEFAULT_CIPHER) * SWITCH_FACTOR:
+        return fastest
+    return DEFAULT_CIPHER
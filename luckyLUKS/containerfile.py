@@ -0,0 +1,911 @@
+"""
+Low level handling of container files for the privileged worker process:
+filling new containers with random data using several threads and large aligned writes,
+a sidecar journal to resume an interrupted fill and a per-user pool of pre-filled container files.
+
+luckyLUKS Copyright (c) 2014,2015,2022 Jasper van Hoorn (muzius@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details. <http://www.gnu.org/licenses/>
+"""
+
+import os
+import stat
+import fcntl
+import json
+import mmap
+import re
+import errno
+import ctypes
+import struct
+import threading
+from uuid import uuid4
+from time import monotonic
+
+from luckyLUKS.luksheader import LuksHeaderException, read_header
+
+MiB = 1024 * 1024
+DIRECT_IO_ALIGNMENT = 4096
+JOURNAL_SUFFIX = '.luckyluks-journal'
+JOURNAL_VERSION = 1
+POOL_FILE_PATTERN = re.compile(r'^pool-(\d+)-[0-9a-f]{32}\.bin$')
+# pool files get filled under a temporary name and renamed to POOL_FILE_PATTERN once completely filled
+POOL_FILLING_SUFFIX = '.filling'
+POOL_FILLING_PATTERN = re.compile(r'^pool-(\d+)-[0-9a-f]{32}\.bin\.filling$')
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': MiB, 'G': 1024 * MiB, 'T': 1024 * 1024 * MiB}
+# copy-on-write filesystems: container files need the NOCOW attribute to avoid fragmenting on every write
+COW_FILESYSTEMS = ['btrfs']
+# statfs f_type of filesystems whose st_dev doesn't match their mount entry (btrfs subvolumes get anonymous
+# device numbers) or that are identified more reliably this way, from linux/magic.h. The ext2/3/4 family
+# shares one magic and gets told apart by the mount table
+FILESYSTEM_MAGICS = {0x9123683E: 'btrfs', 0x58465342: 'xfs', 0xF2F52010: 'f2fs', 0x2FC12FC1: 'zfs',
+                     0xCA451A4E: 'bcachefs', 0x01021994: 'tmpfs', 0x6969: 'nfs'}
+# struct statfs is 120 bytes on 64bit, f_type comes first (long)
+STATFS_SIZE = 256
+# ioctls from linux/fs.h
+FS_IOC_GETFLAGS = 0x80086601
+FS_IOC_SETFLAGS = 0x40086602
+FS_IOC_FIEMAP = 0xC020660B
+FS_NOCOW_FL = 0x00800000
+FIEMAP_HEADER = struct.Struct('=QQIIII')  # fm_start, fm_length, fm_flags, fm_mapped_extents, fm_extent_count
+FIEMAP_EXTENT = struct.Struct('=QQQ16xI12x')  # fe_logical, fe_physical, fe_length, fe_flags
+FIEMAP_EXTENT_LAST = 0x1
+FIEMAP_EXTENT_UNWRITTEN = 0x800
+FIEMAP_FLAG_SYNC = 0x1
+# containers with smaller fragments on average (and more than a few of them) should be rewritten
+FRAGMENTED_AVERAGE = 8 * MiB
+FRAGMENTED_MINIMUM = 16
+
+
+class FillException(Exception):
+    """ Raised if writing random data to the container file failed """
+
+
+def get_physical_devices(path):
+    """ Resolves the disks a path is stored on: partitions map to their disk and
+        stacked devices (device mapper, md raid) to the disks below them
+        :param path: A file or directory on the device in question
+        :type path: str
+        :returns: sysfs names of the underlying disks, or the device number if not backed by a block device
+        :rtype: tuple of str
+    """
+    st_dev = os.stat(path).st_dev
+    sys_dev = '/sys/dev/block/{major}:{minor}'.format(major=os.major(st_dev), minor=os.minor(st_dev))
+    if not os.path.exists(sys_dev):
+        return ('{major}:{minor}'.format(major=os.major(st_dev), minor=os.minor(st_dev)),)
+
+    disks = set()
+    todo = [os.path.realpath(sys_dev)]
+    while todo:
+        sys_dev = todo.pop()
+        if not os.path.exists(os.path.join(sys_dev, 'queue')):
+            sys_dev = os.path.dirname(sys_dev)  # partition -> parent device
+        slaves = os.path.join(sys_dev, 'slaves')
+        if os.path.isdir(slaves) and os.listdir(slaves):
+            todo += [os.path.realpath(os.path.join(slaves, slave)) for slave in os.listdir(slaves)]
+        else:
+            disks.add(os.path.basename(sys_dev))
+    return tuple(sorted(disks))
+
+
+def get_filesystem_magic(path):
+    """ :param path: A file or directory
+        :type path: str
+        :returns: The f_type of statfs() for the filesystem a path resides on, None if unavailable
+        :rtype: int or None
+    """
+    libc = ctypes.CDLL(None, use_errno=True)
+    statfs = getattr(libc, 'statfs64', None) or libc.statfs
+    statfs.argtypes = [ctypes.c_char_p, ctypes.c_void_p]
+    buffer = ctypes.create_string_buffer(STATFS_SIZE)
+    if statfs(os.fsencode(path), buffer) != 0:
+        return None
+    # f_type is signed on some architectures, magics are compared unsigned
+    return ctypes.c_long.from_buffer(buffer).value & 0xFFFFFFFF
+
+
+def get_filesystem_type(path):
+    """ Identifies the filesystem a path resides on by its statfs magic, or else looks up the type in the mount table
+        :param path: A file or directory
+        :type path: str
+        :returns: The filesystem type eg 'ext4' or 'btrfs', None if not found
+        :rtype: str or None
+    """
+    filesystem = FILESYSTEM_MAGICS.get(get_filesystem_magic(path))
+    if filesystem is not None:
+        return filesystem
+    st_dev = os.stat(path).st_dev
+    device = '{major}:{minor}'.format(major=os.major(st_dev), minor=os.minor(st_dev))
+    try:
+        with open('/proc/self/mountinfo') as mountinfo:
+            for line in mountinfo:
+                # mount id, parent id, major:minor, root, mount point, options, optional fields, -, type, ..
+                fields = line.split()
+                if fields[2] == device:
+                    return fields[fields.index('-') + 1]
+    except (IOError, ValueError, IndexError):
+        pass
+    return None
+
+
+def disable_cow(fd):
+    """ Sets the NOCOW attribute (`chattr +C`) on an empty file. Data of NOCOW files gets overwritten in place,
+        so a loop mounted container doesn't fragment on copy-on-write filesystems. Checksums and compression
+        are not used for these files, which doesn't matter for encrypted data.
+        :param fd: File descriptor of the empty container file
+        :type fd: int
+        :returns: True if the attribute is set
+        :rtype: bool
+    """
+    flags = bytearray(8)
+    try:
+        fcntl.ioctl(fd, FS_IOC_GETFLAGS, flags)
+        value = struct.unpack_from('=i', flags)[0] | FS_NOCOW_FL
+        fcntl.ioctl(fd, FS_IOC_SETFLAGS, struct.pack('=iI', value, 0))
+        fcntl.ioctl(fd, FS_IOC_GETFLAGS, flags)
+    except OSError:
+        return False
+    return bool(struct.unpack_from('=i', flags)[0] & FS_NOCOW_FL)
+
+
+def preallocate(fd, size, emulate=False):
+    """ Reserves the space of the container file in one call, which lets the filesystem choose large
+        contiguous extents instead of allocating piece by piece while the data gets written.
+        :param fd: File descriptor of the container file
+        :type fd: int
+        :param size: The size of the container in bytes
+        :type size: int
+        :param emulate: Fall back to posix_fallocate (writes zeros) if the filesystem doesn't support fallocate
+        :type emulate: bool
+        :returns: True if the space has been allocated
+        :rtype: bool
+        :raises: OSError
+    """
+    libc = ctypes.CDLL(None, use_errno=True)
+    fallocate = getattr(libc, 'fallocate64', None) or libc.fallocate
+    fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+    if fallocate(fd, 0, 0, size) == 0:
+        return True
+    error = ctypes.get_errno()
+    if error not in (errno.EOPNOTSUPP, errno.ENOSYS):
+        raise OSError(error, os.strerror(error))
+    if emulate:
+        os.posix_fallocate(fd, 0, size)
+        return True
+    return False
+
+
+def prepare_container_file(fd, size, emulate=False, sparse=False):
+    """ Disables copy-on-write if needed and preallocates the space of a new container file
+        :param fd: File descriptor of the container file
+        :type fd: int
+        :param size: The size of the container in bytes
+        :type size: int
+        :param emulate: Fall back to writing zeros if the filesystem doesn't support fallocate
+        :type emulate: bool
+        :param sparse: Only set the size of the file, disk space gets allocated when the container is written to
+        :type sparse: bool
+        :returns: filesystem type, NOCOW attribute set and space preallocated
+        :rtype: dict
+        :raises: OSError
+    """
+    filesystem = get_filesystem_type('/proc/self/fd/{fd}'.format(fd=fd))
+    nocow = filesystem in COW_FILESYSTEMS and os.fstat(fd).st_size == 0 and disable_cow(fd)
+    if sparse:
+        os.ftruncate(fd, size)
+        return {'filesystem': filesystem, 'nocow': nocow, 'preallocated': False}
+    return {'filesystem': filesystem, 'nocow': nocow, 'preallocated': preallocate(fd, size, emulate)}
+
+
+def get_allocated_size(path):
+    """ The disk space a container file takes up can be less than its size if the file is sparse (thin containers)
+        :param path: The path of the container file
+        :type path: str
+        :returns: apparent size and allocated disk space in bytes
+        :rtype: dict
+        :raises: OSError
+    """
+    file_stat = os.stat(path)
+    return {'apparent': file_stat.st_size, 'allocated': file_stat.st_blocks * 512}
+
+
+def describe_allocation(sizes):
+    """ Summary of the disk space used by a container file for display
+        :param sizes: apparent size and allocated disk space as returned by get_allocated_size()
+        :type sizes: dict
+        :rtype: str
+    """
+    # L10n: disk space used by a thin (sparse) container file compared with its size
+    return _('{allocated} MB of {apparent} MB allocated ({percent}%)').format(
+        allocated=sizes['allocated'] // MiB, apparent=sizes['apparent'] // MiB,
+        percent=int(sizes['allocated'] * 100 / max(sizes['apparent'], 1)))
+
+
+def get_fragmentation(path):
+    """ Reads the extent map of a file with the FIEMAP ioctl to see how fragmented it is.
+        Extents that continue physically where the previous one ended count as a single fragment.
+        :param path: The path of the container file
+        :type path: str
+        :returns: size, number of extents and fragments, largest fragment in bytes, unwritten bytes,
+                  filesystem type and NOCOW attribute
+        :rtype: dict
+        :raises: OSError
+    """
+    batch = 512
+    fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+    try:
+        size = os.fstat(fd).st_size
+        flags = bytearray(8)
+        try:
+            fcntl.ioctl(fd, FS_IOC_GETFLAGS, flags)
+            nocow = bool(struct.unpack_from('=i', flags)[0] & FS_NOCOW_FL)
+        except OSError:
+            nocow = False
+        extents, fragments, largest, unwritten = 0, 0, 0, 0
+        fragment_length, physical_end, start, last = 0, None, 0, False
+        while not last and start < size:
+            request = bytearray(FIEMAP_HEADER.size + batch * FIEMAP_EXTENT.size)
+            FIEMAP_HEADER.pack_into(request, 0, start, size - start, FIEMAP_FLAG_SYNC if start == 0 else 0,
+                                    0, batch, 0)
+            fcntl.ioctl(fd, FS_IOC_FIEMAP, request)
+            mapped = FIEMAP_HEADER.unpack_from(request, 0)[3]
+            if mapped == 0:
+                break
+            for index in range(mapped):
+                logical, physical, length, extent_flags = FIEMAP_EXTENT.unpack_from(
+                    request, FIEMAP_HEADER.size + index * FIEMAP_EXTENT.size)
+                extents += 1
+                if extent_flags & FIEMAP_EXTENT_UNWRITTEN:
+                    unwritten += length
+                if physical != physical_end:
+                    fragments += 1
+                    fragment_length = 0
+                fragment_length += length
+                largest = max(largest, fragment_length)
+                physical_end = physical + length
+                start = logical + length
+                last = bool(extent_flags & FIEMAP_EXTENT_LAST)
+    finally:
+        os.close(fd)
+    return {'size': size, 'extents': extents, 'fragments': fragments, 'largest_fragment': largest,
+            'unwritten': unwritten, 'filesystem': get_filesystem_type(path), 'nocow': nocow}
+
+
+def fragmentation_report(paths):
+    """ Summary of the fragmentation of container files for display
+        :param paths: The paths of the container files
+        :type paths: list of str
+        :returns: One line per container file
+        :rtype: list of str
+    """
+    lines = []
+    for path in paths:
+        try:
+            fragmentation = get_fragmentation(path)
+        except OSError as ose:
+            lines.append('{path}: {error}'.format(path=path, error=ose.strerror or str(ose)))
+            continue
+        line = _('{path}: {size} MB on {filesystem}, {extents} extents in {fragments} fragments, '
+                 'largest fragment {largest} MB').format(
+            path=path, size=fragmentation['size'] // MiB, filesystem=fragmentation['filesystem'],
+            extents=fragmentation['extents'], fragments=fragmentation['fragments'],
+            largest=fragmentation['largest_fragment'] // MiB)
+        if fragmentation['filesystem'] in COW_FILESYSTEMS and not fragmentation['nocow']:
+            line += ', ' + _('copy-on-write enabled')
+        if (fragmentation['fragments'] > FRAGMENTED_MINIMUM
+                and fragmentation['size'] / fragmentation['fragments'] < FRAGMENTED_AVERAGE):
+            line += ' - ' + _('fragmented, consider copying the container to a new file')
+        lines.append(line)
+    return lines
+
+
+def get_device_io_hints(path):
+    """ Looks up the block device a path resides on in sysfs and returns its queue parameters.
+        Partitions get resolved to their parent device, since only those have a request queue.
+        :param path: A file or directory on the device in question, or the block device itself
+        :type path: str
+        :returns: rotational, optimal_io_size, max_io_size and logical_block_size in bytes
+                  or None if the path is not backed by a block device (tmpfs, nfs, btrfs multi-device ..)
+        :rtype: dict or None
+    """
+    path_stat = os.stat(path)
+    st_dev = path_stat.st_rdev if stat.S_ISBLK(path_stat.st_mode) else path_stat.st_dev
+    sys_dev = '/sys/dev/block/{major}:{minor}'.format(major=os.major(st_dev), minor=os.minor(st_dev))
+    if not os.path.exists(sys_dev):
+        return None
+    sys_dev = os.path.realpath(sys_dev)
+    if not os.path.exists(os.path.join(sys_dev, 'queue')):
+        sys_dev = os.path.dirname(sys_dev)  # partition -> parent device
+
+    def read_queue_value(name, default):
+        try:
+            with open(os.path.join(sys_dev, 'queue', name)) as queue_file:
+                return int(queue_file.read().strip())
+        except (IOError, ValueError):
+            return default
+
+    return {'rotational': bool(read_queue_value('rotational', 1)),
+            'optimal_io_size': read_queue_value('optimal_io_size', 0),
+            'max_io_size': read_queue_value('max_sectors_kb', 512) * 1024,
+            'logical_block_size': read_queue_value('logical_block_size', 512)}
+
+
+def get_fill_parameters(path):
+    """ Chooses number of writer threads and chunk size for the device a container gets written to:
+        Rotational disks get few threads to keep the head from seeking between regions,
+        flash based devices use one thread per core (up to 8) to keep their queues busy.
+        The chunk size is a multiple of the largest request the device accepts.
+        :param path: The directory of the container file to be created
+        :type path: str
+        :returns: number of threads and chunk size in bytes
+        :rtype: tuple(int, int)
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    hints = get_device_io_hints(path)
+
+    if hints is None:  # no block device -> defaults suitable for network or virtual filesystems
+        return min(cpus, 4), 4 * MiB
+    if hints['rotational']:
+        threads = min(cpus, 2)
+    else:
+        threads = min(cpus, 8)
+    request_size = max(hints['optimal_io_size'], hints['max_io_size'], MiB)
+    # round up to a power of two to stay aligned and clamp to 1-16 MiB
+    chunk_size = MiB
+    while chunk_size < request_size and chunk_size < 16 * MiB:
+        chunk_size *= 2
+    return threads, chunk_size
+
+
+class RateLimiter():
+
+    """ Token bucket shared by the writer threads to cap the bandwidth used for filling a container.
+        Writers reserve the bytes they are about to write and wait until the bucket allows it,
+        a burst of up to one second worth of data is allowed.
+    """
+
+    def __init__(self, rate):
+        """ :param rate: Maximum bytes per second
+            :type rate: int
+        """
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._tokens = 0
+        self._last = monotonic()
+
+    def reserve(self, nbytes):
+        """ Takes bytes from the bucket
+            :param nbytes: The number of bytes to be written
+            :type nbytes: int
+            :returns: Seconds to wait before writing them
+            :rtype: float
+        """
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate) - nbytes
+            self._last = now
+            return max(0.0, -self._tokens / self.rate)
+
+
+class FillEngine():
+
+    """ Fills a container file with random data. Several writer threads read from the kernels
+        random number generator into page aligned buffers and write disjoint chunks of the file with pwrite.
+        Both the reads from /dev/urandom and the writes release the GIL, so the threads run in parallel.
+        Chunks are handed out in ascending order, the engine keeps track of the offset
+        below which all chunks have been written completely.
+    """
+
+    def __init__(self, fd, size, threads, chunk_size, direct_io=False, start_offset=0, rate_limit=0):
+        """ :param fd: File descriptor of the container file opened for writing
+            :type fd: int
+            :param size: The size of the container in bytes
+            :type size: int
+            :param threads: Number of writer threads
+            :type threads: int
+            :param chunk_size: Size of a single write in bytes, has to be a multiple of 4KiB
+            :type chunk_size: int
+            :param direct_io: Bypass the page cache using O_DIRECT (falls back to buffered IO if unsupported)
+            :type direct_io: bool
+            :param start_offset: Offset in bytes to start writing from
+            :type start_offset: int
+            :param rate_limit: Maximum bytes per second written by all threads together, 0 for no limit
+            :type rate_limit: int
+        """
+        self.fd = fd
+        self.size = size
+        self.threads = max(1, threads)
+        self.chunk_size = chunk_size
+        self.start_offset = start_offset
+        self.direct_io = direct_io and self._enable_direct_io()
+        self.limiter = RateLimiter(rate_limit) if rate_limit > 0 else None
+
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._next_offset = start_offset
+        self._done_chunks = set()
+        self._bytes_written = 0
+        self._contiguous_offset = start_offset
+        self._error = None
+
+    def _enable_direct_io(self):
+        """ Switch the file descriptor to O_DIRECT if size and filesystem allow it
+            :returns: True if O_DIRECT is active
+            :rtype: bool
+        """
+        if self.size % DIRECT_IO_ALIGNMENT or self.start_offset % DIRECT_IO_ALIGNMENT:
+            return False
+        try:
+            fl = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+            fcntl.fcntl(self.fd, fcntl.F_SETFL, fl | os.O_DIRECT)
+            return True
+        except OSError:
+            return False  # eg tmpfs or some fuse filesystems
+
+    @property
+    def bytes_written(self):
+        """ Bytes written so far by this engine (not counting the start offset) """
+        with self._lock:
+            return self._bytes_written
+
+    @property
+    def contiguous_offset(self):
+        """ Offset below which the file has been completely filled with random data """
+        with self._lock:
+            return self._contiguous_offset
+
+    def run(self, progress_callback=None, interval=0.5, checkpoint_callback=None, checkpoint_interval=10):
+        """ Starts the writer threads and blocks until the file is filled.
+            :param progress_callback: Called every interval with bytes written and current bytes per second
+            :type progress_callback: function(int, float)
+            :param interval: Seconds between progress callbacks
+            :type interval: float
+            :param checkpoint_callback: Called every checkpoint_interval with the offset
+                                        up to which the written data has been synced to disk
+            :type checkpoint_callback: function(int)
+            :param checkpoint_interval: Seconds between checkpoints
+            :type checkpoint_interval: float
+            :raises: FillException
+        """
+        if self.start_offset >= self.size:
+            self._finished.set()
+        workers = [threading.Thread(target=self._writer, daemon=True) for __ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        try:
+            last_time, last_bytes = monotonic(), 0
+            last_checkpoint = last_time
+            while not self._finished.wait(interval):
+                now, written = monotonic(), self.bytes_written
+                if progress_callback is not None:
+                    progress_callback(written, (written - last_bytes) / max(now - last_time, 1e-6))
+                last_time, last_bytes = now, written
+                if checkpoint_callback is not None and now - last_checkpoint >= checkpoint_interval:
+                    self.checkpoint(checkpoint_callback)
+                    last_checkpoint = now
+        finally:
+            self._finished.set()  # also stops writer threads on KeyboardInterrupt
+            for worker in workers:
+                worker.join()
+        if self._error is not None:
+            raise FillException(self._error)
+        os.fsync(self.fd)
+
+    def checkpoint(self, checkpoint_callback):
+        """ Syncs the data written so far and passes the offset known to be on disk to the callback.
+            The offset is taken before syncing, chunks completed meanwhile will be part of the next checkpoint.
+            :param checkpoint_callback: Receives the durable offset
+            :type checkpoint_callback: function(int)
+        """
+        offset = self.contiguous_offset
+        os.fdatasync(self.fd)
+        checkpoint_callback(offset)
+
+    def _claim_chunk(self):
+        """ Hands out the next chunk to be written by a writer thread
+            :returns: offset and length of the chunk, length is 0 if nothing left to do
+            :rtype: tuple(int, int)
+        """
+        with self._lock:
+            offset = self._next_offset
+            length = min(self.chunk_size, self.size - offset)
+            self._next_offset += max(length, 0)
+            return offset, max(length, 0)
+
+    def _chunk_done(self, offset, length):
+        """ Book keeping after a chunk has been written, advances the contiguous offset """
+        with self._lock:
+            self._bytes_written += length
+            self._done_chunks.add(offset)
+            while self._contiguous_offset in self._done_chunks:
+                self._done_chunks.remove(self._contiguous_offset)
+                self._contiguous_offset = min(self._contiguous_offset + self.chunk_size, self.size)
+            if self._contiguous_offset >= self.size:
+                self._finished.set()
+
+    def _writer(self):
+        """ Writer thread: fills a page aligned buffer with random data and writes it to the claimed chunk """
+        buf = mmap.mmap(-1, self.chunk_size)  # anonymous mappings are page aligned as needed for O_DIRECT
+        try:
+            with open('/dev/urandom', 'rb', buffering=0) as urandom:
+                while not self._finished.is_set():
+                    offset, length = self._claim_chunk()
+                    if length == 0:
+                        return
+                    view = memoryview(buf)[:length]
+                    filled = 0
+                    while filled < length:  # reads from urandom may be short if interrupted
+                        filled += urandom.readinto(view[filled:])
+                    if self.limiter is not None and self._finished.wait(self.limiter.reserve(length)):
+                        return  # stopped while waiting for the bandwidth limit
+                    written = 0
+                    while written < length:
+                        written += os.pwrite(self.fd, view[written:], offset + written)
+                    view.release()
+                    self._chunk_done(offset, length)
+        except (IOError, OSError) as error:
+            with self._lock:
+                if self._error is None:
+                    self._error = str(error)
+            self._finished.set()
+        finally:
+            buf.close()
+
+
+class FillJournal():
+
+    """ Sidecar file next to a container under construction. Records the offset up to which the container
+        has durably been filled with random data, together with the parameters used to create it.
+        This allows an interrupted create to resume the fill instead of starting from byte 0.
+    """
+
+    def __init__(self, container_path, opener=os.open):
+        """ :param container_path: The path of the container file
+            :type container_path: str
+            :param opener: Used to open the journal file, eg to access it with the rights of the calling user
+            :type opener: function(path, flags, mode)
+        """
+        self.path = container_path + JOURNAL_SUFFIX
+        self.opener = opener
+
+    def read(self):
+        """ Returns the last checkpoint written to the journal
+            :returns: offset, size and create parameters or None if no valid journal exists
+            :rtype: dict or None
+        """
+        try:
+            with os.fdopen(self.opener(self.path, os.O_RDONLY | os.O_NOFOLLOW, 0o600)) as journal_file:
+                checkpoint = json.load(journal_file)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(checkpoint, dict) or checkpoint.get('version') != JOURNAL_VERSION:
+            return None
+        return checkpoint
+
+    def write(self, offset, **parameters):
+        """ Atomically replaces the journal: the new checkpoint gets written
+            to a temporary file that is synced to disk and renamed afterwards
+            :param offset: The offset up to which the container has durably been filled
+            :type offset: int
+            :param parameters: The parameters used to create the container (size, filesystem ..)
+            :type parameters: dict
+        """
+        tmp_path = self.path + '.tmp'
+        fd = self.opener(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0o600)
+        with os.fdopen(fd, 'w') as journal_file:
+            json.dump(dict(parameters, offset=offset, version=JOURNAL_VERSION), journal_file)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        os.rename(tmp_path, self.path)
+
+    def remove(self):
+        """ Deletes the journal after the container has been created successfully """
+        for path in (self.path, self.path + '.tmp'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def parse_size(size):
+    """ Converts a human readable size to bytes
+        :param size: Size with an optional unit suffix K/M/G/T (binary units) eg '10G' or an int
+        :type size: str or int
+        :returns: The size in bytes
+        :rtype: int
+        :raises: ValueError
+    """
+    if isinstance(size, int):
+        return size
+    match = re.match(r'^\s*(\d+)\s*([KMGT]?)i?B?\s*$', str(size).upper())
+    if match is None:
+        raise ValueError('Invalid size: {size}'.format(size=size))
+    return int(match.group(1)) * SIZE_UNITS[match.group(2)]
+
+
+def get_config_dir():
+    """ :returns: The per-user configuration directory of luckyLUKS (XDG_CONFIG_HOME)
+        :rtype: str
+    """
+    return os.path.join(os.getenv('XDG_CONFIG_HOME') or os.path.expanduser('~/.config'), 'luckyLUKS')
+
+
+def load_config(name):
+    """ Reads a json file from the configuration directory of the current user
+        :param name: The file name eg timings.json
+        :type name: str
+        :returns: The stored values or an empty dict if the file does not exist or cannot be parsed
+        :rtype: dict
+    """
+    try:
+        with open(os.path.join(get_config_dir(), name)) as config_file:
+            config = json.load(config_file)
+    except (IOError, ValueError):
+        return {}
+    return config if isinstance(config, dict) else {}
+
+
+def save_config(name, config):
+    """ Writes a json file to the configuration directory of the current user,
+        replacing the previous version atomically
+        :param name: The file name eg timings.json
+        :type name: str
+        :param config: The values to store
+        :type config: dict
+        :raises: IOError
+    """
+    config_dir = get_config_dir()
+    os.makedirs(config_dir, exist_ok=True)
+    tmp_path = os.path.join(config_dir, '.' + name + '.tmp')
+    with open(tmp_path, 'w') as config_file:
+        json.dump(config, config_file, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(config_dir, name))
+
+
+def get_container_settings(container_path):
+    """ Settings remembered for a container file, eg the dm-crypt options used when unlocking
+        :param container_path: The path of the container file
+        :type container_path: str
+        :returns: The stored settings or an empty dict
+        :rtype: dict
+    """
+    return load_config('containers.json').get(os.path.realpath(container_path), {})
+
+
+def set_container_settings(container_path, **settings):
+    """ Remembers settings for a container file in ~/.config/luckyLUKS/containers.json
+        :param container_path: The path of the container file
+        :type container_path: str
+        :param settings: The values to store, merged with those already stored
+        :type settings: dict
+        :raises: IOError
+    """
+    containers = load_config('containers.json')
+    containers.setdefault(os.path.realpath(container_path), {}).update(settings)
+    save_config('containers.json', containers)
+
+
+def read_luks_uuid(container_path):
+    """ :param container_path: The path of the container file
+        :type container_path: str
+        :returns: The UUID or None if not a LUKS container
+        :rtype: str or None
+    """
+    try:
+        header = read_header(container_path)
+    except (IOError, LuksHeaderException):
+        return None
+    if header is None:
+        return None
+    return header['uuid'] or None
+
+
+def get_keyslot_method(key_file=None):
+    """ Passphrases and each key file usually live in different keyslots
+        :param key_file: The path of the key file used to unlock, None for a passphrase
+        :type key_file: str or None
+        :rtype: str
+    """
+    return 'passphrase' if key_file is None else 'key_file:' + os.path.realpath(key_file)
+
+
+def get_keyslot_hint(container_path, key_file=None):
+    """ Looks up the keyslot that unlocked a LUKS container the last time with the same passphrase or key file
+        :param container_path: The path of the container file
+        :type container_path: str
+        :param key_file: The path of the key file used to unlock, None for a passphrase
+        :type key_file: str or None
+        :returns: The keyslot or None if unknown
+        :rtype: int or None
+    """
+    uuid = read_luks_uuid(container_path)
+    if uuid is None:
+        return None
+    return load_config('keyslots.json').get(uuid, {}).get(get_keyslot_method(key_file), {}).get('keyslot')
+
+
+def remember_keyslot(container_path, key_file, keyslot, saved=0):
+    """ Stores the keyslot that unlocked a container in ~/.config/luckyLUKS/keyslots.json per container UUID,
+        together with the number of unlocks and the summed up time saved by trying this keyslot first
+        :param container_path: The path of the container file
+        :type container_path: str
+        :param key_file: The path of the key file used to unlock, None for a passphrase
+        :type key_file: str or None
+        :param keyslot: The keyslot reported by the worker
+        :type keyslot: int
+        :param saved: Seconds saved on this unlock by trying the keyslot first
+        :type saved: float
+        :raises: IOError
+    """
+    uuid = read_luks_uuid(container_path)
+    if uuid is None:
+        return
+    hints = load_config('keyslots.json')
+    hint = hints.setdefault(uuid, {}).setdefault(get_keyslot_method(key_file), {})
+    hint.update(keyslot=keyslot, unlocks=hint.get('unlocks', 0) + 1, saved=hint.get('saved', 0) + saved)
+    save_config('keyslots.json', hints)
+
+
+class ContainerPool():
+
+    """ A per-user directory of container files that have been filled with random data in advance.
+        Creating a container claims a complete pool file of the requested size by renaming it,
+        so only luksFormat and mkfs are left to do. Pool files currently being filled carry the suffix `.filling`
+        and a journal just like any other container under construction, they get resumed on the next refill.
+        Only after the last checkpoint they get renamed, a pool file is never considered filled by its size alone.
+
+        The pool gets configured in ~/.config/luckyLUKS/pool.json, eg:
+        {"sizes": {"10G": 2, "500M": 1}, "quota": "50G", "directory": "~/.local/share/luckyLUKS/pool"}
+        -> keep two 10GB and one 500MB container files, using at most 50GB of disk space.
+        The directory is optional, pool files can only be claimed for containers on the same filesystem.
+        An optional "rate_limit" eg "20M" caps the bytes per second written while refilling.
+    """
+
+    def __init__(self, directory, sizes=None, quota=0, rate_limit=0):
+        """ :param directory: The pool directory
+            :type directory: str
+            :param sizes: Number of pool files to keep per container size in bytes
+            :type sizes: dict(int, int)
+            :param quota: Maximum disk space used by the pool in bytes
+            :type quota: int
+            :param rate_limit: Maximum bytes per second written while filling, 0 for no limit
+            :type rate_limit: int
+        """
+        self.directory = directory
+        self.sizes = sizes if sizes is not None else {}
+        self.quota = quota
+        self.rate_limit = rate_limit
+
+    @classmethod
+    def from_config(cls):
+        """ Reads the pool configuration of the current user
+            :returns: The configured pool or None if the pool is not enabled
+            :rtype: :class:`ContainerPool` or None
+            :raises: ValueError
+        """
+        try:
+            with open(os.path.join(get_config_dir(), 'pool.json')) as config_file:
+                config = json.load(config_file)
+        except IOError:
+            return None
+        directory = os.path.expanduser(config.get('directory', '~/.local/share/luckyLUKS/pool'))
+        sizes = {parse_size(size): int(count) for size, count in config.get('sizes', {}).items()}
+        return cls(directory, sizes, parse_size(config.get('quota', 0)), parse_size(config.get('rate_limit', 0)))
+
+    def to_command(self):
+        """ :returns: The pool parameters to be sent to the worker process
+            :rtype: dict
+        """
+        return {'pool_dir': self.directory,
+                'pool_sizes': [[size, count] for size, count in sorted(self.sizes.items())],
+                'pool_quota': self.quota,
+                'pool_rate_limit': self.rate_limit}
+
+    def entries(self):
+        """ Lists the container files in the pool
+            :returns: path, size, bytes filled, allocated bytes and completeness of each pool file
+            :rtype: list of dicts
+        """
+        entries = []
+        try:
+            filenames = sorted(os.listdir(self.directory))
+        except OSError:
+            return entries
+        for filename in filenames:
+            match = POOL_FILE_PATTERN.match(filename) or POOL_FILLING_PATTERN.match(filename)
+            path = os.path.join(self.directory, filename)
+            if match is None or os.path.islink(path) or not os.path.isfile(path):
+                continue
+            size = int(match.group(1))
+            has_journal = os.path.exists(path + JOURNAL_SUFFIX)
+            # a journal next to a renamed pool file is left over from an unfinished fill of an earlier version
+            complete = (not filename.endswith(POOL_FILLING_SUFFIX) and not has_journal
+                        and os.path.getsize(path) == size)
+            checkpoint = FillJournal(path).read() if has_journal else None
+            if complete:
+                filled = size
+            else:
+                filled = min(int(checkpoint.get('offset', 0)), size) if checkpoint is not None else 0
+            entries.append({'path': path,
+                            'size': size,
+                            'filled': filled,
+                            'allocated': os.stat(path).st_blocks * 512,
+                            'complete': complete})
+        return entries
+
+    def usage(self):
+        """ :returns: Disk space used by the pool in bytes
+            :rtype: int
+        """
+        return sum(entry['allocated'] for entry in self.entries())
+
+    def find_complete(self, size, st_dev=None):
+        """ Looks for a completely filled pool file to be claimed by a new container
+            :param size: The requested container size in bytes
+            :type size: int
+            :param st_dev: Only return pool files on this device (rename is not possible across filesystems)
+            :type st_dev: int or None
+            :returns: The path of a pool file or None
+            :rtype: str or None
+        """
+        for entry in self.entries():
+            if entry['complete'] and entry['size'] == size and \
+                    (st_dev is None or os.stat(entry['path']).st_dev == st_dev):
+                return entry['path']
+        return None
+
+    def new_path(self, size):
+        """ :returns: A new, unique path to fill a pool file of the given size under, see completed_path()
+            :rtype: str
+        """
+        return os.path.join(self.directory, 'pool-{size}-{uid}.bin{suffix}'.format(
+            size=size, uid=uuid4().hex, suffix=POOL_FILLING_SUFFIX))
+
+    @staticmethod
+    def completed_path(path):
+        """ :param path: The path a pool file gets filled under
+            :type path: str
+            :returns: The path of the pool file once it is completely filled
+            :rtype: str
+        """
+        return path[:-len(POOL_FILLING_SUFFIX)] if path.endswith(POOL_FILLING_SUFFIX) else path
+
+    def missing(self):
+        """ Determines which pool files have to be filled, unfinished ones first
+            :returns: path and size of pool files to be filled, unfinished ones of earlier versions
+                      don't carry the `.filling` suffix yet
+            :rtype: list of tuple(str, int)
+        """
+        entries = self.entries()
+        todo = [(entry['path'], entry['size']) for entry in entries if not entry['complete']]
+        for size, count in sorted(self.sizes.items()):
+            existing = len([entry for entry in entries if entry['size'] == size])
+            todo += [(self.new_path(size), size) for __ in range(count - existing)]
+        return todo
+
+    def report(self):
+        """ Summary of the pool content for display
+            :returns: One line per pool file followed by the total usage
+            :rtype: list of str
+        """
+        lines = []
+        for entry in self.entries():
+            if entry['complete']:
+                state = _('ready')
+            else:
+                state = _('filling {percent}%').format(percent=int(entry['filled'] / max(entry['size'], 1) * 100))
+            lines.append('{name}  {size} MB  {state}'.format(
+                name=os.path.basename(entry['path']), size=entry['size'] // MiB, state=state))
+        lines.append(_('{used} MB used of {quota} MB quota in {directory}').format(
+            used=self.usage() // MiB, quota=self.quota // MiB, directory=self.directory))
+        return lines
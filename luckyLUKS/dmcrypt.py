@@ -0,0 +1,255 @@
+"""
+dm-crypt performance settings: flags of unlocked containers - bypassing the kernel workqueues lowers
+the latency on fast SSD and NVMe drives, passing discards through lets the drive know about
+freed blocks. LUKS2 containers store the flags in their header, for other containers
+they get passed on every unlock. And the encryption sector size of new LUKS2 containers:
+4096 byte sectors need an eighth of the crypto operations of 512 byte sectors for every page.
+
+luckyLUKS Copyright (c) 2014,2015,2022 Jasper van Hoorn (muzius@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details. <http://www.gnu.org/licenses/>
+"""
+
+import os
+import mmap
+import random
+from time import monotonic
+
+# flag name: cryptsetup option, name in `cryptsetup status`, name in the LUKS2 header
+PERF_FLAGS = {
+    'no_read_workqueue': ('--perf-no_read_workqueue', 'no_read_workqueue', 'no-read-workqueue'),
+    'no_write_workqueue': ('--perf-no_write_workqueue', 'no_write_workqueue', 'no-write-workqueue'),
+    'same_cpu_crypt': ('--perf-same_cpu_crypt', 'same_cpu_crypt', 'same-cpu-crypt'),
+    'submit_from_crypt_cpus': ('--perf-submit_from_crypt_cpus', 'submit_from_crypt_cpus', 'submit-from-crypt-cpus'),
+    'allow_discards': ('--allow-discards', 'discards', 'allow-discards'),
+}
+# display order
+PERF_FLAG_NAMES = ['no_read_workqueue', 'no_write_workqueue', 'same_cpu_crypt', 'submit_from_crypt_cpus',
+                   'allow_discards']
+# compared by the latency benchmark
+WORKQUEUE_FLAGS = ['no_read_workqueue', 'no_write_workqueue']
+LATENCY_SAMPLES = 256
+LATENCY_BLOCK = 4096
+# encryption sector sizes offered for new LUKS2 containers
+SECTOR_SIZES = (512, 4096)
+LARGE_SECTOR_SIZE = 4096
+THROUGHPUT_BLOCK = 4 * 1024 * 1024
+
+
+def get_flag_descriptions():
+    """ :returns: Short description of each flag for the UI
+        :rtype: dict
+    """
+    return {'no_read_workqueue': _('Decrypt reads right away instead of queueing them (lower latency on SSD/NVMe)'),
+            'no_write_workqueue': _('Encrypt writes right away instead of queueing them (lower latency on SSD/NVMe)'),
+            'same_cpu_crypt': _('Encrypt on the CPU that issued the write'),
+            'submit_from_crypt_cpus': _('Submit writes from the encryption threads'),
+            'allow_discards': _('Pass TRIM/discard to the drive: frees space on SSDs and sparse files, '
+                                'but reveals which blocks are unused')}
+
+
+def validate_flags(flags):
+    """ :param flags: Flag names
+        :type flags: list of str
+        :returns: The flags in display order without duplicates
+        :rtype: list of str
+        :raises: ValueError
+    """
+    for flag in flags:
+        if flag not in PERF_FLAGS:
+            raise ValueError(_('Unknown dm-crypt option: {flag}').format(flag=str(flag)))
+    return [flag for flag in PERF_FLAG_NAMES if flag in flags]
+
+
+def cryptsetup_options(flags):
+    """ :param flags: Validated flag names
+        :type flags: list of str
+        :returns: Options for cryptsetup open/refresh
+        :rtype: list of str
+    """
+    return [PERF_FLAGS[flag][0] for flag in flags]
+
+
+def parse_active_flags(status_output):
+    """ Reads the flags of an unlocked container from `cryptsetup status`
+        :param status_output: Output of cryptsetup status
+        :type status_output: str
+        :rtype: list of str
+    """
+    for line in status_output.splitlines():
+        key, __, value = line.strip().partition(':')
+        if key == 'flags':
+            names = value.split()
+            return [flag for flag in PERF_FLAG_NAMES if PERF_FLAGS[flag][1] in names]
+    return []
+
+
+def choose_sector_size(directory, size):
+    """ 4096 byte sectors get used if the filesystem of the container file works with blocks of at least that size,
+        a smaller block size hints at a filesystem or device that might not handle 4K writes atomically
+        :param directory: The directory of the container file
+        :type directory: str
+        :param size: The container size in bytes, the data area has to be a multiple of the sector size
+        :type size: int
+        :returns: The encryption sector size in bytes
+        :rtype: int
+    """
+    if size % LARGE_SECTOR_SIZE:
+        return 512
+    try:
+        block_size = os.statvfs(directory).f_bsize
+    except OSError:
+        return 512
+    return LARGE_SECTOR_SIZE if block_size >= LARGE_SECTOR_SIZE else 512
+
+
+def measure_throughput(device):
+    """ Sequential O_DIRECT write and read of a whole unlocked container, overwrites its data
+        :param device: The device mapper device of a scratch container
+        :type device: str
+        :returns: write and read in bytes per second
+        :rtype: dict
+        :raises: OSError
+    """
+    fd = os.open(device, os.O_RDONLY)
+    try:
+        size = os.lseek(fd, 0, os.SEEK_END)
+    finally:
+        os.close(fd)
+    buf = mmap.mmap(-1, THROUGHPUT_BLOCK)
+    buf.write(os.urandom(THROUGHPUT_BLOCK))
+    rates = {}
+    try:
+        for mode, flags in (('write', os.O_WRONLY | os.O_DIRECT), ('read', os.O_RDONLY | os.O_DIRECT)):
+            fd = os.open(device, flags)
+            try:
+                start = monotonic()
+                for offset in range(0, size - THROUGHPUT_BLOCK + 1, THROUGHPUT_BLOCK):
+                    os.lseek(fd, offset, os.SEEK_SET)
+                    if mode == 'write':
+                        os.write(fd, buf)
+                    else:
+                        os.readv(fd, [buf])
+                if mode == 'write':
+                    os.fsync(fd)
+                rates[mode] = size // THROUGHPUT_BLOCK * THROUGHPUT_BLOCK / max(monotonic() - start, 1e-6)
+            finally:
+                os.close(fd)
+    finally:
+        buf.close()
+    return rates
+
+
+def measure_read_throughput(device, size):
+    """ Sequential O_DIRECT read from the start of an unlocked container, the data only gets read
+        :param device: The device mapper device
+        :type device: str
+        :param size: Bytes to read at most
+        :type size: int
+        :returns: bytes per second
+        :rtype: float
+        :raises: OSError
+    """
+    fd = os.open(device, os.O_RDONLY | os.O_DIRECT)
+    buf = mmap.mmap(-1, THROUGHPUT_BLOCK)
+    try:
+        size = min(size, os.lseek(fd, 0, os.SEEK_END)) // THROUGHPUT_BLOCK * THROUGHPUT_BLOCK
+        os.lseek(fd, 0, os.SEEK_SET)
+        start = monotonic()
+        for __ in range(size // THROUGHPUT_BLOCK):
+            os.readv(fd, [buf])
+        return size / max(monotonic() - start, 1e-6)
+    finally:
+        os.close(fd)
+        buf.close()
+
+
+def measure_read_latency(device, samples=LATENCY_SAMPLES):
+    """ Random 4K reads with O_DIRECT from an unlocked container, the data only gets read
+        :param device: The device mapper device
+        :type device: str
+        :param samples: Number of reads
+        :type samples: int
+        :returns: median and 99th percentile latency in seconds
+        :rtype: dict
+        :raises: OSError
+    """
+    fd = os.open(device, os.O_RDONLY | os.O_DIRECT)
+    buf = mmap.mmap(-1, LATENCY_BLOCK)  # page aligned
+    try:
+        blocks = os.lseek(fd, 0, os.SEEK_END) // LATENCY_BLOCK
+        latencies = []
+        for __ in range(samples):
+            offset = random.randrange(blocks) * LATENCY_BLOCK
+            start = monotonic()
+            os.lseek(fd, offset, os.SEEK_SET)
+            os.readv(fd, [buf])
+            latencies.append(monotonic() - start)
+    finally:
+        os.close(fd)
+        buf.close()
+    return summarize_latencies(latencies)
+
+
+def measure_write_latency(directory, samples=LATENCY_SAMPLES):
+    """ Synchronous 4K writes with O_DIRECT to a temporary file on the mounted container
+        :param directory: The mount point of the container
+        :type directory: str
+        :param samples: Number of writes
+        :type samples: int
+        :returns: median and 99th percentile latency in seconds
+        :rtype: dict
+        :raises: OSError
+    """
+    path = os.path.join(directory, '.luckyluks-latency-{pid}'.format(pid=os.getpid()))
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_DIRECT | os.O_DSYNC, 0o600)
+    buf = mmap.mmap(-1, LATENCY_BLOCK)
+    buf.write(os.urandom(LATENCY_BLOCK))
+    try:
+        latencies = []
+        for sample in range(samples):
+            start = monotonic()
+            os.pwrite(fd, buf, (sample % 64) * LATENCY_BLOCK)
+            latencies.append(monotonic() - start)
+    finally:
+        os.close(fd)
+        os.unlink(path)
+        buf.close()
+    return summarize_latencies(latencies)
+
+
+def find_mount_point(device):
+    """ Looks up where an unlocked container is mounted
+        :param device: The device mapper device
+        :type device: str
+        :returns: The mount point or None if not mounted
+        :rtype: str or None
+    """
+    rdev = os.stat(device).st_rdev
+    device_number = '{major}:{minor}'.format(major=os.major(rdev), minor=os.minor(rdev))
+    with open('/proc/self/mountinfo') as mountinfo:
+        for line in mountinfo:
+            # mount id, parent id, major:minor, root, mount point, ..
+            fields = line.split()
+            if fields[2] == device_number and fields[3] == '/':
+                return fields[4].replace('\\040', ' ')
+    return None
+
+
+def summarize_latencies(latencies):
+    """ :param latencies: Measured latencies in seconds
+        :type latencies: list of float
+        :returns: median and 99th percentile
+        :rtype: dict
+    """
+    latencies = sorted(latencies)
+    return {'median': latencies[len(latencies) // 2],
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]}
@@ -0,0 +1,390 @@
+"""
+Filesystem profiles for new containers: the mkfs command line tuned for a filesystem inside
+an encrypted container and the mount options to be used with it. Mount profiles add performance
+options per container on top of those, eg lazytime, the commit interval, discard or compression.
+
+luckyLUKS Copyright (c) 2014,2015,2022 Jasper van Hoorn (muzius@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details. <http://www.gnu.org/licenses/>
+"""
+
+import os
+from collections import OrderedDict
+from time import monotonic
+
+MiB = 1024 * 1024
+# the root directory of a new filesystem belongs to the user and is not accessible by others
+ROOT_MODE = 0o700
+# always added last, so no other option can turn them off
+SECURITY_MOUNT_OPTIONS = ['nosuid', 'nodev']
+# mount options that would undo the security options
+FORBIDDEN_MOUNT_OPTIONS = ('suid', 'dev', 'defaults')
+# read-only devices cannot replay a journal: without these, mounting fails after an unclean close
+READ_ONLY_MOUNT_OPTIONS = {'ext4': ['noload'], 'ext3': ['noload'], 'xfs': ['norecovery']}
+# small files created, read, renamed and deleted by the metadata benchmark
+METADATA_FILES = 2000
+METADATA_FILE_SIZE = 4096
+
+
+class FilesystemProfile():
+
+    """ A named way to create a filesystem inside a container:
+        mkfs executable and options, mount options, label restrictions and minimum size.
+        Options that depend on the container (label, block/stripe alignment, size) get added by mkfs_command().
+    """
+
+    def __init__(self, name, filesystem, mkfs_options, mount_options, description,
+                 max_label=16, min_size=0, supports_permissions=True):
+        """ :param name: Identifies the profile in the UI, in manifests and create commands
+            :type name: str
+            :param filesystem: The filesystem type as reported by blkid, selects mkfs.<filesystem>
+            :type filesystem: str
+            :param mkfs_options: Static options passed to mkfs
+            :type mkfs_options: list of str
+            :param mount_options: Mount options added to `nosuid,nodev`
+            :type mount_options: list of str
+            :param description: Short description shown in the UI
+            :type description: str
+            :param max_label: Maximum length of the filesystem label in bytes
+            :type max_label: int
+            :param min_size: Minimum container size in bytes
+            :type min_size: int
+            :param supports_permissions: Filesystem stores unix ownership and permissions
+            :type supports_permissions: bool
+        """
+        self.name = name
+        self.filesystem = filesystem
+        self.mkfs = 'mkfs.' + filesystem
+        self.mkfs_options = mkfs_options
+        self.mount_options = mount_options
+        self.description = description
+        self.max_label = max_label
+        self.min_size = min_size
+        self.supports_permissions = supports_permissions
+
+    def label(self, device_name):
+        """ Shortens the device name to the maximum label length without breaking utf-8 characters
+            :param device_name: The device mapper name used as label
+            :type device_name: str
+            :rtype: str
+        """
+        return device_name.encode('utf-8')[:self.max_label].decode('utf-8', 'ignore')
+
+    def mkfs_command(self, device, device_name, size, sector_size=512, io_size=0, root_owner=None, protofile=None):
+        """ Builds the mkfs command line for a container
+            :param device: The unlocked device mapper device
+            :type device: str
+            :param device_name: The device mapper name used as label
+            :type device_name: str
+            :param size: The container size in bytes
+            :type size: int
+            :param sector_size: The encryption sector size of the container in bytes
+            :type sector_size: int
+            :param io_size: The optimal I/O size reported for the device in bytes, 0 if unknown
+            :type io_size: int
+            :param root_owner: uid and gid of the filesystem root for ext2/ext4, see root_mode_command()
+            :type root_owner: tuple(int, int) or None
+            :param protofile: Path of an xfs prototype file setting owner and mode of the root, see xfs_protofile()
+            :type protofile: str or None
+            :returns: The command to be executed
+            :rtype: list of str
+        """
+        cmd = [self.mkfs, '-L', self.label(device_name)] + self.mkfs_options
+        if self.filesystem in ('ext4', 'ext2'):
+            extended = []
+            if io_size > 4096:
+                # stride and stripe width in filesystem blocks, only if the device asks for larger requests
+                stride = io_size // 4096
+                extended += ['stride={stride}'.format(stride=stride), 'stripe_width={stride}'.format(stride=stride)]
+            if self.filesystem == 'ext4':
+                # inode tables (and journal) get initialized by the kernel in the background after mounting
+                extended.append('lazy_itable_init=1')
+                if '^has_journal' not in self.mkfs_options:
+                    extended.append('lazy_journal_init=1')
+            if root_owner is not None:
+                extended.append('root_owner={uid}:{gid}'.format(uid=root_owner[0], gid=root_owner[1]))
+            cmd += ['-b', '4096']
+            if extended:
+                cmd += ['-E', ','.join(extended)]
+        elif self.filesystem == 'xfs':
+            cmd += ['-s', 'size={size}'.format(size=sector_size)]
+            if io_size > sector_size:
+                cmd += ['-d', 'su={io_size},sw=1'.format(io_size=io_size)]
+            if protofile is not None:
+                cmd += ['-p', protofile]
+        elif self.filesystem == 'btrfs' and size < 1024 * MiB:
+            cmd += ['--mixed']  # recommended for small filesystems, data and metadata share block groups
+        return cmd + [device]
+
+    def matches_features(self, features):
+        """ Tells apart profiles of the same filesystem type by the features of an existing filesystem
+            :param features: ext2/ext4 features as listed by `dumpe2fs -h`, None if unknown
+            :type features: list of str or None
+            :returns: True if the filesystem could have been created with this profile
+            :rtype: bool
+        """
+        if features is None or self.filesystem not in ('ext4', 'ext2'):
+            return True
+        has_journal = self.filesystem == 'ext4' and '^has_journal' not in self.mkfs_options
+        return has_journal == ('has_journal' in features)
+
+    def can_set_root_owner(self):
+        """ :returns: True if owner and mode of the filesystem root can be set without mounting it
+            :rtype: bool
+        """
+        return self.filesystem in ('ext4', 'ext2', 'xfs')
+
+    def root_mode_command(self, device):
+        """ mke2fs sets only the owner of the root directory, the mode gets changed afterwards with debugfs
+            :param device: The device with the new filesystem
+            :type device: str
+            :returns: The command to be executed after mkfs or None if not needed
+            :rtype: list of str or None
+        """
+        if self.filesystem in ('ext4', 'ext2'):
+            return ['debugfs', '-w', '-R', 'sif / mode 0{mode:o}'.format(mode=0o040000 | ROOT_MODE), device]
+        return None
+
+    def get_mount_options(self):
+        """ :returns: The mount options of this profile, nosuid and nodev are always enforced
+            :rtype: str
+        """
+        return ','.join(SECURITY_MOUNT_OPTIONS + self.mount_options)
+
+
+FILESYSTEM_PROFILES = [
+    FilesystemProfile('ext4', 'ext4', ['-O', '^has_journal', '-m', '0', '-q'], ['noatime'],
+                      _('ext4 without journal, fastest for containers that get closed cleanly')),
+    FilesystemProfile('ext4-journal', 'ext4', ['-m', '0', '-q'], ['noatime', 'commit=30'],
+                      _('ext4 with journal, survives crashes while unlocked')),
+    FilesystemProfile('ext2', 'ext2', ['-m', '0', '-q'], ['noatime'],
+                      _('ext2 for old systems')),
+    FilesystemProfile('xfs', 'xfs', ['-q'], ['noatime'],
+                      _('xfs, good for large files and large containers'),
+                      max_label=12, min_size=300 * MiB),
+    FilesystemProfile('btrfs-zstd', 'btrfs', ['-q'], ['noatime', 'compress=zstd'],
+                      _('btrfs with transparent compression and checksums'),
+                      max_label=255, min_size=128 * MiB),
+    FilesystemProfile('ntfs', 'ntfs', ['-Q', '-q'], [],
+                      _('ntfs to access the container from Windows as well'),
+                      max_label=128, supports_permissions=False),
+    FilesystemProfile('exfat', 'exfat', [], [],
+                      _('exFAT to access the container from Windows and Mac OSX as well'),
+                      max_label=11, supports_permissions=False),
+]
+
+
+class MountProfile():
+
+    """ A named set of mount options chosen per container, added to the options of the filesystem profile.
+        Options not supported by a filesystem are left out for it.
+    """
+
+    def __init__(self, name, options, description, trim_on_close=False):
+        """ :param name: Identifies the profile in the UI, on the command line and in the settings
+            :type name: str
+            :param options: Mount options per filesystem type, `*` for all filesystems not listed
+            :type options: dict
+            :param description: Short description shown in the UI
+            :type description: str
+            :param trim_on_close: Tell the drive about all freed blocks at once when closing the container
+                                  (batched trim with fstrim) instead of on every delete
+            :type trim_on_close: bool
+        """
+        self.name = name
+        self.options = options
+        self.description = description
+        self.trim_on_close = trim_on_close
+
+    def get_options(self, filesystem):
+        """ :param filesystem: The filesystem type as reported by blkid
+            :type filesystem: str or None
+            :returns: The mount options of this profile for the filesystem
+            :rtype: list of str
+        """
+        return list(self.options.get(filesystem, self.options.get('*', [])))
+
+
+MOUNT_PROFILES = [
+    MountProfile('default', {},
+                 _('The options of the filesystem, eg noatime')),
+    MountProfile('lazytime', {'ext4': ['lazytime', 'commit=60'], 'btrfs': ['lazytime', 'commit=60'],
+                              'xfs': ['lazytime'], 'ext2': ['lazytime']},
+                 _('Fewer small writes: timestamps stay in memory and changes get written every minute, '
+                   'more data is lost on a crash')),
+    MountProfile('durable', {'ext4': ['commit=5'], 'btrfs': ['commit=5']},
+                 _('Changes get written every 5 seconds, less data is lost on a crash')),
+    MountProfile('discard', {'ext4': ['discard'], 'xfs': ['discard'], 'btrfs': ['discard=async']},
+                 _('Free deleted blocks on the drive right away (needs the allow_discards dm-crypt option)')),
+    MountProfile('trim', {},
+                 _('Free deleted blocks on the drive in one go when closing (needs the allow_discards dm-crypt '
+                   'option), faster than discard on every delete'), trim_on_close=True),
+    MountProfile('compress', {'btrfs': ['compress=zstd:3']},
+                 _('Stronger btrfs compression: less space and fewer writes for more cpu time')),
+]
+DEFAULT_MOUNT_PROFILE = 'default'
+# options of the profiles at their defaults: remounting keeps options of the previous profile otherwise
+REMOUNT_DEFAULTS = {
+    'ext4': ['nolazytime', 'nodiscard', 'commit=5'],
+    'ext2': ['nolazytime'],
+    'xfs': ['nolazytime', 'nodiscard'],
+    'btrfs': ['nolazytime', 'nodiscard', 'commit=30', 'compress=no'],
+}
+
+
+def get_mount_profile(name):
+    """ Looks up a mount profile by name
+        :param name: The name of the profile, None for the default
+        :type name: str or None
+        :returns: The profile or None if there is no profile with this name
+        :rtype: :class:`MountProfile` or None
+    """
+    for profile in MOUNT_PROFILES:
+        if profile.name == (name or DEFAULT_MOUNT_PROFILE):
+            return profile
+    return None
+
+
+def build_mount_options(filesystem, mount_profile=None, read_only=False, remount=False, features=None):
+    """ Combines the options of the filesystem profile with those of a mount profile,
+        options of the mount profile replace those with the same name (eg commit=30)
+        :param filesystem: The filesystem type as reported by blkid
+        :type filesystem: str or None
+        :param mount_profile: The name of the mount profile, None for the default
+        :type mount_profile: str or None
+        :param read_only: Mount read-only, skipping journal/log recovery
+        :type read_only: bool
+        :param remount: Reset the options of all mount profiles first, for mount -o remount
+        :type remount: bool
+        :param features: ext2/ext4 features of the filesystem to choose its profile, see get_profile_for_filesystem()
+        :type features: list of str or None
+        :returns: The mount options, ending with `nosuid,nodev`
+        :rtype: str
+        :raises: ValueError
+    """
+    profile = get_mount_profile(mount_profile)
+    if profile is None:
+        raise ValueError(_('Unknown mount profile: {profile}').format(profile=str(mount_profile)))
+    filesystem_profile = get_profile_for_filesystem(filesystem, features)
+    options = REMOUNT_DEFAULTS.get(filesystem, []) if remount else []
+    options = options + (filesystem_profile.mount_options if filesystem_profile is not None else [])
+    options = options + profile.get_options(filesystem)
+    if read_only:
+        options = options + ['ro'] + READ_ONLY_MOUNT_OPTIONS.get(filesystem, [])
+    merged = OrderedDict()
+    for option in options:
+        if option.split('=')[0] in FORBIDDEN_MOUNT_OPTIONS:
+            raise ValueError(_('Mount option not allowed: {option}').format(option=option))
+        name = option.split('=')[0]
+        # noatime and atime, nodiscard and discard=async: the last one wins
+        merged[name[2:] if name.startswith('no') else name] = option
+    return ','.join(list(merged.values()) + SECURITY_MOUNT_OPTIONS)
+
+
+def measure_metadata(directory, files=METADATA_FILES):
+    """ Metadata-heavy workload in a temporary directory on a mounted container: create and write,
+        read, stat, rename and delete many small files, each step synced to the drive
+        :param directory: The mount point of the container
+        :type directory: str
+        :param files: Number of files
+        :type files: int
+        :returns: Seconds per step (create, read, stat, rename, delete)
+        :rtype: list of (str, float)
+        :raises: OSError
+    """
+    work_dir = os.path.join(directory, '.luckyluks-metadata-{pid}'.format(pid=os.getpid()))
+    os.mkdir(work_dir, 0o700)
+    data = os.urandom(METADATA_FILE_SIZE)
+    names = [os.path.join(work_dir, str(number)) for number in range(files)]
+    timings = []
+    try:
+        steps = [('create', lambda name: write_file(name, data)),
+                 ('read', read_file),
+                 ('stat', os.stat),
+                 ('rename', lambda name: os.rename(name, name + '.renamed')),
+                 ('delete', lambda name: os.unlink(name + '.renamed'))]
+        for step, function in steps:
+            start = monotonic()
+            for name in names:
+                function(name)
+            os.sync()
+            timings.append((step, monotonic() - start))
+    finally:
+        for name in os.listdir(work_dir):
+            os.unlink(os.path.join(work_dir, name))
+        os.rmdir(work_dir)
+    return timings
+
+
+def write_file(path, data):
+    """ :param path: The file to create
+        :type path: str
+        :param data: The content
+        :type data: bytes
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def read_file(path):
+    """ :param path: The file to read, updates its access time unless the mount options prevent it
+        :type path: str
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.read(fd, METADATA_FILE_SIZE)
+    finally:
+        os.close(fd)
+
+
+def xfs_protofile(uid, gid):
+    """ Content of a mkfs.xfs prototype file that only describes the root directory
+        :param uid: Owner of the filesystem root
+        :type uid: int
+        :param gid: Group of the filesystem root
+        :type gid: int
+        :rtype: str
+    """
+    # boot image (unused), blocks and inodes (unused), root directory: type, suid, sgid, mode, uid, gid
+    return '/dev/null\n0 0\nd--{mode:03o} {uid} {gid}\n$\n'.format(mode=ROOT_MODE, uid=uid, gid=gid)
+
+
+def get_profile(name):
+    """ Looks up a filesystem profile by name
+        :param name: The name of the profile
+        :type name: str
+        :returns: The profile or None if there is no profile with this name
+        :rtype: :class:`FilesystemProfile` or None
+    """
+    for profile in FILESYSTEM_PROFILES:
+        if profile.name == name:
+            return profile
+    return None
+
+
+def get_profile_for_filesystem(filesystem, features=None):
+    """ Looks up the profile of an existing filesystem, eg to mount a container: ext4 with and without journal
+        get told apart by their features, otherwise the first profile of the filesystem type is used
+        :param filesystem: The filesystem type as reported by blkid
+        :type filesystem: str
+        :param features: ext2/ext4 features as listed by `dumpe2fs -h`, None if unknown
+        :type features: list of str or None
+        :returns: The matching profile or None
+        :rtype: :class:`FilesystemProfile` or None
+    """
+    candidates = [profile for profile in FILESYSTEM_PROFILES if profile.filesystem == filesystem]
+    for profile in candidates:
+        if profile.matches_features(features):
+            return profile
+    return candidates[0] if candidates else None
@@ -0,0 +1,176 @@
+"""
+Console mode to unlock the containers listed in a login profile at the start of a desktop session,
+eg from an autostart entry. All containers get unlocked by a single worker process: one sudo call
+instead of one per container, and the key derivations run in parallel instead of one after the other.
+Only containers with key files can be unlocked this way, there is nobody to ask for a passphrase.
+
+luckyLUKS Copyright (c) 2014,2015,2022 Jasper van Hoorn (muzius@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details. <http://www.gnu.org/licenses/>
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+from luckyLUKS.containerfile import get_config_dir, get_container_settings, set_container_settings, \
+    get_keyslot_hint, remember_keyslot
+from luckyLUKS.batch import ManifestException, spawn_worker, plain_text
+
+LOGIN_PROFILE = 'login.json'
+
+
+def read_profile(profile_path=None):
+    """ Reads the containers to be unlocked from a JSON profile: either a list of entries
+        or an object with the list in `containers`. Each entry needs path, name and key_file,
+        mount_point, perf_flags (eg ['no_read_workqueue']), read_only and mount_profile (eg 'lazytime') are optional
+        (default: the settings remembered for the container)
+        :param profile_path: Path of the profile, ~/.config/luckyLUKS/login.json if None
+        :type profile_path: str or None
+        :returns: The unlock parameters of each container for the worker
+        :rtype: list of dict
+        :raises: ManifestException
+    """
+    if profile_path is None:
+        profile_path = os.path.join(get_config_dir(), LOGIN_PROFILE)
+    try:
+        with open(profile_path) as profile_file:
+            profile = json.load(profile_file)
+    except (IOError, ValueError) as error:
+        raise ManifestException(str(error))
+    if isinstance(profile, dict):
+        profile = profile.get('containers', [])
+    if not isinstance(profile, list) or not profile:
+        raise ManifestException(_('No containers found in login profile {file_path}').format(file_path=profile_path))
+
+    base_dir = os.path.dirname(os.path.abspath(profile_path))
+    containers = []
+    for entry in profile:
+        try:
+            container_path = os.path.join(base_dir, os.path.expanduser(entry['path']))
+            key_file = os.path.join(base_dir, os.path.expanduser(entry['key_file']))
+            device_name = entry['name']
+        except (KeyError, TypeError) as error:
+            raise ManifestException(_('Missing value {key} in login profile entry:\n{entry}').format(
+                key=str(error), entry=json.dumps(entry)))
+        mount_point = entry.get('mount_point')
+        if mount_point is not None:
+            mount_point = os.path.join(base_dir, os.path.expanduser(mount_point))
+        settings = get_container_settings(container_path)
+        containers.append({'device_name': device_name,
+                           'container_path': container_path,
+                           'key_file': key_file,
+                           'mount_point': mount_point,
+                           'perf_flags': entry.get('perf_flags', settings.get('perf_flags')),
+                           'keyslot': get_keyslot_hint(container_path, key_file),
+                           'tcrypt': settings.get('tcrypt'),
+                           'read_only': bool(entry.get('read_only', settings.get('read_only', False))),
+                           'mount_profile': entry.get('mount_profile', settings.get('mount_profile'))})
+    for key in ('container_path', 'device_name'):
+        values = [container[key] for container in containers]
+        duplicates = sorted(set(value for value in values if values.count(value) > 1))
+        if duplicates:
+            raise ManifestException(_('Duplicate {attribute} in login profile: {values}').format(
+                attribute=key, values=', '.join(duplicates)))
+    return containers
+
+
+def unlock_all(worker, containers):
+    """ Sends the unlock command for all containers to the worker and waits for the results,
+        remembers the keyslots and TrueCrypt/VeraCrypt variants that matched to try them first next time
+        :param worker: The worker process
+        :type worker: :class:`subprocess.Popen`
+        :param containers: The unlock parameters of each container
+        :type containers: list of dict
+        :returns: The results of each container and the total wall time, see WorkerHelper.unlock_containers()
+        :rtype: dict
+        :raises: IOError
+    """
+    key_files = {container['container_path']: container['key_file'] for container in containers}
+    worker.stdin.write(json.dumps({'type': 'request', 'msg': 'unlock_all', 'containers': containers}) + '\n')
+    worker.stdin.flush()
+    while True:
+        line = worker.stdout.readline()
+        if not line:
+            raise IOError(_('Worker process terminated unexpectedly'))
+        message = json.loads(line)
+        if message['type'] == 'error':
+            raise IOError(plain_text(message['msg']))
+        if message['type'] == 'response':
+            return message['msg']
+        progress = message['msg']
+        try:
+            if progress.get('phase') == 'keyslot':
+                remember_keyslot(progress['container_path'], key_files.get(progress['container_path']),
+                                 progress['keyslot'], progress['saved'])
+            elif progress.get('phase') == 'tcrypt':
+                set_container_settings(progress['container_path'],
+                                       tcrypt={'variant': progress['variant'], 'hash': progress['hash']})
+        except (IOError, OSError):
+            pass  # all keyslots and variants get tried next time
+
+
+def print_results(results, output=sys.stdout):
+    """ Prints the result of each container, the wall time and the sum of the time each unlock took.
+        The unlocks ran concurrently and slowed each other down, so the sum is not what unlocking them
+        one after the other would take
+        :param results: The results returned by the worker
+        :type results: dict
+        :param output: Results get written here
+        :type output: file
+    """
+    for result in results['results']:
+        if result['state'] == 'unlocked':
+            state = _('unlocked in {seconds} s').format(seconds='{0:.1f}'.format(result['elapsed']))
+        elif result['state'] == 'already unlocked':
+            state = _('already unlocked')
+        else:
+            state = _('failed: {error}').format(error=plain_text(result['error'] or ''))
+        output.write('{path} ({name}): {state}\n'.format(
+            path=result['container_path'], name=result['device_name'], state=state))
+    unlocked = [result for result in results['results'] if result['state'] == 'unlocked']
+    output.write('\n' + _('{unlocked}/{containers} containers unlocked in {seconds} s '
+                          '(sum of parallel elapsed times {elapsed} s)').format(
+        unlocked=len(unlocked), containers=len(results['results']), seconds='{0:.1f}'.format(results['total']),
+        elapsed='{0:.1f}'.format(sum(result['elapsed'] for result in unlocked))) + '\n')
+
+
+def run(profile_path=None):
+    """ Entry point of the login mode: reads the profile and unlocks all containers with one worker process
+        :param profile_path: Path of the profile, ~/.config/luckyLUKS/login.json if None
+        :type profile_path: str or None
+        :returns: exit code, 0 if all containers are unlocked
+        :rtype: int
+    """
+    try:
+        containers = read_profile(profile_path)
+    except ManifestException as me:
+        sys.stdout.write(plain_text(str(me)) + '\n')
+        return 1
+    # without terminal (eg autostart) sudo has to be configured to run luckyLUKS without password
+    if sys.stdin.isatty() and subprocess.call(['sudo', '-v']) != 0:
+        return 1
+    try:
+        worker = spawn_worker()
+    except (OSError, IOError) as error:
+        sys.stdout.write(str(error) + '\n')
+        return 1
+    try:
+        results = unlock_all(worker, containers)
+    except (OSError, IOError, ValueError) as error:
+        sys.stdout.write(str(error) + '\n')
+        return 1
+    finally:
+        worker.stdin.close()
+        worker.wait()
+    print_results(results)
+    return 0 if all(result['state'] != 'failed' for result in results['results']) else 1
@@ -0,0 +1,249 @@
+"""
+In-process reader for LUKS1 and LUKS2 headers: UUID, cipher, sector size, keyslots with their
+PBKDF parameters and the persistent flags, without forking cryptsetup. Only the header area at the
+start of the container gets read (LUKS1: 592 bytes, LUKS2: binary header and JSON area, usually 16KiB),
+results are cached per file as long as inode, size and modification time stay the same.
+
+luckyLUKS Copyright (c) 2014,2015,2022 Jasper van Hoorn (muzius@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details. <http://www.gnu.org/licenses/>
+"""
+
+import os
+import json
+import struct
+import hashlib
+
+from luckyLUKS.dmcrypt import PERF_FLAGS, PERF_FLAG_NAMES
+
+LUKS_MAGIC = b'LUKS\xba\xbe'
+LUKS2_SECONDARY_MAGIC = b'SKUL\xba\xbe'
+# magic, version, cipher name, cipher mode, hash spec, payload offset, key bytes, mk digest, salt, iterations, uuid
+LUKS1_HEADER = struct.Struct('>6sH32s32s32sII20s32sI40s')
+# active, iterations, salt, key material offset, stripes
+LUKS1_KEYSLOT = struct.Struct('>II32sII')
+LUKS1_KEYSLOTS = 8
+LUKS1_KEYSLOT_ENABLED = 0x00AC71F3
+# magic, version, header size, sequence id, label, checksum algorithm, salt, uuid, subsystem, header offset
+LUKS2_HEADER = struct.Struct('>6sHQQ48s32s64s40s48sQ')
+LUKS2_BINARY_SIZE = 4096
+LUKS2_CHECKSUM_OFFSET = 448
+LUKS2_CHECKSUM_SIZE = 64
+# the JSON area is 12KiB by default, the spec allows up to 4MiB minus the binary header
+LUKS2_MAX_HEADER_SIZE = 4 * 1024 * 1024
+# possible offsets of the secondary LUKS2 header, used if the primary one is damaged
+LUKS2_SECONDARY_OFFSETS = [16384 << shift for shift in range(9)]
+CACHE_SIZE = 64
+
+
+class LuksHeaderException(Exception):
+    """ Raised if a file starts with the LUKS magic but the header cannot be read """
+
+
+_cache = {}
+
+
+def read_header(path):
+    """ Reads the header of a LUKS container, cached by inode, size and modification time
+        :param path: The container file
+        :type path: str
+        :returns: version, uuid, label, cipher, key_size in bits, sector_size and data offset in bytes,
+                  flags (persistent dm-crypt flags, see dmcrypt.PERF_FLAGS) and the keyslots with keyslot number,
+                  priority, pbkdf and for argon2 time_cost, memory in bytes and parallel,
+                  for pbkdf2 hash and iterations. None if the file is not a LUKS container
+        :rtype: dict or None
+        :raises: OSError, LuksHeaderException
+    """
+    with open(path, 'rb') as container:
+        file_stat = os.fstat(container.fileno())
+        key = (file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        header = parse_header(container)
+    if len(_cache) >= CACHE_SIZE:
+        _cache.clear()
+    _cache[path] = (key, header)
+    return header
+
+
+def parse_header(container):
+    """ :param container: The container file opened in binary mode
+        :type container: file
+        :returns: The header information, see read_header(), or None if not a LUKS container
+        :rtype: dict or None
+        :raises: OSError, LuksHeaderException
+    """
+    start = container.read(LUKS2_BINARY_SIZE)
+    if not start.startswith(LUKS_MAGIC) or len(start) < 8:
+        return None
+    version = struct.unpack('>H', start[6:8])[0]
+    if version == 1:
+        return parse_luks1(start)
+    if version == 2:
+        return parse_luks2(container)
+    raise LuksHeaderException(_('Unknown LUKS version: {version}').format(version=version))
+
+
+def decode(field):
+    """ :param field: A zero padded string field of the binary header
+        :type field: bytes
+        :rtype: str
+    """
+    return field.split(b'\0', 1)[0].decode('ascii', 'replace').strip()
+
+
+def parse_luks1(data):
+    """ :param data: The first bytes of the container, at least the LUKS1 header with its keyslots
+        :type data: bytes
+        :returns: The header information, see read_header()
+        :rtype: dict
+        :raises: LuksHeaderException
+    """
+    if len(data) < LUKS1_HEADER.size + LUKS1_KEYSLOTS * LUKS1_KEYSLOT.size:
+        raise LuksHeaderException(_('LUKS header truncated'))
+    (__, __, cipher_name, cipher_mode, hash_spec, payload_offset, key_bytes,
+     __, __, __, uuid) = LUKS1_HEADER.unpack_from(data)
+    keyslots = []
+    for keyslot in range(LUKS1_KEYSLOTS):
+        active, iterations, __, __, __ = LUKS1_KEYSLOT.unpack_from(
+            data, LUKS1_HEADER.size + keyslot * LUKS1_KEYSLOT.size)
+        if active == LUKS1_KEYSLOT_ENABLED:
+            keyslots.append({'keyslot': keyslot, 'priority': 'normal', 'pbkdf': 'pbkdf2',
+                             'hash': decode(hash_spec), 'iterations': iterations})
+    return {'version': 1,
+            'uuid': decode(uuid),
+            'label': '',
+            'cipher': '{name}-{mode}'.format(name=decode(cipher_name), mode=decode(cipher_mode)),
+            'key_size': key_bytes * 8,
+            'sector_size': 512,
+            'data_offset': payload_offset * 512,
+            'flags': [],
+            'keyslots': keyslots}
+
+
+def read_luks2_area(container, offset, magic):
+    """ Reads a LUKS2 binary header and its JSON area and verifies the checksum
+        :param container: The container file opened in binary mode
+        :type container: file
+        :param offset: Position of the header in the file
+        :type offset: int
+        :param magic: The magic expected at this position (primary or secondary)
+        :type magic: bytes
+        :returns: sequence id, binary header fields and the parsed JSON metadata, None if not valid
+        :rtype: tuple or None
+    """
+    container.seek(offset)
+    binary = container.read(LUKS2_BINARY_SIZE)
+    if len(binary) < LUKS2_BINARY_SIZE or not binary.startswith(magic):
+        return None
+    fields = LUKS2_HEADER.unpack_from(binary)
+    header_size, seqid, checksum_alg = fields[2], fields[3], decode(fields[5])
+    if not LUKS2_BINARY_SIZE < header_size <= LUKS2_MAX_HEADER_SIZE or fields[9] != offset:
+        return None
+    json_area = container.read(header_size - LUKS2_BINARY_SIZE)
+    if len(json_area) < header_size - LUKS2_BINARY_SIZE:
+        return None
+    try:
+        checksum = hashlib.new(checksum_alg)
+    except ValueError:
+        checksum = None  # unknown algorithm: rely on the JSON being readable
+    if checksum is not None:
+        # the checksum covers the binary header with a zeroed checksum field and the JSON area
+        checksum.update(binary[:LUKS2_CHECKSUM_OFFSET])
+        checksum.update(bytes(LUKS2_CHECKSUM_SIZE))
+        checksum.update(binary[LUKS2_CHECKSUM_OFFSET + LUKS2_CHECKSUM_SIZE:])
+        checksum.update(json_area)
+        stored = binary[LUKS2_CHECKSUM_OFFSET:LUKS2_CHECKSUM_OFFSET + checksum.digest_size]
+        if checksum.digest() != stored:
+            return None
+    try:
+        metadata = json.loads(json_area.split(b'\0', 1)[0].decode('utf-8'))
+    except ValueError:
+        return None
+    if not isinstance(metadata, dict):
+        return None
+    return seqid, fields, metadata
+
+
+def parse_luks2(container):
+    """ Uses the primary header, or the secondary one if it is newer or the primary one is damaged
+        :param container: The container file opened in binary mode
+        :type container: file
+        :returns: The header information, see read_header()
+        :rtype: dict
+        :raises: LuksHeaderException
+    """
+    candidates = [read_luks2_area(container, 0, LUKS_MAGIC)]
+    for offset in LUKS2_SECONDARY_OFFSETS:
+        secondary = read_luks2_area(container, offset, LUKS2_SECONDARY_MAGIC)
+        if secondary is not None:
+            candidates.append(secondary)
+            break
+    candidates = [candidate for candidate in candidates if candidate is not None]
+    if not candidates:
+        raise LuksHeaderException(_('LUKS2 header damaged'))
+    __, fields, metadata = max(candidates, key=lambda candidate: candidate[0])
+    try:
+        return parse_luks2_metadata(fields, metadata)
+    except (KeyError, TypeError, ValueError, AttributeError) as error:
+        raise LuksHeaderException(_('Unexpected LUKS2 metadata: {error}').format(error=str(error))) from error
+
+
+def parse_luks2_metadata(fields, metadata):
+    """ :param fields: The fields of the binary header
+        :type fields: tuple
+        :param metadata: The JSON metadata
+        :type metadata: dict
+        :returns: The header information, see read_header()
+        :rtype: dict
+        :raises: KeyError, TypeError, ValueError
+    """
+    segments = sorted(metadata['segments'].items(), key=lambda item: int(item[0]))
+    segment = segments[0][1] if segments else {}
+    keyslots = []
+    for number, keyslot in sorted(metadata['keyslots'].items(), key=lambda item: int(item[0])):
+        kdf = keyslot.get('kdf', {})
+        entry = {'keyslot': int(number), 'priority': {0: 'ignore', 2: 'prefer'}.get(keyslot.get('priority'), 'normal'),
+                 'pbkdf': kdf.get('type')}
+        if kdf.get('type') == 'pbkdf2':
+            entry.update(hash=kdf.get('hash'), iterations=int(kdf.get('iterations', 0)))
+        else:
+            entry.update(time_cost=int(kdf.get('time', 0)), memory=int(kdf.get('memory', 0)) * 1024,  # KiB
+                         parallel=int(kdf.get('cpus', 1)))
+        keyslots.append(entry)
+    config_flags = metadata.get('config', {}).get('flags', [])
+    key_size = 0
+    if keyslots:
+        key_size = int(metadata['keyslots'][str(keyslots[0]['keyslot'])].get('key_size', 0)) * 8
+    return {'version': 2,
+            'uuid': decode(fields[7]),
+            'label': decode(fields[4]),
+            'cipher': segment.get('encryption', ''),
+            'key_size': key_size,
+            'sector_size': int(segment.get('sector_size', 512)),
+            'data_offset': int(segment.get('offset', 0)),
+            'flags': [flag for flag in PERF_FLAG_NAMES if PERF_FLAGS[flag][2] in config_flags],
+            'keyslots': keyslots}
+
+
+def describe_header(header):
+    """ Summary of a LUKS header for display
+        :param header: The header information as returned by read_header()
+        :type header: dict
+        :rtype: str
+    """
+    pbkdfs = sorted(set(str(keyslot['pbkdf']) for keyslot in header['keyslots']))
+    # L10n: LUKS version, cipher, key size, encryption sector size and the keyslots in use
+    return _('LUKS{version}: {cipher} {key_size} bit, {sector_size} byte sectors, '
+             '{keyslots} keyslots ({pbkdf})').format(
+        version=header['version'], cipher=header['cipher'], key_size=header['key_size'],
+        sector_size=header['sector_size'], keyslots=len(header['keyslots']), pbkdf=', '.join(pbkdfs))
@@ -64,8 +64,22 @@ def luckyLUKS(translation, *args, **kwargs):
                         help=_('Where to mount the encrypted filesystem'))
     parser.add_argument('-k', dest='keyfile', nargs='?', metavar=_('PATH'),
                         help=_('Path to an optional key file'))
+    parser.add_argument('-o', dest='mount_profile', nargs='?', metavar=_('PROFILE'),
+                        help=_('Mount options: default, lazytime, durable, discard, trim or compress '
+                               '(remembered for the container)'))
     parser.add_argument('-v', '--version', action='version', version="luckyLUKS " + VERSION_STRING,
                         help=_("show program's version number and exit"))
+    parser.add_argument('--batch', dest='manifest', metavar=_('MANIFEST'),
+                        help=_('Create all containers listed in a manifest file on the console'))
+    parser.add_argument('--login', dest='login_profile', nargs='?', const='', metavar=_('PROFILE'),
+                        help=_('Unlock all containers listed in a login profile (default: '
+                               '~/.config/luckyLUKS/login.json) on the console'))
+    parser.add_argument('--pool-report', dest='pool_report', action='store_true',
+                        help=_('Show the pre-filled container files in the pool and exit'))
+    parser.add_argument('--fragmentation', dest='fragmentation', nargs='+', metavar=_('PATH'),
+                        help=_('Show how fragmented container files are on disk and exit'))
+    parser.add_argument('--profile-storage', dest='profile_storage', metavar=_('PATH'),
+                        help=_('Measure the storage of a directory for new containers and exit'))
     parser.add_argument('--ishelperprocess', action='store_true', help=argparse.SUPPRESS)
     parser.add_argument('--sudouser', type=int, help=argparse.SUPPRESS)
 
@@ -75,6 +89,19 @@ def luckyLUKS(translation, *args, **kwargs):
     builtins._ = translation.gettext_qt
     if parsed_args.ishelperprocess:
         startWorker(parsed_args.sudouser)
+    elif parsed_args.pool_report:
+        showPoolReport()
+    elif parsed_args.fragmentation:
+        showFragmentationReport(parsed_args.fragmentation)
+    elif parsed_args.profile_storage:
+        builtins._ = translation.gettext  # console output -> no markup
+        showStorageProfile(parsed_args.profile_storage)
+    elif parsed_args.manifest:
+        builtins._ = translation.gettext  # console output -> no markup
+        startBatch(parsed_args.manifest)
+    elif parsed_args.login_profile is not None:
+        builtins._ = translation.gettext  # console output -> no markup
+        startLogin(parsed_args.login_profile or None)
     else:
         startUI(parsed_args)
 
@@ -92,7 +119,8 @@ def startUI(parsed_args):
     application.installTranslator(qt_translator)
 
     # start application
-    main_win = MainWindow(parsed_args.name, parsed_args.container, parsed_args.keyfile, parsed_args.mountpoint)
+    main_win = MainWindow(parsed_args.name, parsed_args.container, parsed_args.keyfile, parsed_args.mountpoint,
+                          parsed_args.mount_profile)
     # setup OK -> run event loop
     if main_win.is_initialized:
         sys.exit(application.exec_())
@@ -100,6 +128,54 @@ def startUI(parsed_args):
         sys.exit(0)
 
 
+def showPoolReport():
+    """ Print the content of the container pool on the console """
+    from luckyLUKS.containerfile import ContainerPool, get_config_dir
+    try:
+        pool = ContainerPool.from_config()
+    except ValueError as ve:
+        sys.stdout.write(str(ve) + '\n')
+        sys.exit(1)
+    if pool is None:
+        sys.stdout.write(_('No container pool configured in {config_file}').format(
+            config_file=os.path.join(get_config_dir(), 'pool.json')) + '\n')
+    else:
+        sys.stdout.write('\n'.join(pool.report()) + '\n')
+    sys.exit(0)
+
+
+def showFragmentationReport(paths):
+    """ Print the extent layout of container files on the console """
+    from luckyLUKS.containerfile import fragmentation_report
+    sys.stdout.write('\n'.join(fragmentation_report(paths)) + '\n')
+    sys.exit(0)
+
+
+def showStorageProfile(directory):
+    """ Measure the storage of a directory, remember the result and print it on the console """
+    from luckyLUKS.storageprofile import profile_storage, save_storage_profile, format_profile
+    try:
+        profile = profile_storage(os.path.abspath(directory))
+        save_storage_profile(profile)
+    except (IOError, OSError) as error:
+        sys.stdout.write('{directory}: {error}\n'.format(directory=directory, error=error.strerror or str(error)))
+        sys.exit(1)
+    sys.stdout.write('\n'.join(format_profile(profile)) + '\n')
+    sys.exit(0)
+
+
+def startBatch(manifest_path):
+    """ Create the containers listed in a manifest without GUI """
+    from luckyLUKS import batch
+    sys.exit(batch.run(manifest_path))
+
+
+def startLogin(profile_path=None):
+    """ Unlock the containers listed in a login profile without GUI """
+    from luckyLUKS import login
+    sys.exit(login.run(profile_path))
+
+
 def startWorker(sudouser=None):
     """ Initialize worker process """
     from luckyLUKS import worker
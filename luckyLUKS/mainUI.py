@@ -19,12 +19,17 @@ import os.path
 
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QApplication, QWidget, QMainWindow, QDesktopWidget, QDialog,\
-    QSystemTrayIcon, QMessageBox, QMenu, QAction, QLabel, QPushButton, QGridLayout, QStyle
+    QSystemTrayIcon, QMessageBox, QMenu, QAction, QLabel, QPushButton, QGridLayout, QStyle, QCheckBox
 from PyQt5.QtGui import QIcon
 
 from luckyLUKS import utils, PROJECT_URL
-from luckyLUKS.unlockUI import UnlockContainerDialog, UserInputError
-from luckyLUKS.utilsUI import show_alert
+from luckyLUKS.containerfile import ContainerPool, get_container_settings, set_container_settings, \
+    get_keyslot_hint, read_luks_uuid, get_allocated_size, describe_allocation
+from luckyLUKS.performanceUI import PerformanceDialog, MountProfileDialog
+from luckyLUKS.fsprofiles import get_mount_profile
+from luckyLUKS.unlockUI import UnlockContainerDialog, UserInputError, on_unlock_progress, describe_lock_timings, \
+    describe_timing_history, remember_read_throughput
+from luckyLUKS.utilsUI import show_alert, show_info
 
 
 class MainWindow(QMainWindow):
@@ -34,7 +39,7 @@ class MainWindow(QMainWindow):
         leave an icon in the systray as a reminder to close them eventually.
     """
 
-    def __init__(self, device_name=None, container_path=None, key_file=None, mount_point=None):
+    def __init__(self, device_name=None, container_path=None, key_file=None, mount_point=None, mount_profile=None):
         """ Command line arguments checks are done here to be able to display a graphical dialog with error messages .
             If no arguments were supplied on the command line a setup dialog will be shown.
             All commands will be executed from a separate worker process with administrator privileges
@@ -47,6 +52,8 @@ class MainWindow(QMainWindow):
             :type key_file: str/unicode or None
             :param mount_point: The path of an optional mount point
             :type mount_point: str/unicode or None
+            :param mount_profile: The mount options to use from now on for this container (see fsprofiles)
+            :type mount_profile: str or None
         """
         super().__init__()
 
@@ -58,7 +65,11 @@ class MainWindow(QMainWindow):
         self.worker = None
         self.is_waiting_for_worker = False
         self.is_unlocked = False
+        self.is_suspended = False
         self.is_initialized = False
+        self.is_filling_pool = False
+        self.pending_action = None
+        self.pool = None
         self.has_tray = QSystemTrayIcon.isSystemTrayAvailable()
 
         # L10n: program name - translatable for startmenu titlebar etc
@@ -102,6 +113,9 @@ class MainWindow(QMainWindow):
                                ).format(executable=os.path.basename(sys.argv[0]),
                                         project_url=PROJECT_URL), critical=True)
 
+        if mount_profile is not None and get_mount_profile(mount_profile) is None:
+            show_alert(self, _('Unknown mount profile: {profile}').format(profile=mount_profile), critical=True)
+
         # spawn worker process with root privileges
         try:
             self.worker = utils.WorkerMonitor(self)
@@ -111,11 +125,19 @@ class MainWindow(QMainWindow):
             show_alert(self, str(se), critical=True)
             return
 
+        # optional pool of pre-filled container files, refilled while idle
+        try:
+            self.pool = ContainerPool.from_config()
+        except ValueError as ve:
+            show_alert(self, _('Invalid container pool configuration:\n{error}').format(error=str(ve)))
+
         # if no arguments supplied, display dialog to gather this information
         if self.encrypted_container is None and self.luks_device_name is None:
 
             from luckyLUKS.setupUI import SetupDialog
             sd = SetupDialog(self)
+            if mount_profile is not None:
+                sd.set_mount_profile(mount_profile)
 
             if sd.exec_() == QDialog.Accepted:
                 self.luks_device_name = sd.get_luks_device_name()
@@ -133,6 +155,12 @@ class MainWindow(QMainWindow):
                 QApplication.instance().quit()
                 return
 
+        elif mount_profile is not None:
+            try:
+                set_container_settings(self.encrypted_container, mount_profile=mount_profile)
+            except (IOError, OSError) as error:
+                show_alert(self, str(error))
+
         # center window on desktop
         qr = self.frameGeometry()
         cp = QDesktopWidget().availableGeometry().center()
@@ -169,11 +197,46 @@ class MainWindow(QMainWindow):
         self.label_status = QLabel('')
         main_grid.addWidget(self.label_status, 5, 1, alignment=Qt.AlignCenter)
 
+        # disk space taken up by the container file: less than its size for thin containers
+        main_grid.addWidget(QLabel(_('Disk:')), 6, 0)
+        self.label_allocation = QLabel('')
+        main_grid.addWidget(self.label_allocation, 6, 1, alignment=Qt.AlignCenter)
+
         self.button_toggle_status = QPushButton('')
         self.button_toggle_status.setMinimumHeight(34)
         self.button_toggle_status.clicked.connect(self.toggle_container_status)
-        main_grid.setRowMinimumHeight(6, 10)
-        main_grid.addWidget(self.button_toggle_status, 7, 1)
+        main_grid.setRowMinimumHeight(7, 10)
+        main_grid.addWidget(self.button_toggle_status, 8, 1)
+        self.checkbox_read_only = QCheckBox(_('Open read-only'))
+        self.checkbox_read_only.setToolTip(_('Nothing gets written to the container file:\n'
+                                             'for archives and containers on read-only or shared media'))
+        self.checkbox_read_only.setChecked(self.get_read_only())
+        self.checkbox_read_only.toggled.connect(self.set_read_only)
+        main_grid.addWidget(self.checkbox_read_only, 9, 1)
+        self.button_quick_lock = QPushButton(_('Quick Lock'))
+        self.button_quick_lock.setToolTip(_('Wipe the key from memory but keep the container mounted,\n'
+                                            'programs using it wait until it gets unlocked again'))
+        self.button_quick_lock.clicked.connect(self.quick_lock)
+        main_grid.addWidget(self.button_quick_lock, 10, 1)
+        self.button_perf_flags = QPushButton(_('dm-crypt options'))
+        self.button_perf_flags.setToolTip(_('Performance options of the encrypted device'))
+        self.button_perf_flags.clicked.connect(self.show_perf_flags)
+        main_grid.addWidget(self.button_perf_flags, 11, 1)
+        self.button_mount_profile = QPushButton(_('Mount options'))
+        self.button_mount_profile.setToolTip(_('Performance options of the filesystem'))
+        self.button_mount_profile.clicked.connect(self.show_mount_profile)
+        main_grid.addWidget(self.button_mount_profile, 12, 1)
+        self.button_compact = QPushButton(_('Compact'))
+        self.button_compact.setToolTip(_('Give the space freed inside the container back to the disk\n'
+                                         '(needs the allow_discards dm-crypt option)'))
+        self.button_compact.clicked.connect(self.compact)
+        main_grid.addWidget(self.button_compact, 13, 1)
+        self.button_timings = QPushButton(_('Timings'))
+        self.button_timings.setToolTip(_('Where the time went on the last unlock and close'))
+        self.button_timings.clicked.connect(self.show_timings)
+        main_grid.addWidget(self.button_timings, 14, 1)
+        self.label_lock_timings = QLabel('')
+        main_grid.addWidget(self.label_lock_timings, 15, 0, 1, 2, alignment=Qt.AlignCenter)
 
         widget = QWidget()
         widget.setLayout(main_grid)
@@ -190,6 +253,14 @@ class MainWindow(QMainWindow):
             self.tray_toggle_action = QAction(QApplication.style().standardIcon(QStyle.SP_DesktopIcon), _('Hide'), self)
             self.tray_toggle_action.triggered.connect(self.toggle_main_window)
             tray_popup.addAction(self.tray_toggle_action)
+            self.tray_quick_lock_action = QAction(QApplication.style().standardIcon(QStyle.SP_MediaPause),
+                                                  _('Quick Lock'), self)
+            self.tray_quick_lock_action.triggered.connect(self.toggle_quick_lock)
+            tray_popup.addAction(self.tray_quick_lock_action)
+            self.tray_perf_flags_action = QAction(QApplication.style().standardIcon(QStyle.SP_FileDialogDetailedView),
+                                                  _('dm-crypt options'), self)
+            self.tray_perf_flags_action.triggered.connect(self.show_perf_flags)
+            tray_popup.addAction(self.tray_perf_flags_action)
             quit_action = QAction(QApplication.style().standardIcon(QStyle.SP_MessageBoxCritical), _('Quit'), self)
             quit_action.triggered.connect(self.tray_quit)
             tray_popup.addAction(quit_action)
@@ -207,9 +278,16 @@ class MainWindow(QMainWindow):
 
     def refresh(self):
         """ Update widgets to reflect current container status. Adds systray icon if needed """
-        if self.is_unlocked:
+        if self.is_unlocked and self.is_suspended:
+            self.label_status.setText(_('Container is {locked_orange_bold}').format(
+                locked_orange_bold='<font color="#cc6600"><b>' + _('quick locked') + '</b></font>'))
+            self.button_toggle_status.setText(_('Quick Unlock'))
+            if self.has_tray:
+                self.tray.setToolTip(_('{device_name} is quick locked').format(device_name=self.luks_device_name))
+        elif self.is_unlocked:
             self.label_status.setText(_('Container is {unlocked_green_bold}').format(
-                unlocked_green_bold='<font color="#006400"><b>' + _('unlocked') + '</b></font>'))
+                unlocked_green_bold='<font color="#006400"><b>' +
+                (_('unlocked read-only') if self.get_read_only() else _('unlocked')) + '</b></font>'))
             self.button_toggle_status.setText(_('Close Container'))
             if self.has_tray:
                 self.tray.setToolTip(_('{device_name} is unlocked').format(device_name=self.luks_device_name))
@@ -219,6 +297,16 @@ class MainWindow(QMainWindow):
             self.button_toggle_status.setText(_('Unlock Container'))
             if self.has_tray:
                 self.tray.setToolTip(_('{device_name} is closed').format(device_name=self.luks_device_name))
+        if self.has_tray:
+            self.tray_quick_lock_action.setText(_('Quick Unlock') if self.is_suspended else _('Quick Lock'))
+            self.tray_quick_lock_action.setEnabled(self.is_unlocked)
+            # changing or measuring the flags of a suspended device would block the worker
+            self.tray_perf_flags_action.setEnabled(not self.is_suspended)
+        self.label_lock_timings.setText(describe_lock_timings(self.encrypted_container))
+        try:
+            self.label_allocation.setText(describe_allocation(get_allocated_size(self.encrypted_container)))
+        except OSError:
+            self.label_allocation.setText('')
 
         self.show()
         self.setFixedSize(self.sizeHint())
@@ -229,7 +317,7 @@ class MainWindow(QMainWindow):
             QApplication.instance().quit()
         elif not self.is_waiting_for_worker:
             self.show()
-            self.confirm_close()
+            self.when_worker_ready(self.confirm_close)
 
     def toggle_main_window(self, tray_icon_clicked):
         """ Triggered by clicking on the systray icon: show/hide main window """
@@ -251,7 +339,7 @@ class MainWindow(QMainWindow):
                     self.hide()
                     self.tray_toggle_action.setText(_('Show'))
                 else:
-                    self.confirm_close()
+                    self.when_worker_ready(self.confirm_close)
                 event.ignore()
             else:
                 event.accept()
@@ -273,20 +361,76 @@ class MainWindow(QMainWindow):
 
     def toggle_container_status(self):
         """ Unlock or close container """
-        if self.is_unlocked:
+        self.when_worker_ready(self.do_toggle_container_status)
+
+    def do_toggle_container_status(self):
+        """ Unlock or close container, or resume a quick locked one """
+        if self.is_suspended:
+            self.do_quick_unlock()
+        elif self.is_unlocked:
             self.do_close_container()
         else:
             try:
                 UnlockContainerDialog(
                     self, self.worker, self.luks_device_name,
                     self.encrypted_container, self.key_file,
-                    self.mount_point
+                    self.mount_point, self.get_perf_flags(), read_only=self.get_read_only(),
+                    mount_profile=self.get_mount_profile()
                 ).communicate()
                 self.is_unlocked = True
             except UserInputError as uie:
                 show_alert(self, str(uie))
                 self.is_unlocked = False
-            self.refresh()
+            self.enable_ui()
+
+    def quick_lock(self):
+        """ Triggered by clicking the quick lock button """
+        if not self.is_waiting_for_worker and self.is_unlocked and not self.is_suspended:
+            self.when_worker_ready(self.do_quick_lock)
+
+    def toggle_quick_lock(self):
+        """ Triggered by the quick lock/unlock tray entry """
+        if self.is_waiting_for_worker or not self.is_unlocked:
+            return
+        self.when_worker_ready(self.do_quick_unlock if self.is_suspended else self.do_quick_lock)
+
+    def do_quick_lock(self):
+        """ Suspends the unlocked container: the key gets wiped from memory, the mount stays in place """
+        self.disable_ui(_('Locking Container ..'))
+        self.worker.execute(command={'type': 'request',
+                                     'msg': 'suspend',
+                                     'device_name': self.luks_device_name,
+                                     'container_path': self.encrypted_container
+                                     },
+                            success_callback=lambda msg: self.on_quick_locked(msg, error=False),
+                            error_callback=lambda msg: self.on_quick_locked(msg, error=True),
+                            progress_callback=lambda progress: on_unlock_progress(
+                                self.encrypted_container, self.key_file, progress))
+
+    def on_quick_locked(self, message, error):
+        """ Callback after worker suspended the container
+            :param message: Contains an error description if error=True
+            :type message: str
+            :param error: Error during suspending the container
+            :type error: bool
+        """
+        if error:
+            show_alert(self, message)
+        else:
+            self.is_suspended = True
+        self.enable_ui()
+
+    def do_quick_unlock(self):
+        """ Resumes a quick locked container after asking for the passphrase """
+        try:
+            UnlockContainerDialog(
+                self, self.worker, self.luks_device_name,
+                self.encrypted_container, self.key_file, quick_unlock=True
+            ).communicate()
+            self.is_suspended = False
+        except UserInputError as uie:
+            show_alert(self, str(uie))
+        self.enable_ui()
 
     def do_close_container(self, shutdown=False):
         """ Send close command to worker and supply callbacks
@@ -297,10 +441,13 @@ class MainWindow(QMainWindow):
         self.worker.execute(command={'type': 'request',
                                      'msg': 'close',
                                      'device_name': self.luks_device_name,
-                                     'container_path': self.encrypted_container
+                                     'container_path': self.encrypted_container,
+                                     'mount_profile': self.get_mount_profile()
                                      },
                             success_callback=lambda msg: self.on_container_closed(msg, error=False, shutdown=shutdown),
-                            error_callback=lambda msg: self.on_container_closed(msg, error=True, shutdown=shutdown))
+                            error_callback=lambda msg: self.on_container_closed(msg, error=True, shutdown=shutdown),
+                            progress_callback=lambda progress: on_unlock_progress(
+                                self.encrypted_container, self.key_file, progress))
 
     def on_container_closed(self, message, error, shutdown):
         """ Callback after worker closed container
@@ -330,10 +477,18 @@ class MainWindow(QMainWindow):
                                          'device_name': self.luks_device_name,
                                          'container_path': self.encrypted_container,
                                          'key_file': self.key_file,
-                                         'mount_point': self.mount_point
+                                         'mount_point': self.mount_point,
+                                         'perf_flags': self.get_perf_flags(),
+                                         'keyslot': (get_keyslot_hint(self.encrypted_container, self.key_file)
+                                                     if self.key_file is not None else None),
+                                         'tcrypt': get_container_settings(self.encrypted_container).get('tcrypt'),
+                                         'read_only': self.get_read_only(),
+                                         'mount_profile': self.get_mount_profile()
                                          },
                                 success_callback=self.on_initialized,
-                                error_callback=lambda msg: self.on_initialized(msg, error=True))
+                                error_callback=lambda msg: self.on_initialized(msg, error=True),
+                                progress_callback=lambda progress: on_unlock_progress(
+                                    self.encrypted_container, self.key_file, progress))
         else:  # unlocked by setup-dialog -> just refresh UI
             self.enable_ui()
         self.is_initialized = True  # qt event loop can start now
@@ -349,14 +504,23 @@ class MainWindow(QMainWindow):
         if error:
             show_alert(self, message, critical=True)
         else:
-            self.is_unlocked = bool(message == 'unlocked')
+            self.is_unlocked = message in ('unlocked', 'suspended')
+            self.is_suspended = message == 'suspended'
             self.enable_ui()
 
     def enable_ui(self):
-        """ Enable buttons and refresh state """
+        """ Enable buttons and refresh state, use the idle time to fill the container pool """
         self.refresh()
         self.is_waiting_for_worker = False
         self.button_toggle_status.setEnabled(True)
+        self.button_quick_lock.setEnabled(self.is_unlocked and not self.is_suspended and
+                                          read_luks_uuid(self.encrypted_container) is not None)
+        self.button_perf_flags.setEnabled(not self.is_suspended)
+        self.button_mount_profile.setEnabled(not self.is_suspended)
+        self.button_compact.setEnabled(self.is_unlocked and not self.is_suspended and not self.get_read_only())
+        # the access mode can only change while the container is closed
+        self.checkbox_read_only.setEnabled(not self.is_unlocked)
+        self.start_pool_fill()
 
     def disable_ui(self, reason):
         """ Disable buttons and display waiting message
@@ -366,3 +530,194 @@ class MainWindow(QMainWindow):
         self.is_waiting_for_worker = True
         self.button_toggle_status.setText(reason)
         self.button_toggle_status.setEnabled(False)
+        self.button_quick_lock.setEnabled(False)
+        self.button_perf_flags.setEnabled(False)
+        self.button_mount_profile.setEnabled(False)
+        self.button_compact.setEnabled(False)
+        self.checkbox_read_only.setEnabled(False)
+
+    def show_timings(self):
+        """ Triggered by the timings button: measures the read throughput of an unlocked container
+            and shows the phases of the last open/close of this container """
+        if self.is_waiting_for_worker:
+            return
+        if self.is_unlocked and not self.is_suspended:
+            self.when_worker_ready(self.do_read_benchmark)
+        else:
+            self.on_read_benchmark(None, error=False)
+
+    def do_read_benchmark(self):
+        """ Measures the read throughput in the current access mode, to compare read-only and read-write """
+        self.disable_ui(_('Measuring read speed ..'))
+        self.worker.execute(command={'type': 'request',
+                                     'msg': 'read_benchmark',
+                                     'device_name': self.luks_device_name,
+                                     'container_path': self.encrypted_container
+                                     },
+                            success_callback=lambda msg: self.on_read_benchmark(msg, error=False),
+                            error_callback=lambda msg: self.on_read_benchmark(msg, error=True))
+
+    def on_read_benchmark(self, message, error):
+        """ Callback after the worker measured the read throughput, shows the timings
+            :param message: Contains an error description if error=True, otherwise the access mode and rate.
+                            None if nothing got measured
+            :type message: str or dict or None
+            :param error: Error during the measurement
+            :type error: bool
+        """
+        if error:
+            show_alert(self, message)
+        elif message is not None:
+            try:
+                remember_read_throughput(self.encrypted_container, message['read_only'], message['rate'])
+            except (IOError, OSError):
+                pass  # only used for display
+        show_info(self, describe_timing_history(self.encrypted_container) or
+                  _('Nothing measured yet,\nunlock or close the container first'), _('Timings'))
+        if message is not None:
+            self.enable_ui()
+
+    def compact(self):
+        """ Triggered by the compact button """
+        if not self.is_waiting_for_worker:
+            self.when_worker_ready(self.do_compact)
+
+    def do_compact(self):
+        """ Trims the filesystem of the unlocked container, which punches holes into the container file
+            for the unused blocks if discards are allowed """
+        self.disable_ui(_('Compacting ..'))
+        self.worker.execute(command={'type': 'request',
+                                     'msg': 'compact',
+                                     'device_name': self.luks_device_name,
+                                     'container_path': self.encrypted_container
+                                     },
+                            success_callback=lambda msg: self.on_compacted(msg, error=False),
+                            error_callback=lambda msg: self.on_compacted(msg, error=True))
+
+    def on_compacted(self, message, error):
+        """ Callback after the worker compacted the container
+            :param message: Contains an error description if error=True,
+                            otherwise the apparent size and the allocated space before and after in bytes
+            :type message: str or dict
+            :param error: Error during compacting
+            :type error: bool
+        """
+        if error:
+            show_alert(self, message)
+        else:
+            show_info(self, _('{freed} MB given back to the disk in {seconds} s').format(
+                freed=max(message['allocated_before'] - message['allocated'], 0) // 1024 // 1024,
+                seconds='{0:.1f}'.format(message['elapsed'])) + '<br>' + describe_allocation(message), _('Compact'))
+        self.enable_ui()
+
+    def get_mount_profile(self):
+        """ :returns: The mount profile chosen for this container, None if never chosen
+            :rtype: str or None
+        """
+        return get_container_settings(self.encrypted_container).get('mount_profile')
+
+    def show_mount_profile(self):
+        """ Triggered by the mount options button """
+        if not self.is_waiting_for_worker:
+            self.when_worker_ready(self.do_show_mount_profile)
+
+    def do_show_mount_profile(self):
+        """ Lets the user choose the mount profile, remembered for the next unlock. The profiles can be compared
+            while the container is unlocked and mounted read-write """
+        self.is_waiting_for_worker = True
+        can_compare = self.is_unlocked and not self.get_read_only()
+        dialog = MountProfileDialog(self, self.get_mount_profile(),
+                                    self.worker if can_compare else None,
+                                    self.luks_device_name, self.encrypted_container)
+        if dialog.exec_() == QDialog.Accepted:
+            try:
+                set_container_settings(self.encrypted_container, mount_profile=dialog.get_mount_profile())
+            except (IOError, OSError) as error:
+                show_alert(self, str(error))
+        self.enable_ui()
+
+    def get_read_only(self):
+        """ :returns: The container gets opened read-only
+            :rtype: bool
+        """
+        return bool(get_container_settings(self.encrypted_container).get('read_only', False))
+
+    def set_read_only(self, read_only):
+        """ Triggered by the read-only checkbox: remembered for the next unlock
+            :param read_only: Open the container read-only
+            :type read_only: bool
+        """
+        try:
+            set_container_settings(self.encrypted_container, read_only=read_only)
+        except (IOError, OSError) as error:
+            show_alert(self, str(error))
+
+    def get_perf_flags(self):
+        """ :returns: The dm-crypt performance flags chosen for this container, None if never chosen
+            :rtype: list of str or None
+        """
+        return get_container_settings(self.encrypted_container).get('perf_flags')
+
+    def show_perf_flags(self):
+        """ Triggered by the dm-crypt options button or tray entry """
+        if not self.is_waiting_for_worker and not self.is_suspended:
+            self.when_worker_ready(self.do_show_perf_flags)
+
+    def do_show_perf_flags(self):
+        """ Lets the user choose the dm-crypt performance flags: applied right away if unlocked,
+            remembered for the next unlock in any case """
+        self.is_waiting_for_worker = True
+        dialog = PerformanceDialog(self, self.get_perf_flags(),
+                                   self.worker if self.is_unlocked and not self.is_suspended else None,
+                                   self.luks_device_name, self.encrypted_container)
+        if dialog.exec_() == QDialog.Accepted:
+            try:
+                set_container_settings(self.encrypted_container, perf_flags=dialog.get_perf_flags())
+            except (IOError, OSError) as error:
+                show_alert(self, str(error))
+        self.enable_ui()
+
+    def when_worker_ready(self, action):
+        """ Runs a user action right away or after interrupting a running pool fill
+            :param action: The function to be called once the worker is available
+            :type action: function
+        """
+        if self.is_filling_pool:
+            self.pending_action = action
+            self.button_toggle_status.setEnabled(False)
+            self.worker.interrupt()
+        else:
+            action()
+
+    def start_pool_fill(self):
+        """ Fill missing container files of the configured pool in the background """
+        if self.pool is None or self.is_filling_pool or not self.pool.missing():
+            return
+        try:
+            os.makedirs(self.pool.directory, mode=0o700, exist_ok=True)
+        except OSError as ose:
+            show_alert(self, str(ose))
+            self.pool = None
+            return
+        self.is_filling_pool = True
+        command = {'type': 'request', 'msg': 'pool_fill'}
+        command.update(self.pool.to_command())
+        self.worker.execute(command=command,
+                            success_callback=self.on_pool_filled,
+                            error_callback=lambda msg: self.on_pool_filled(msg, error=True))
+
+    def on_pool_filled(self, message, error=False):
+        """ Callback after the worker finished or interrupted filling the pool
+            :param message: Contains an error description if error=True, otherwise `success` or `interrupted`
+            :type message: str
+            :param error: Error while filling the pool -> disable pool for this session
+            :type error: bool
+        """
+        self.is_filling_pool = False
+        if error:
+            self.pool = None
+            show_alert(self, message)
+        if self.pending_action is not None:
+            action, self.pending_action = self.pending_action, None
+            self.button_toggle_status.setEnabled(True)
+            action()
@@ -0,0 +1,239 @@
+"""
+Key derivation profiles for new LUKS2 containers: explicit iteration time, Argon2 memory
+and parallelism instead of the cryptsetup defaults, which depend on the machine a container
+gets created on. And a prediction how long unlocking an existing container will take
+on this machine, based on the PBKDF parameters stored in its header.
+
+luckyLUKS Copyright (c) 2014,2015,2022 Jasper van Hoorn (muzius@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details. <http://www.gnu.org/licenses/>
+"""
+
+import os
+import re
+import subprocess
+
+from luckyLUKS.luksheader import LuksHeaderException, read_header
+
+MiB = 1024 * 1024
+# cryptsetup limits argon2 memory to 4GiB
+ARGON2_MAX_MEMORY = 4096 * MiB
+ARGON2_MIN_MEMORY = 32 * MiB
+# argon2 may use at most this fraction of the memory available when creating the container
+MEMORY_SHARE = 0.5
+
+BENCHMARK_ARGON2 = re.compile(r'^(argon2id|argon2i)\s+(\d+) iterations, (\d+) memory, (\d+) parallel.*'
+                              r'requested (\d+) ms', re.MULTILINE)
+BENCHMARK_PBKDF2 = re.compile(r'^PBKDF2-(\S+)\s+(\d+) iterations per second', re.MULTILINE)
+
+
+class PbkdfProfile():
+
+    """ A named set of parameters for the key derivation of new LUKS2 keyslots.
+        Memory and parallelism are upper bounds: they get reduced to what the machine can offer.
+    """
+
+    def __init__(self, name, iter_time, memory, parallel, description):
+        """ :param name: Identifies the profile in the UI, in manifests and create commands
+            :type name: str
+            :param iter_time: Time to spend on the key derivation when unlocking, in milliseconds
+            :type iter_time: int
+            :param memory: Argon2 memory cost in bytes
+            :type memory: int
+            :param parallel: Argon2 threads
+            :type parallel: int
+            :param description: Short description shown in the UI
+            :type description: str
+        """
+        self.name = name
+        self.iter_time = iter_time
+        self.memory = memory
+        self.parallel = parallel
+        self.description = description
+
+    def get_parameters(self, available_memory=None, cpus=None):
+        """ Fits memory and parallelism of the profile to this machine, argon2 must never force swapping
+            :param available_memory: Available memory in bytes, looked up if not given
+            :type available_memory: int or None
+            :param cpus: Number of usable cpus, looked up if not given
+            :type cpus: int or None
+            :returns: iter_time in ms, memory in bytes, parallel threads and if the memory had to be reduced
+            :rtype: dict
+        """
+        if available_memory is None:
+            available_memory = get_available_memory()
+        if cpus is None:
+            cpus = get_cpu_count()
+        memory = min(self.memory, ARGON2_MAX_MEMORY)
+        if available_memory:
+            memory = min(memory, max(ARGON2_MIN_MEMORY, int(available_memory * MEMORY_SHARE) // MiB * MiB))
+        return {'iter_time': self.iter_time,
+                'memory': memory,
+                'parallel': max(1, min(self.parallel, cpus)),
+                'reduced': memory < self.memory}
+
+    def cryptsetup_options(self, parameters):
+        """ :param parameters: The fitted parameters, see get_parameters()
+            :type parameters: dict
+            :returns: Options for cryptsetup luksFormat
+            :rtype: list of str
+        """
+        return ['--pbkdf', 'argon2id',
+                '--iter-time', str(parameters['iter_time']),
+                '--pbkdf-memory', str(parameters['memory'] // 1024),  # KiB
+                '--pbkdf-parallel', str(parameters['parallel'])]
+
+
+PBKDF_PROFILES = [
+    PbkdfProfile('fast', 1000, 256 * MiB, 2,
+                 _('Unlocks in about a second, also on computers with little memory')),
+    PbkdfProfile('balanced', 2000, 1024 * MiB, 4,
+                 _('Unlocks in about two seconds, using up to 1GB of memory')),
+    PbkdfProfile('paranoid', 5000, 4096 * MiB, 4,
+                 _('Hardest to brute-force: unlocking takes about five seconds and up to 4GB of memory')),
+]
+DEFAULT_PBKDF_PROFILE = 'balanced'
+
+
+def get_pbkdf_profile(name):
+    """ Looks up a key derivation profile by name
+        :param name: The name of the profile
+        :type name: str
+        :returns: The profile or None if there is no profile with this name
+        :rtype: :class:`PbkdfProfile` or None
+    """
+    for profile in PBKDF_PROFILES:
+        if profile.name == name:
+            return profile
+    return None
+
+
+def get_available_memory():
+    """ :returns: Memory available without swapping in bytes (MemAvailable), 0 if unknown
+        :rtype: int
+    """
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def get_cpu_count():
+    """ :returns: Number of cpus this process may run on
+        :rtype: int
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def read_keyslots(path):
+    """ Reads the PBKDF parameters of the active keyslots from the header of a LUKS container
+        :param path: The container file
+        :type path: str
+        :returns: keyslot number, priority, pbkdf, and for argon2 time_cost, memory in bytes and parallel,
+                  for pbkdf2 hash and iterations. Empty if not a LUKS container
+        :rtype: list of dicts
+        :raises: OSError, LuksHeaderException
+    """
+    header = read_header(path)
+    return header['keyslots'] if header is not None else []
+
+
+_benchmarks = {}
+
+
+def benchmark_keyslot(keyslot):
+    """ Measures how fast this machine derives a key with the parameters of a keyslot (cached per process)
+        :param keyslot: PBKDF parameters as returned by read_keyslots()
+        :type keyslot: dict
+        :returns: argon2: iterations, memory and parallel doable in ms; pbkdf2: iterations per second
+        :rtype: dict
+        :raises: OSError, subprocess.CalledProcessError, ValueError
+    """
+    if keyslot['pbkdf'] == 'pbkdf2':
+        cmd = ['cryptsetup', 'benchmark', '--pbkdf', 'pbkdf2', '--hash', keyslot.get('hash') or 'sha256']
+    else:
+        cmd = ['cryptsetup', 'benchmark', '--pbkdf', keyslot['pbkdf'],
+               '--pbkdf-memory', str(keyslot['memory'] // 1024), '--pbkdf-parallel', str(keyslot['parallel']),
+               '--iter-time', '1000']
+    key = tuple(cmd)
+    if key not in _benchmarks:
+        output = subprocess.check_output(cmd, stderr=subprocess.STDOUT, universal_newlines=True)
+        if keyslot['pbkdf'] == 'pbkdf2':
+            match = BENCHMARK_PBKDF2.search(output)
+            if match is None:
+                raise ValueError(output)
+            _benchmarks[key] = {'iterations_per_second': int(match.group(2))}
+        else:
+            match = BENCHMARK_ARGON2.search(output)
+            if match is None:
+                raise ValueError(output)
+            _benchmarks[key] = {'iterations': int(match.group(2)), 'memory': int(match.group(3)) * 1024,
+                                'parallel': int(match.group(4)), 'ms': int(match.group(5))}
+    return _benchmarks[key]
+
+
+def predict_unlock_time(keyslot):
+    """ Estimates how long deriving the key of a keyslot takes on this machine
+        :param keyslot: PBKDF parameters as returned by read_keyslots()
+        :type keyslot: dict
+        :returns: Seconds
+        :rtype: float
+        :raises: OSError, subprocess.CalledProcessError, ValueError
+    """
+    benchmark = benchmark_keyslot(keyslot)
+    if keyslot['pbkdf'] == 'pbkdf2':
+        return keyslot['iterations'] / max(benchmark['iterations_per_second'], 1)
+    # argon2 cost grows linearly with iterations and memory, cryptsetup may lower both to fit the requested time
+    cost = keyslot['time_cost'] * keyslot['memory']
+    benchmark_cost = benchmark['iterations'] * benchmark['memory']
+    return cost / max(benchmark_cost, 1) * benchmark['ms'] / 1000
+
+
+def describe_unlock_time(path):
+    """ Predicted unlock time of a container for display
+        :param path: The container file
+        :type path: str
+        :returns: A short description or None if the container is not a LUKS container
+        :rtype: str or None
+    """
+    try:
+        keyslots = read_keyslots(path)
+    except (OSError, LuksHeaderException):
+        return None
+    if not keyslots:
+        return None
+    keyslot = keyslots[0]
+    try:
+        seconds = predict_unlock_time(keyslot)
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+    if keyslot['pbkdf'] == 'pbkdf2':
+        # L10n: predicted time to unlock a container, followed by the key derivation parameters
+        description = _('Unlocking takes about {seconds}s ({pbkdf}, {iterations} iterations)').format(
+            seconds='{0:.1f}'.format(seconds), pbkdf='pbkdf2-' + (keyslot.get('hash') or 'sha256'),
+            iterations=keyslot['iterations'])
+    else:
+        # L10n: predicted time to unlock a container, followed by the key derivation parameters
+        description = _('Unlocking takes about {seconds}s ({pbkdf}, {memory} MB, {parallel} threads)').format(
+            seconds='{0:.1f}'.format(seconds), pbkdf=keyslot['pbkdf'], memory=keyslot['memory'] // MiB,
+            parallel=keyslot['parallel'])
+        available_memory = get_available_memory()
+        if available_memory and keyslot['memory'] > available_memory:
+            description += '\n' + _('Warning: needs {memory} MB of memory, only {available} MB available').format(
+                memory=keyslot['memory'] // MiB, available=available_memory // MiB)
+    return description
@@ -0,0 +1,300 @@
+"""
+This module contains a dialog to choose the dm-crypt performance flags of a container
+and to compare the I/O latency of an unlocked container with and without the kernel workqueues,
+and a dialog to choose the mount profile of a container and compare the profiles on a mounted container
+
+luckyLUKS Copyright (c) 2014,2015,2022 Jasper van Hoorn (muzius@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details. <http://www.gnu.org/licenses/>
+"""
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QDialogButtonBox, QLabel, QCheckBox, QPushButton, QComboBox
+
+from luckyLUKS.dmcrypt import PERF_FLAG_NAMES, get_flag_descriptions
+from luckyLUKS.fsprofiles import MOUNT_PROFILES, DEFAULT_MOUNT_PROFILE, get_mount_profile
+from luckyLUKS.utilsUI import show_alert
+
+
+class PerformanceDialog(QDialog):
+
+    """ Shows a checkbox for each dm-crypt performance flag. Without a worker the dialog only
+        collects the flags (eg for a new container), with a worker the flags get applied to the
+        unlocked container right away and the latency benchmark is available.
+    """
+
+    def __init__(self, parent, perf_flags=None, worker=None, device_name=None, container_path=None):
+        """ :param parent: The parent window/dialog used to enable modal behaviour
+            :type parent: :class:`PyQt5.QtGui.QWidget`
+            :param perf_flags: The flags to preselect
+            :type perf_flags: list of str or None
+            :param worker: Communication handler with the worker process, only if the container is unlocked
+            :type worker: :class:`utils.WorkerMonitor` or None
+            :param device_name: The device mapper name of the unlocked container
+            :type device_name: str or None
+            :param container_path: The path of the unlocked container file
+            :type container_path: str or None
+        """
+        super().__init__(parent, Qt.WindowCloseButtonHint | Qt.WindowTitleHint)
+        self.setWindowTitle(_('dm-crypt options'))
+        self.worker = worker
+        self.device_name = device_name
+        self.container_path = container_path
+        self.is_busy = False
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(15, 10, 15, 10)
+        header = QLabel(_('<b>dm-crypt options</b>\n'
+                          'LUKS2 containers store them in their header,\n'
+                          'other containers get them on every unlock'))
+        header.setContentsMargins(0, 0, 0, 10)
+        layout.addWidget(header)
+
+        descriptions = get_flag_descriptions()
+        self.checkboxes = {}
+        for flag in PERF_FLAG_NAMES:
+            checkbox = QCheckBox(flag)
+            checkbox.setChecked(flag in (perf_flags or []))
+            checkbox.setToolTip(descriptions[flag])
+            layout.addWidget(checkbox)
+            description = QLabel(descriptions[flag])
+            description.setIndent(25)
+            description.setWordWrap(True)
+            layout.addWidget(description)
+            self.checkboxes[flag] = checkbox
+
+        self.button_benchmark = QPushButton(_('Measure latency'))
+        self.button_benchmark.setToolTip(_('Compare random 4K reads and synchronous writes\n'
+                                           'with and without the kernel workqueues'))
+        self.button_benchmark.clicked.connect(self.on_benchmark)
+        self.button_benchmark.setEnabled(worker is not None)
+        layout.addWidget(self.button_benchmark)
+        self.benchmark_results = QLabel('' if worker is not None else
+                                        _('Unlock the container to measure its latency'))
+        layout.addWidget(self.benchmark_results)
+
+        self.buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, parent=self)
+        self.buttons.button(QDialogButtonBox.Ok).setText(_('Apply') if worker is not None else _('OK'))
+        self.buttons.accepted.connect(self.on_accepted)
+        self.buttons.rejected.connect(self.reject)
+        layout.addWidget(self.buttons)
+        self.setLayout(layout)
+
+    def get_perf_flags(self):
+        """ :returns: The checked flags
+            :rtype: list of str
+        """
+        return [flag for flag in PERF_FLAG_NAMES if self.checkboxes[flag].isChecked()]
+
+    def set_busy(self, is_busy):
+        """ Blocks the dialog while waiting for the worker
+            :param is_busy: Waiting for the worker
+            :type is_busy: bool
+        """
+        self.is_busy = is_busy
+        self.buttons.setEnabled(not is_busy)
+        self.button_benchmark.setEnabled(not is_busy and self.worker is not None)
+
+    def on_accepted(self):
+        """ Event handler OK: applies the flags to the unlocked container or just closes the dialog """
+        if self.worker is None:
+            self.accept()
+            return
+        self.set_busy(True)
+        self.worker.execute(command={'type': 'request',
+                                     'msg': 'perf_flags',
+                                     'device_name': self.device_name,
+                                     'container_path': self.container_path,
+                                     'perf_flags': self.get_perf_flags()
+                                     },
+                            success_callback=lambda active_flags: self.accept(),
+                            error_callback=self.on_apply_failed)
+
+    def on_apply_failed(self, error_message):
+        """ The flags could not be changed without closing the container, they get used on the next unlock """
+        self.set_busy(False)
+        show_alert(self, error_message)
+        self.accept()
+
+    def on_benchmark(self):
+        """ Event handler measure latency """
+        self.set_busy(True)
+        self.benchmark_results.setText(_('Measuring ..'))
+        self.worker.execute(command={'type': 'request',
+                                     'msg': 'perf_benchmark',
+                                     'device_name': self.device_name,
+                                     'container_path': self.container_path
+                                     },
+                            success_callback=self.on_benchmark_done,
+                            error_callback=self.on_benchmark_failed)
+
+    def on_benchmark_done(self, results):
+        """ Shows median and 99th percentile latency of each configuration
+            :param results: Measurements as returned by the worker command perf_benchmark
+            :type results: list of dicts
+        """
+        self.set_busy(False)
+        lines = []
+        for result in results:
+            # L10n: configuration measured by the latency benchmark
+            config = _('with workqueues') if result['config'] == 'workqueue' else _('without workqueues')
+            line = _('{config}: read {median} / {p99} µs').format(
+                config=config, median=int(result['read']['median'] * 1e6), p99=int(result['read']['p99'] * 1e6))
+            if 'write' in result:
+                line += _(', write {median} / {p99} µs').format(
+                    median=int(result['write']['median'] * 1e6), p99=int(result['write']['p99'] * 1e6))
+            lines.append(line)
+        lines.append(_('(median / 99th percentile)'))
+        self.benchmark_results.setText('\n'.join(lines))
+
+    def on_benchmark_failed(self, error_message):
+        """ Error-Callback of the latency benchmark """
+        self.set_busy(False)
+        self.benchmark_results.setText('')
+        show_alert(self, error_message)
+
+    def reject(self):
+        """ Event handler cancel: block while waiting for the worker """
+        if not self.is_busy:
+            super().reject()
+
+    def closeEvent(self, event):
+        """ Event handler close: block while waiting for the worker """
+        if self.is_busy:
+            event.ignore()
+
+
+class MountProfileDialog(QDialog):
+
+    """ Lets the user choose the mount profile of a container, used on the next unlock.
+        With a worker the profiles can be compared on the mounted container with a metadata-heavy workload.
+    """
+
+    def __init__(self, parent, mount_profile=None, worker=None, device_name=None, container_path=None):
+        """ :param parent: The parent window/dialog used to enable modal behaviour
+            :type parent: :class:`PyQt5.QtGui.QWidget`
+            :param mount_profile: The profile to preselect, None for the default
+            :type mount_profile: str or None
+            :param worker: Communication handler with the worker process, only if the container is unlocked
+            :type worker: :class:`utils.WorkerMonitor` or None
+            :param device_name: The device mapper name of the unlocked container
+            :type device_name: str or None
+            :param container_path: The path of the unlocked container file
+            :type container_path: str or None
+        """
+        super().__init__(parent, Qt.WindowCloseButtonHint | Qt.WindowTitleHint)
+        self.setWindowTitle(_('Mount options'))
+        self.worker = worker
+        self.device_name = device_name
+        self.container_path = container_path
+        self.current_profile = mount_profile
+        self.is_busy = False
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(15, 10, 15, 10)
+        header = QLabel(_('<b>Mount options</b>\n'
+                          'Added to the options of the filesystem on the next unlock,\n'
+                          'nosuid and nodev are always used'))
+        header.setContentsMargins(0, 0, 0, 10)
+        layout.addWidget(header)
+
+        self.profiles = QComboBox()
+        for profile in MOUNT_PROFILES:
+            self.profiles.addItem(profile.name, profile.name)
+            self.profiles.setItemData(self.profiles.count() - 1, profile.description, Qt.ToolTipRole)
+        index = self.profiles.findData(mount_profile or DEFAULT_MOUNT_PROFILE)
+        self.profiles.setCurrentIndex(max(index, 0))
+        layout.addWidget(self.profiles)
+        self.description = QLabel('')
+        self.description.setWordWrap(True)
+        layout.addWidget(self.description)
+        self.profiles.currentIndexChanged.connect(self.display_description)
+        self.display_description()
+
+        self.button_benchmark = QPushButton(_('Compare profiles'))
+        self.button_benchmark.setToolTip(_('Create, read, stat, rename and delete many small files\n'
+                                           'on the mounted container with the options of each profile'))
+        self.button_benchmark.clicked.connect(self.on_benchmark)
+        self.button_benchmark.setEnabled(worker is not None)
+        layout.addWidget(self.button_benchmark)
+        self.benchmark_results = QLabel('' if worker is not None else
+                                        _('Unlock and mount the container to compare the profiles'))
+        layout.addWidget(self.benchmark_results)
+
+        self.buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, parent=self)
+        self.buttons.accepted.connect(self.accept)
+        self.buttons.rejected.connect(self.reject)
+        layout.addWidget(self.buttons)
+        self.setLayout(layout)
+
+    def get_mount_profile(self):
+        """ :returns: The name of the chosen profile
+            :rtype: str
+        """
+        return self.profiles.currentData()
+
+    def display_description(self):
+        """ Shows the description of the chosen profile """
+        self.description.setText(get_mount_profile(self.get_mount_profile()).description)
+
+    def set_busy(self, is_busy):
+        """ Blocks the dialog while waiting for the worker
+            :param is_busy: Waiting for the worker
+            :type is_busy: bool
+        """
+        self.is_busy = is_busy
+        self.buttons.setEnabled(not is_busy)
+        self.button_benchmark.setEnabled(not is_busy and self.worker is not None)
+
+    def on_benchmark(self):
+        """ Event handler compare profiles """
+        self.set_busy(True)
+        self.benchmark_results.setText(_('Measuring ..'))
+        self.worker.execute(command={'type': 'request',
+                                     'msg': 'mount_benchmark',
+                                     'device_name': self.device_name,
+                                     'container_path': self.container_path,
+                                     'mount_profile': self.current_profile
+                                     },
+                            success_callback=self.on_benchmark_done,
+                            error_callback=self.on_benchmark_failed)
+
+    def on_benchmark_done(self, results):
+        """ Shows the duration of the workload with each profile
+            :param results: Measurements as returned by the worker command mount_benchmark
+            :type results: list of dicts
+        """
+        self.set_busy(False)
+        lines = []
+        for result in results:
+            # L10n: mount profile, duration of the metadata workload and its steps
+            lines.append(_('{profile}: {total}s ({steps})').format(
+                profile=result['profile'],
+                total='{0:.2f}'.format(sum(elapsed for __, elapsed in result['timings'])),
+                steps=', '.join('{step} {elapsed}s'.format(step=step, elapsed='{0:.2f}'.format(elapsed))
+                                for step, elapsed in result['timings'])))
+        self.benchmark_results.setText('\n'.join(lines))
+
+    def on_benchmark_failed(self, error_message):
+        """ Error-Callback of the mount profile benchmark """
+        self.set_busy(False)
+        self.benchmark_results.setText('')
+        show_alert(self, error_message)
+
+    def reject(self):
+        """ Event handler cancel: block while waiting for the worker """
+        if not self.is_busy:
+            super().reject()
+
+    def closeEvent(self, event):
+        """ Event handler close: block while waiting for the worker """
+        if self.is_busy:
+            event.ignore()
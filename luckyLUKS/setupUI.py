@@ -29,8 +29,19 @@ from PyQt5.QtWidgets import QDialog, QVBoxLayout, QTabWidget, QDialogButtonBox,
     QProgressBar, QLayout
 
 from luckyLUKS.unlockUI import FormatContainerDialog, UnlockContainerDialog, UserInputError
-from luckyLUKS.utilsUI import QExpander, HelpDialog, show_info, show_alert
+from luckyLUKS.utilsUI import QExpander, HelpDialog, show_info, show_alert, format_duration
 from luckyLUKS.utils import is_installed
+from luckyLUKS.containerfile import FillJournal, JOURNAL_SUFFIX, load_config, save_config, \
+    get_container_settings, set_container_settings
+from luckyLUKS.performanceUI import PerformanceDialog
+from luckyLUKS.dmcrypt import SECTOR_SIZES, validate_flags
+from luckyLUKS.luksheader import LuksHeaderException, describe_header, read_header
+from luckyLUKS.fsprofiles import FILESYSTEM_PROFILES, MOUNT_PROFILES, DEFAULT_MOUNT_PROFILE
+from luckyLUKS.pbkdf import PBKDF_PROFILES, DEFAULT_PBKDF_PROFILE, describe_unlock_time
+from luckyLUKS.ciphers import CIPHER_CANDIDATES, load_benchmarks, run_benchmarks, choose_cipher, get_speed, \
+    has_aes_instructions
+from luckyLUKS.storageprofile import load_storage_profile, save_storage_profile, estimate_fill_time, \
+    get_warnings, format_profile
 
 
 class SetupDialog(QDialog):
@@ -84,37 +95,57 @@ class SetupDialog(QDialog):
         unlock_grid.addWidget(label, 2, 0)
         self.unlock_device_name = QLineEdit()
         unlock_grid.addWidget(self.unlock_device_name, 2, 1)
+        # predicted unlock time from the key derivation parameters in the container header
+        self.unlock_time_info = QLabel('')
+        self.unlock_time_info.setIndent(5)
+        unlock_grid.addWidget(self.unlock_time_info, 3, 0, 1, 3)
+        self.unlock_time_thread = None
+        self.unlock_time_path = None  # container the running benchmark predicts the unlock time of
+        self.unlock_header_info = ''
+        self.unlock_container_file.editingFinished.connect(self.display_unlock_time)
         # advanced settings
         a_settings = QExpander(_('Advanced'), self, False)
-        unlock_grid.addWidget(a_settings, 3, 0, 1, 3)
+        unlock_grid.addWidget(a_settings, 4, 0, 1, 3)
 
         label = QLabel(_('key file'))
         label.setIndent(5)
-        unlock_grid.addWidget(label, 4, 0)
+        unlock_grid.addWidget(label, 5, 0)
         self.unlock_keyfile = QLineEdit()
-        unlock_grid.addWidget(self.unlock_keyfile, 4, 1)
+        unlock_grid.addWidget(self.unlock_keyfile, 5, 1)
         button_choose_uKeyfile = QPushButton(style.standardIcon(QStyle.SP_DialogOpenButton), '')
         button_choose_uKeyfile.setToolTip(_('choose keyfile'))
-        unlock_grid.addWidget(button_choose_uKeyfile, 4, 2)
+        unlock_grid.addWidget(button_choose_uKeyfile, 5, 2)
         button_choose_uKeyfile.clicked.connect(lambda: self.on_select_keyfile_clicked('Unlock'))
-        a_settings.addWidgets([unlock_grid.itemAtPosition(4, column).widget() for column in range(0, 3)])
+        a_settings.addWidgets([unlock_grid.itemAtPosition(5, column).widget() for column in range(0, 3)])
 
         label = QLabel(_('mount point'))
         label.setIndent(5)
-        unlock_grid.addWidget(label, 5, 0)
+        unlock_grid.addWidget(label, 6, 0)
         self.unlock_mountpoint = QLineEdit()
-        unlock_grid.addWidget(self.unlock_mountpoint, 5, 1)
+        unlock_grid.addWidget(self.unlock_mountpoint, 6, 1)
         button_choose_mountpoint = QPushButton(style.standardIcon(QStyle.SP_DialogOpenButton), '')
         button_choose_mountpoint.setToolTip(_('choose folder'))
-        unlock_grid.addWidget(button_choose_mountpoint, 5, 2)
+        unlock_grid.addWidget(button_choose_mountpoint, 6, 2)
         button_choose_mountpoint.clicked.connect(self.on_select_mountpoint_clicked)
-        a_settings.addWidgets([unlock_grid.itemAtPosition(5, column).widget() for column in range(0, 3)])
+        a_settings.addWidgets([unlock_grid.itemAtPosition(6, column).widget() for column in range(0, 3)])
 
-        unlock_grid.setRowStretch(6, 1)
-        unlock_grid.setRowMinimumHeight(6, 10)
+        label = QLabel(_('mount options'))
+        label.setIndent(5)
+        unlock_grid.addWidget(label, 7, 0)
+        self.unlock_mount_profile = QComboBox()
+        for profile in MOUNT_PROFILES:
+            self.unlock_mount_profile.addItem(profile.name, profile.name)
+            self.unlock_mount_profile.setItemData(self.unlock_mount_profile.count() - 1,
+                                                  profile.description, Qt.ToolTipRole)
+        self.unlock_mount_profile.setCurrentIndex(self.unlock_mount_profile.findData(DEFAULT_MOUNT_PROFILE))
+        unlock_grid.addWidget(self.unlock_mount_profile, 7, 1)
+        a_settings.addWidgets([unlock_grid.itemAtPosition(7, column).widget() for column in range(0, 2)])
+
+        unlock_grid.setRowStretch(8, 1)
+        unlock_grid.setRowMinimumHeight(8, 10)
         button_help_unlock = QPushButton(style.standardIcon(QStyle.SP_DialogHelpButton), _('Help'))
         button_help_unlock.clicked.connect(self.show_help_unlock)
-        unlock_grid.addWidget(button_help_unlock, 7, 2)
+        unlock_grid.addWidget(button_help_unlock, 9, 2)
 
         unlock_tab = QWidget()
         unlock_tab.setLayout(unlock_grid)
@@ -158,56 +189,167 @@ class SetupDialog(QDialog):
 
         self.create_quickformat = QCheckBox(_('Quickformat'))
         create_grid.addWidget(self.create_quickformat, 4, 1)
+        self.create_measure_storage = QPushButton(_('Measure speed'))
+        self.create_measure_storage.setToolTip(_('Measure the storage the container will be created on,\n'
+                                                 'to estimate how long initializing it will take'))
+        self.create_measure_storage.clicked.connect(self.on_measure_storage)
+        create_grid.addWidget(self.create_measure_storage, 4, 2)
+        # estimated creation time and warnings about slow targets from the storage profile
+        self.create_storage_info = QLabel('')
+        self.create_storage_info.setWordWrap(True)
+        self.create_storage_info.setIndent(5)
+        create_grid.addWidget(self.create_storage_info, 5, 0, 1, 3)
+        self.create_storage_thread = None
+        self.create_container_file.textChanged.connect(self.display_storage_estimate)
+        self.create_container_size.valueChanged.connect(self.display_storage_estimate)
+        self.create_size_unit.currentIndexChanged.connect(self.display_storage_estimate)
+        self.create_quickformat.toggled.connect(self.display_storage_estimate)
 
         # advanced settings
         a_settings = QExpander(_('Advanced'), self, False)
-        create_grid.addWidget(a_settings, 5, 0, 1, 3)
+        create_grid.addWidget(a_settings, 6, 0, 1, 3)
 
         label = QLabel(_('key file'))
         label.setIndent(5)
-        create_grid.addWidget(label, 6, 0)
+        create_grid.addWidget(label, 7, 0)
         self.create_keyfile = QLineEdit()
-        create_grid.addWidget(self.create_keyfile, 6, 1)
+        create_grid.addWidget(self.create_keyfile, 7, 1)
         button_choose_cKeyfile = QPushButton(style.standardIcon(QStyle.SP_DialogOpenButton), '')
         button_choose_cKeyfile.setToolTip(_('choose keyfile'))
-        create_grid.addWidget(button_choose_cKeyfile, 6, 2)
+        create_grid.addWidget(button_choose_cKeyfile, 7, 2)
         button_choose_cKeyfile.clicked.connect(lambda: self.on_select_keyfile_clicked('Create'))
-        a_settings.addWidgets([create_grid.itemAtPosition(6, column).widget() for column in range(0, 3)])
+        a_settings.addWidgets([create_grid.itemAtPosition(7, column).widget() for column in range(0, 3)])
 
         button_create_keyfile = QPushButton(_('Create key file'))
         button_create_keyfile.clicked.connect(self.on_create_keyfile)
-        create_grid.addWidget(button_create_keyfile, 7, 1)
+        create_grid.addWidget(button_create_keyfile, 8, 1)
         a_settings.addWidgets([button_create_keyfile])
 
         label = QLabel(_('format'))
         label.setIndent(5)
-        create_grid.addWidget(label, 8, 0)
+        create_grid.addWidget(label, 9, 0)
         self.create_encryption_format = QComboBox()
         self.create_encryption_format.addItem('LUKS')
         self.create_encryption_format.addItem('TrueCrypt')
         if not is_installed('tcplay'):
             self.create_encryption_format.setEnabled(False)
         self.create_encryption_format.setCurrentIndex(0)
-        create_grid.addWidget(self.create_encryption_format, 8, 1)
-        a_settings.addWidgets([create_grid.itemAtPosition(8, column).widget() for column in range(0, 2)])
+        create_grid.addWidget(self.create_encryption_format, 9, 1)
+        self.create_perf_flags = []
+        button_perf_flags = QPushButton(_('dm-crypt options'))
+        button_perf_flags.setToolTip(_('Performance options of the encrypted device'))
+        button_perf_flags.clicked.connect(self.on_perf_flags_clicked)
+        create_grid.addWidget(button_perf_flags, 9, 2)
+        a_settings.addWidgets([create_grid.itemAtPosition(9, column).widget() for column in range(0, 3)])
+
+        label = QLabel(_('key derivation'))
+        label.setIndent(5)
+        create_grid.addWidget(label, 10, 0)
+        self.create_pbkdf_profile = QComboBox()
+        for profile in PBKDF_PROFILES:
+            self.create_pbkdf_profile.addItem(profile.name, profile.name)
+            self.create_pbkdf_profile.setItemData(self.create_pbkdf_profile.count() - 1,
+                                                  profile.description, Qt.ToolTipRole)
+        self.create_pbkdf_profile.setCurrentIndex(self.create_pbkdf_profile.findData(DEFAULT_PBKDF_PROFILE))
+        self.create_pbkdf_profile.setToolTip(_('Time and memory needed to unlock the container:\n'
+                                               'more makes guessing the passphrase harder'))
+        create_grid.addWidget(self.create_pbkdf_profile, 10, 1)
+        a_settings.addWidgets([create_grid.itemAtPosition(10, column).widget() for column in range(0, 2)])
+        # TrueCrypt containers use the fixed key derivation of tcplay
+        self.create_encryption_format.currentIndexChanged.connect(
+            lambda: self.create_pbkdf_profile.setEnabled(self.create_encryption_format.currentText() == 'LUKS'))
+
+        label = QLabel(_('cipher'))
+        label.setIndent(5)
+        create_grid.addWidget(label, 11, 0)
+        self.create_cipher = QComboBox()
+        for candidate in CIPHER_CANDIDATES:
+            self.create_cipher.addItem(candidate.name, candidate.name)
+            self.create_cipher.setItemData(self.create_cipher.count() - 1, candidate.description, Qt.ToolTipRole)
+        create_grid.addWidget(self.create_cipher, 11, 1)
+        self.create_cipher_benchmark = QPushButton(_('Benchmark'))
+        self.create_cipher_benchmark.setToolTip(_('Measure the speed of each cipher on this computer'))
+        self.create_cipher_benchmark.clicked.connect(self.on_benchmark_ciphers)
+        create_grid.addWidget(self.create_cipher_benchmark, 11, 2)
+        a_settings.addWidgets([create_grid.itemAtPosition(11, column).widget() for column in range(0, 3)])
+        self.create_cipher_thread = None
+        self.display_cipher_benchmarks(load_benchmarks())
+        # TrueCrypt containers use the fixed cipher of tcplay
+        self.create_encryption_format.currentIndexChanged.connect(
+            lambda: self.create_cipher.setEnabled(self.create_encryption_format.currentText() == 'LUKS'))
+
+        label = QLabel(_('sector size'))
+        label.setIndent(5)
+        create_grid.addWidget(label, 12, 0)
+        self.create_sector_size = QComboBox()
+        # L10n: encryption sector size chosen from the block size of the filesystem the container is stored on
+        self.create_sector_size.addItem(_('auto'), 0)
+        for sector_size in SECTOR_SIZES:
+            self.create_sector_size.addItem(_('{sector_size} bytes').format(sector_size=sector_size), sector_size)
+        self.create_sector_size.setToolTip(_('4096 byte sectors need less CPU time than 512 byte sectors,\n'
+                                             'auto uses them if the filesystem of the container allows it'))
+        create_grid.addWidget(self.create_sector_size, 12, 1)
+        self.create_sector_benchmark = QPushButton(_('Compare'))
+        self.create_sector_benchmark.setToolTip(_('Measure the throughput of both sector sizes\n'
+                                                  'with a small test container next to the new container'))
+        self.create_sector_benchmark.clicked.connect(self.on_benchmark_sector_sizes)
+        create_grid.addWidget(self.create_sector_benchmark, 12, 2)
+        a_settings.addWidgets([create_grid.itemAtPosition(12, column).widget() for column in range(0, 3)])
+        # TrueCrypt containers always use 512 byte sectors
+        self.create_encryption_format.currentIndexChanged.connect(
+            lambda: self.create_sector_size.setEnabled(self.create_encryption_format.currentText() == 'LUKS'))
 
         label = QLabel(_('filesystem'))
         label.setIndent(5)
-        create_grid.addWidget(label, 9, 0)
-        filesystems = ['ext4', 'ext2', 'ntfs']
+        create_grid.addWidget(label, 13, 0)
         self.create_filesystem_type = QComboBox()
-        for filesystem in filesystems:
-            if is_installed('mkfs.' + filesystem):
-                self.create_filesystem_type.addItem(filesystem)
+        for profile in FILESYSTEM_PROFILES:
+            if is_installed(profile.mkfs):
+                self.create_filesystem_type.addItem(profile.name)
+                self.create_filesystem_type.setItemData(self.create_filesystem_type.count() - 1,
+                                                        profile.description, Qt.ToolTipRole)
         self.create_filesystem_type.setCurrentIndex(0)
-        create_grid.addWidget(self.create_filesystem_type, 9, 1)
-        a_settings.addWidgets([create_grid.itemAtPosition(9, column).widget() for column in range(0, 2)])
+        create_grid.addWidget(self.create_filesystem_type, 13, 1)
+        a_settings.addWidgets([create_grid.itemAtPosition(13, column).widget() for column in range(0, 2)])
 
-        create_grid.setRowStretch(10, 1)
-        create_grid.setRowMinimumHeight(10, 10)
+        label = QLabel(_('I/O priority'))
+        label.setIndent(5)
+        create_grid.addWidget(label, 14, 0)
+        self.create_io_priority = QComboBox()
+        # L10n: I/O priority used to initialize a new container
+        self.create_io_priority.addItem(_('normal'), 'normal')
+        # L10n: I/O priority used to initialize a new container
+        self.create_io_priority.addItem(_('background'), 'background')
+        self.create_io_priority.setToolTip(_('Background: only use the disk while no other program needs it'))
+        create_grid.addWidget(self.create_io_priority, 14, 1)
+        self.create_rate_limit = QSpinBox()
+        self.create_rate_limit.setRange(0, 100000)
+        self.create_rate_limit.setSuffix(' MB/s')
+        self.create_rate_limit.setSpecialValueText(_('no limit'))
+        self.create_rate_limit.setToolTip(_('Maximum write speed while initializing the container'))
+        create_grid.addWidget(self.create_rate_limit, 14, 2)
+        a_settings.addWidgets([create_grid.itemAtPosition(14, column).widget() for column in range(0, 3)])
+
+        self.create_unattended = QCheckBox(_('Unattended'))
+        self.create_unattended.setToolTip(_('Ask for the passphrase before initializing the container\n'
+                                            'and finish all steps without further interaction'))
+        create_grid.addWidget(self.create_unattended, 15, 1)
+        self.create_thin = QCheckBox(_('Thin'))
+        self.create_thin.setToolTip(_('Sparse container file that only takes up the space of the data in it,\n'
+                                      'reveals how much and where data is stored (see help)'))
+        create_grid.addWidget(self.create_thin, 15, 2)
+        a_settings.addWidgets([self.create_unattended, self.create_thin])
+        # nothing gets initialized for thin containers, which need the LUKS format to keep discards enabled
+        self.create_thin.toggled.connect(lambda thin: self.create_quickformat.setEnabled(not thin))
+        self.create_thin.toggled.connect(self.display_storage_estimate)
+        self.create_encryption_format.currentIndexChanged.connect(
+            lambda: self.create_thin.setEnabled(self.create_encryption_format.currentText() == 'LUKS'))
+
+        create_grid.setRowStretch(16, 1)
+        create_grid.setRowMinimumHeight(16, 10)
         button_help_create = QPushButton(style.standardIcon(QStyle.SP_DialogHelpButton), _('Help'))
         button_help_create.clicked.connect(self.show_help_create)
-        create_grid.addWidget(button_help_create, 11, 2)
+        create_grid.addWidget(button_help_create, 17, 2)
 
         create_tab = QWidget()
         create_tab.setLayout(create_grid)
@@ -229,6 +371,10 @@ class SetupDialog(QDialog):
         self.create_thread = None
         self.create_status_grid = None
         self.create_timer = None
+        self.create_timings = []
+        self.create_timings_label = None
+        self.create_is_unattended = False
+        self.create_is_thin = False
 
     def on_create_container(self):
         """ Triggered by clicking create.
@@ -237,6 +383,38 @@ class SetupDialog(QDialog):
             This shows the header and the first step:
             Initializing the container file with random data
         """
+        # calculate designated container size for worker and progress indicator
+        size = self.get_create_size()
+        location = self.create_container_file.text().strip()
+        if not os.path.dirname(location):
+            location = os.path.join(os.path.expanduser('~'), location)
+            self.create_container_file.setText(location)
+        keyfile = self.create_keyfile.text().strip() if self.create_keyfile.text().strip() != '' else None
+        filesystem_type = str(self.create_filesystem_type.currentText())
+        encryption_format = str(self.create_encryption_format.currentText())
+        quickformat = self.create_quickformat.isChecked()
+        thin = self.create_thin.isEnabled() and self.create_thin.isChecked()
+
+        # offer to resume an interrupted create of the same container
+        checkpoint = FillJournal(location).read() if os.path.exists(location) else None
+        if checkpoint is not None:
+            if not self.confirm_resume(location, checkpoint):
+                return
+            size, filesystem_type = checkpoint['size'], checkpoint['filesystem_type']
+            encryption_format, quickformat = checkpoint['encryption_format'], checkpoint['quickformat']
+            thin = checkpoint.get('thin', False)
+        self.create_is_thin = thin
+
+        # unattended: get passphrase up front, the worker runs all steps without further requests
+        self.create_is_unattended = self.create_unattended.isChecked()
+        passphrase = None
+        if self.create_is_unattended and keyfile is None:
+            try:
+                passphrase = FormatContainerDialog(self).get_password()
+            except UserInputError:  # user cancelled dlg
+                return
+
+        storage_profile = self.get_storage_profile()
         self.init_create_pane()
 
         header = QLabel(_('<b>Creating new container</b>\n') +
@@ -248,42 +426,65 @@ class SetupDialog(QDialog):
         self.create_status_grid.addWidget(QLabel(_('Initializing Container File')), 1, 1)
         self.create_progressbars.append(QProgressBar())
         self.create_progressbars[0].setRange(0, 100)
+        if checkpoint is not None:
+            self.create_progressbars[0].setValue(int(checkpoint['offset'] / size * 100))
         self.create_status_grid.addWidget(self.create_progressbars[0], 2, 0, 1, 3)
-        self.create_status_grid.setRowStretch(7, 1)  # top align
+        # elapsed time of each finished phase
+        self.create_timings_label = QLabel('')
+        self.create_timings_label.setContentsMargins(0, 10, 0, 0)
+        self.create_status_grid.addWidget(self.create_timings_label, 7, 0, 1, 3)
+        self.create_status_grid.setRowStretch(8, 1)  # top align
         # add to stack widget and switch display
         self.main_pane.addWidget(self.create_pane)
         self.main_pane.setCurrentIndex(1)
 
-        # calculate designated container size for worker and progress indicator
-        size = self.create_container_size.value()
-        size = size * (1024 * 1024 * 1024 if self.create_size_unit.currentIndex() == 1 else 1024 * 1024)  # GB vs MB
-        location = self.create_container_file.text().strip()
-        if not os.path.dirname(location):
-            location = os.path.join(os.path.expanduser('~'), location)
-            self.create_container_file.setText(location)
-        keyfile = self.create_keyfile.text().strip() if self.create_keyfile.text().strip() != '' else None
-        # start timer for progressbar updates during container creation
-        self.create_timer.timeout.connect(lambda: self.display_progress_percent(location, size))
-        self.create_timer.start(500)
-
         self.worker.execute(command={'type': 'request',
                                      'msg': 'create',
                                      'device_name': self.create_device_name.text().strip(),
                                      'container_path': location,
                                      'container_size': size,
-                                     'quickformat': self.create_quickformat.isChecked(),
+                                     'quickformat': quickformat,
+                                     'thin': thin,
                                      'key_file': keyfile,
-                                     'filesystem_type': str(self.create_filesystem_type.currentText()),
-                                     'encryption_format': str(self.create_encryption_format.currentText()),
+                                     'filesystem_type': filesystem_type,
+                                     'encryption_format': encryption_format,
+                                     'resume': checkpoint is not None,
+                                     'unattended': self.create_is_unattended,
+                                     'passphrase': passphrase,
+                                     'pool_dir': self.parent().pool.directory if self.parent().pool else None,
+                                     'io_priority': self.create_io_priority.currentData(),
+                                     'rate_limit': self.create_rate_limit.value() * 1024 * 1024,
+                                     'direct_io': storage_profile['direct_io'] if storage_profile else True,
+                                     'fill_chunk_size': storage_profile['block_size'] if storage_profile else 0,
+                                     'pbkdf_profile': self.create_pbkdf_profile.currentData(),
+                                     'cipher': self.create_cipher.currentData(),
+                                     'perf_flags': self.create_perf_flags or None,
+                                     'sector_size': self.create_sector_size.currentData(),
                                      },
-                            success_callback=self.on_luksFormat_prompt,
-                            error_callback=lambda msg: self.display_create_failed(msg, stop_timer=True))
-
-    def on_luksFormat_prompt(self, msg):
-        """ Triggered after the container file is created on disk
-            Shows information about the next step and asks the user
-            for the passphrase to be used with the new container
+                            success_callback=(self.display_create_success if self.create_is_unattended
+                                              else self.on_luksFormat_prompt),
+                            error_callback=lambda msg: self.display_create_failed(msg, stop_timer=True),
+                            progress_callback=self.on_create_progress)
+
+    def confirm_resume(self, location, checkpoint):
+        """ Displays a confirmation dialog if an interrupted create of the chosen container file was found
+            :param location: The path of the container file
+            :type location: str
+            :param checkpoint: The last checkpoint recorded in the containers journal
+            :type checkpoint: dict
+            :returns: The users decision to resume
+            :rtype: bool
         """
+        message = _('<b>Unfinished container found:</b>\n{file_path}\n\n'
+                    '{percent}% of the container file have already been initialized.\n'
+                    'Resume creating this container?').format(
+            file_path=location, percent=int(checkpoint['offset'] / max(checkpoint['size'], 1) * 100))
+        mb = QMessageBox(QMessageBox.Question, '', message, QMessageBox.Ok | QMessageBox.Cancel, self)
+        mb.button(QMessageBox.Ok).setText(_('Resume'))
+        return mb.exec_() == QMessageBox.Ok
+
+    def display_step_encryption(self):
+        """ Marks the first step as done and shows information about the second step """
         self.set_progress_done(self.create_timer, self.create_progressbars[0])
 
         self.create_status_grid.addWidget(QLabel('<b>' + _('Step') + ' 2/3</b>'), 3, 0)
@@ -292,46 +493,70 @@ class SetupDialog(QDialog):
         self.create_progressbars[1].setRange(0, 0)
         self.create_status_grid.addWidget(self.create_progressbars[1], 4, 0, 1, 3)
 
+    def display_step_filesystem(self):
+        """ Marks the second step as done and shows information about the last step """
+        self.set_progress_done(progressbar=self.create_progressbars[1])
+
+        self.create_status_grid.addWidget(QLabel('<b>' + _('Step') + ' 3/3</b>'), 5, 0)
+        self.create_status_grid.addWidget(QLabel(_('Initializing Filesystem')), 5, 1)
+        self.create_progressbars.append(QProgressBar())
+        self.create_progressbars[2].setRange(0, 0)
+        self.create_status_grid.addWidget(self.create_progressbars[2], 6, 0, 1, 3)
+
+    def on_luksFormat_prompt(self, msg):
+        """ Triggered after the container file is created on disk
+            Shows information about the next step and asks the user
+            for the passphrase to be used with the new container
+        """
+        self.display_step_encryption()
+
         if msg == 'getPassword':
             try:
                 self.worker.execute(command={'type': 'response',
                                              'msg': FormatContainerDialog(self).get_password()
                                              },
                                     success_callback=self.on_creating_filesystem,
-                                    error_callback=self.display_create_failed)
+                                    error_callback=self.display_create_failed,
+                                    progress_callback=self.on_create_progress)
             except UserInputError:  # user cancelled dlg
                 self.worker.execute({'type': 'abort', 'msg': ''}, None, None)  # notify worker process
                 self.display_create_failed(_('Initialize container aborted'))
         else:  # using keyfile
             self.worker.execute(command={'type': 'response', 'msg': ''},
                                 success_callback=self.on_creating_filesystem,
-                                error_callback=self.display_create_failed)
+                                error_callback=self.display_create_failed,
+                                progress_callback=self.on_create_progress)
 
     def on_creating_filesystem(self, msg):
         """ Triggered after LUKS encryption got initialized.
             Shows information about the last step
         """
-        self.set_progress_done(progressbar=self.create_progressbars[1])
-
-        self.create_status_grid.addWidget(QLabel('<b>' + _('Step') + ' 3/3</b>'), 5, 0)
-        self.create_status_grid.addWidget(QLabel(_('Initializing Filesystem')), 5, 1)
-        self.create_progressbars.append(QProgressBar())
-        self.create_progressbars[2].setRange(0, 0)
-        self.create_status_grid.addWidget(self.create_progressbars[2], 6, 0, 1, 3)
+        self.display_step_filesystem()
 
         self.worker.execute(command={'type': 'response', 'msg': ''},
                             success_callback=self.display_create_success,
-                            error_callback=self.display_create_failed)
+                            error_callback=self.display_create_failed,
+                            progress_callback=self.on_create_progress)
 
     def display_create_success(self, msg):
         """ Triggered after successful creation of a new container """
         self.set_progress_done(progressbar=self.create_progressbars[2])
+        perf_flags = list(self.create_perf_flags)
+        if self.create_is_thin and 'allow_discards' not in perf_flags:
+            # enabled by the worker for thin containers, would be removed from the header on unlock otherwise
+            perf_flags.append('allow_discards')
+        if perf_flags:
+            try:
+                set_container_settings(self.create_container_file.text(), perf_flags=validate_flags(perf_flags))
+            except (IOError, OSError):
+                pass  # stored in the LUKS2 header anyway
         # copy values of newly created container to unlock dlg und reset create values
         self.unlock_container_file.setText(self.create_container_file.text())
         self.unlock_device_name.setText(self.create_device_name.text())
         self.unlock_keyfile.setText(self.create_keyfile.text())
         show_info(self, _('<b>{device_name}\nsuccessfully created!</b>\nClick on unlock to use the new container')
-                  .format(device_name=self.create_device_name.text().strip()), _('Success'))
+                  .format(device_name=self.create_device_name.text().strip()) +
+                  '<br><br>' + self.format_create_timings(), _('Success'))
         # reset create ui and switch to unlock tab
         self.create_container_file.setText('')
         self.create_device_name.setText('')
@@ -340,6 +565,10 @@ class SetupDialog(QDialog):
         self.create_keyfile.setText('')
         self.create_encryption_format.setCurrentIndex(0)
         self.create_filesystem_type.setCurrentIndex(0)
+        self.create_unattended.setChecked(False)
+        self.create_thin.setChecked(False)
+        self.create_perf_flags = []
+        self.create_sector_size.setCurrentIndex(0)
         self.display_create_done()
         self.tab_pane.setCurrentIndex(0)
 
@@ -391,8 +620,14 @@ class SetupDialog(QDialog):
                                       self.get_luks_device_name(),
                                       self.get_encrypted_container(),
                                       self.get_keyfile(),
-                                      self.get_mount_point()
+                                      self.get_mount_point(),
+                                      get_container_settings(self.get_encrypted_container()).get('perf_flags'),
+                                      mount_profile=self.get_mount_profile()
                                       ).communicate()  # blocks
+                try:
+                    set_container_settings(self.get_encrypted_container(), mount_profile=self.get_mount_profile())
+                except (IOError, OSError):
+                    pass  # the default options get used next time
 
                 # optionally create startmenu entry
                 self.show_create_startmenu_entry()
@@ -406,6 +641,7 @@ class SetupDialog(QDialog):
         """ Helper that initializes the ui for the progress indicators shown while creating containers or keyfiles """
         self.is_busy = True
         self.create_progressbars = []
+        self.create_timings = []
         self.create_timer = QTimer(self)
 
         self.buttons.setEnabled(False)
@@ -454,7 +690,7 @@ class SetupDialog(QDialog):
         self.main_pane.setCurrentIndex(1)
 
         # start timer for progressbar updates during keyfile creation
-        self.create_timer.timeout.connect(lambda: self.display_progress_percent(key_file, 1024))
+        self.create_timer.timeout.connect(lambda: self.display_keyfile_progress(key_file))
         self.create_timer.start(500)
 
         # run QThread with keyfile creation
@@ -599,8 +835,95 @@ class SetupDialog(QDialog):
                                    'Please install, eg for Debian/Ubuntu\n'
                                    '`apt-get install e2fslibs ntfs-3g`'))
             new_ok_label = _('Create')
+            # measure the ciphers once per machine to default to the fastest
+            if (load_benchmarks() is None and self.create_cipher_thread is None
+                    and is_installed('cryptsetup')):
+                self.on_benchmark_ciphers()
         self.buttons.button(QDialogButtonBox.Ok).setText(new_ok_label)
 
+    def on_benchmark_ciphers(self):
+        """ Triggered by clicking the benchmark button next to the cipher (create) or on first visit
+            of the create tab. Runs `cryptsetup benchmark` for all ciphers in a separate thread
+        """
+        self.create_cipher_benchmark.setEnabled(False)
+        self.create_cipher_benchmark.setText(_('Measuring ..'))
+        from luckyLUKS.utils import BackgroundTask
+        self.create_cipher_thread = BackgroundTask(self, run_benchmarks, self.on_ciphers_benchmarked)
+        self.create_cipher_thread.start()
+
+    def on_ciphers_benchmarked(self, results):
+        """ Show the measured speed and select the fastest cipher
+            :param results: Benchmark results per cipher name
+            :type results: dict
+        """
+        self.create_cipher_benchmark.setEnabled(True)
+        self.create_cipher_benchmark.setText(_('Benchmark'))
+        self.display_cipher_benchmarks(results)
+
+    def display_cipher_benchmarks(self, results):
+        """ Adds the measured speed to the cipher names and selects the fastest safe choice
+            :param results: Benchmark results per cipher name, None if not measured yet
+            :type results: dict or None
+        """
+        for index in range(self.create_cipher.count()):
+            name = self.create_cipher.itemData(index)
+            speed = get_speed(results, name)
+            if results is None:
+                text = name
+            elif speed:
+                text = _('{cipher} ({rate} MB/s)').format(cipher=name, rate='{0:.0f}'.format(speed / 1024 / 1024))
+            else:
+                # L10n: cipher not supported by the kernel
+                text = _('{cipher} (not available)').format(cipher=name)
+            self.create_cipher.setItemText(index, text)
+        self.create_cipher.setCurrentIndex(self.create_cipher.findData(choose_cipher(results)))
+        if results is not None and not has_aes_instructions():
+            self.create_cipher.setToolTip(_('This processor has no AES instructions'))
+
+    def on_perf_flags_clicked(self):
+        """ Triggered by clicking the dm-crypt options button (create tab) """
+        dialog = PerformanceDialog(self, self.create_perf_flags)
+        if dialog.exec_() == QDialog.Accepted:
+            self.create_perf_flags = dialog.get_perf_flags()
+
+    def on_benchmark_sector_sizes(self):
+        """ Triggered by clicking the compare button next to the sector size (create tab) """
+        directory = self.get_create_directory()
+        if not os.path.isdir(directory):
+            show_alert(self, _('Please choose a container file in an existing directory'))
+            return
+        self.is_busy = True
+        self.buttons.setEnabled(False)
+        self.create_sector_benchmark.setEnabled(False)
+        self.create_sector_benchmark.setText(_('Measuring ..'))
+        self.worker.execute(command={'type': 'request',
+                                     'msg': 'sector_benchmark',
+                                     'container_dir': directory,
+                                     'cipher': self.create_cipher.currentData()
+                                     },
+                            success_callback=self.on_sector_sizes_benchmarked,
+                            error_callback=lambda msg: self.on_sector_sizes_benchmarked(msg, error=True))
+
+    def on_sector_sizes_benchmarked(self, results, error=False):
+        """ Shows the throughput of both encryption sector sizes
+            :param results: write and read in bytes per second per sector size, or the error message
+            :type results: dict or str
+            :param error: Measuring failed
+            :type error: bool
+        """
+        self.is_busy = False
+        self.buttons.setEnabled(True)
+        self.create_sector_benchmark.setEnabled(True)
+        self.create_sector_benchmark.setText(_('Compare'))
+        if error:
+            show_alert(self, results)
+            return
+        lines = [_('{sector_size} bytes: write {write} MB/s, read {read} MB/s').format(
+            sector_size=sector_size, write='{0:.1f}'.format(results[str(sector_size)]['write'] / 1024 / 1024),
+            read='{0:.1f}'.format(results[str(sector_size)]['read'] / 1024 / 1024)) for sector_size in SECTOR_SIZES]
+        lines.append(_('auto uses {sector_size} bytes in this directory').format(sector_size=results['default']))
+        show_info(self, '\n'.join(lines), _('Sector size'))
+
     def on_select_container_clicked(self):
         """ Triggered by clicking the select button next to container file (unlock) """
         file_path = QFileDialog.getOpenFileName(self, _('Please choose a container file'), os.getenv("HOME"))
@@ -608,6 +931,62 @@ class SetupDialog(QDialog):
             file_path = file_path[0]
         self.unlock_container_file.setText(file_path)
         self.buttons.button(QDialogButtonBox.Ok).setText(_('Unlock'))
+        self.display_unlock_time()
+
+    def display_unlock_time(self):
+        """ Shows the header information of the chosen container right away (read in-process, no cryptsetup
+            needed) and predicts how long unlocking will take on this computer: benchmarking the key derivation
+            runs in a separate thread, the prediction gets added once done
+        """
+        container_path = self.get_encrypted_container()
+        self.unlock_header_info = ''
+        self.unlock_time_info.setText('')
+        if not os.path.isfile(container_path):
+            return
+        mount_profile = get_container_settings(container_path).get('mount_profile')
+        if mount_profile is not None:
+            self.set_mount_profile(mount_profile)
+        try:
+            header = read_header(container_path)
+        except (IOError, LuksHeaderException) as error:
+            self.unlock_time_info.setText(str(error))
+            return
+        if header is None:
+            return
+        # L10n: LUKS header summary followed by the UUID of the container
+        self.unlock_header_info = _('{summary}\nUUID {uuid}').format(summary=describe_header(header),
+                                                                     uuid=header['uuid'])
+        self.unlock_time_info.setText(self.unlock_header_info)
+        if not is_installed('cryptsetup'):
+            return
+        if self.unlock_time_path is not None:
+            return  # one benchmark at a time, the chosen container gets predicted once it finished
+        from luckyLUKS.utils import BackgroundTask
+        self.unlock_time_path = container_path
+        self.unlock_time_thread = BackgroundTask(self, describe_unlock_time,
+                                                 lambda description: self.on_unlock_time(container_path, description),
+                                                 container_path)
+        self.unlock_time_thread.finished.connect(self.on_unlock_time_finished)
+        self.unlock_time_thread.start()
+
+    def on_unlock_time(self, container_path, description):
+        """ Adds the predicted unlock time to the header information
+            :param container_path: The container the prediction is for
+            :type container_path: str
+            :param description: The prediction or None if the container is not a LUKS container
+            :type description: str or None
+        """
+        if container_path != self.get_encrypted_container():
+            return  # another container has been chosen in the meantime
+        self.unlock_time_info.setText('\n'.join(line for line in (self.unlock_header_info, description) if line))
+
+    def on_unlock_time_finished(self):
+        """ Triggered when the unlock time benchmark thread finished: predicts the unlock time
+            of the container chosen while it was running """
+        self.unlock_time_thread.wait()
+        finished_path, self.unlock_time_path = self.unlock_time_path, None
+        if finished_path != self.get_encrypted_container():
+            self.display_unlock_time()
 
     def on_select_mountpoint_clicked(self):
         """ Triggered by clicking the select button next to mount point """
@@ -633,6 +1012,80 @@ class SetupDialog(QDialog):
         """
         self.create_container_file.setText(self.on_save_file(_('new_container.bin')))
 
+    def get_create_size(self):
+        """ :returns: The designated container size in bytes
+            :rtype: int
+        """
+        size = self.create_container_size.value()
+        return size * (1024 * 1024 * 1024 if self.create_size_unit.currentIndex() == 1 else 1024 * 1024)  # GB vs MB
+
+    def get_create_directory(self):
+        """ :returns: The directory the new container will be created in, the home directory if none given
+            :rtype: str
+        """
+        return os.path.dirname(self.create_container_file.text().strip()) or os.path.expanduser('~')
+
+    def get_storage_profile(self):
+        """ :returns: The stored storage profile of the designated container directory if it has been measured
+            :rtype: dict or None
+        """
+        if not os.path.isdir(self.get_create_directory()):
+            return None
+        return load_storage_profile(self.get_create_directory())
+
+    def display_storage_estimate(self):
+        """ Shows the estimated time to initialize the container and warnings about slow targets
+            if the storage of the designated container directory has been measured before
+        """
+        profile = self.get_storage_profile()
+        if profile is None:
+            self.create_storage_info.setText('')
+            self.create_storage_info.setToolTip('')
+            return
+        lines = []
+        if not self.create_quickformat.isChecked() and not self.create_thin.isChecked():
+            lines.append(_('Initializing the container will take about {duration} ({rate} MB/s)').format(
+                duration=format_duration(estimate_fill_time(profile, self.get_create_size())),
+                rate='{0:.0f}'.format(profile['fill_rate'] / 1024 / 1024)))
+        lines += ['<b>' + warning + '</b>' for warning in get_warnings(profile)]
+        self.create_storage_info.setText('<br>'.join(lines))
+        self.create_storage_info.setToolTip('\n'.join(format_profile(profile)))
+
+    def on_measure_storage(self):
+        """ Triggered by clicking the `measure speed` button next to quickformat (create)
+            Measures the storage of the designated container directory in a separate thread
+        """
+        directory = self.get_create_directory()
+        if not os.path.isdir(directory):
+            show_alert(self, _('Please choose a container file in an existing directory'))
+            return
+        self.create_measure_storage.setEnabled(False)
+        self.create_storage_info.setText(_('Measuring {directory} ..').format(directory=directory))
+        from luckyLUKS.utils import StorageProfiler
+        self.create_storage_thread = StorageProfiler(self, directory)
+        self.create_storage_thread.start()
+
+    def on_storage_profiled(self, profile):
+        """ Triggered when the storage has been measured: remember the profile and show the estimate
+            :param profile: The measured storage profile
+            :type profile: dict
+        """
+        self.create_measure_storage.setEnabled(True)
+        try:
+            save_storage_profile(profile)
+        except (IOError, OSError) as error:
+            show_alert(self, str(error))
+        self.display_storage_estimate()
+
+    def on_storage_profile_failed(self, error):
+        """ Triggered when measuring the storage failed
+            :param error: The error message
+            :type error: str
+        """
+        self.create_measure_storage.setEnabled(True)
+        self.create_storage_info.setText('')
+        show_alert(self, error)
+
     def on_save_file(self, default_filename):
         """ Opens a native file dialog and returns the chosen path of the file to be saved
             The dialog does not allow overwriting existing files - to get this behaviour
@@ -654,26 +1107,138 @@ class SetupDialog(QDialog):
             save_path = save_path[0].strip() if isinstance(save_path, tuple) else save_path.strip()
             self.buttons.button(QDialogButtonBox.Ok).setText(_('Create'))  # qt keeps changing this..
 
-            if os.path.exists(save_path):
+            # unfinished containers can be chosen again to resume creating them
+            if os.path.exists(save_path) and not os.path.exists(save_path + JOURNAL_SUFFIX):
                 show_alert(self, _('File already exists:\n{filename}\n\n'
                                    '<b>Please create a new file!</b>').format(filename=save_path))
                 def_path = os.path.join(os.path.basename(save_path), default_filename)
             else:
                 return save_path
 
-    def display_progress_percent(self, location, size):
-        """ Update value on the container creation progress bar
-            :param location: The path of the container file currently being created
-            :type location: str
-            :param size: The final size the new container in bytes
-            :type size: int
+    def display_keyfile_progress(self, key_file):
+        """ Update value on the key file creation progress bar, containers report their fill progress themselves
+            :param key_file: The path of the key file currently being created (1024 bytes when done)
+            :type key_file: str
         """
         try:
-            new_value = int(os.path.getsize(location) / size * 100)
-        except (ZeroDivisionError, OSError, TypeError):
+            new_value = int(os.path.getsize(key_file) / 1024 * 100)
+        except OSError:
             new_value = 0
         self.create_progressbars[0].setValue(new_value)
 
+    def on_create_progress(self, progress):
+        """ Progress callback while creating a container: the worker reports the fill progress
+            and the elapsed time of each finished phase (fill, format, unlock, mkfs, mount, ownership, close)
+            :param progress: Progress information from the worker
+            :type progress: dict
+        """
+        if progress.get('done'):
+            self.create_timings.append(progress)
+            if progress['phase'] == 'unmount':
+                self.remember_mount_cycle()
+            self.create_timings_label.setText(self.format_create_timings())
+            # no requests from the worker when unattended -> advance steps on finished phases
+            if self.create_is_unattended and progress['phase'] == 'fill':
+                self.display_step_encryption()
+            elif self.create_is_unattended and progress['phase'] == 'format':
+                self.display_step_filesystem()
+        elif progress.get('phase') == 'fill':
+            self.display_fill_progress(progress)
+        elif progress.get('phase') == 'format' and len(self.create_progressbars) > 1:
+            self.display_format_progress(progress)
+
+    def display_fill_progress(self, progress):
+        """ Update value, throughput and remaining time on the container creation progress bar
+            :param progress: Progress reported by the worker while filling the container with random data
+            :type progress: dict with bytes written, total bytes, current and average rate in bytes per second
+                            and estimated remaining seconds
+        """
+        if not progress.get('total'):
+            return
+        self.create_progressbars[0].setValue(int(progress['bytes'] / progress['total'] * 100))
+        status = '%p% - ' + _('{rate} MB/s').format(rate='{0:.1f}'.format(progress['rate'] / 1024 / 1024))
+        if progress.get('rate_limit'):
+            status += ' ' + _('(limit {rate} MB/s)').format(rate=progress['rate_limit'] // 1024 // 1024)
+        if progress.get('eta') is not None:
+            status += ' - ' + _('{duration} left').format(duration=format_duration(progress['eta']))
+        self.create_progressbars[0].setFormat(status)
+
+    def display_format_progress(self, progress):
+        """ Shows the prompts answered by tcplay and its progress on the encryption progress bar
+            :param progress: Progress reported by the worker while tcplay initializes a TrueCrypt container
+            :type progress: dict with percent (or None) and stage
+        """
+        progressbar = self.create_progressbars[1]
+        if progress.get('percent') is not None:
+            progressbar.setRange(0, 100)
+            progressbar.setValue(int(progress['percent']))
+            progressbar.setFormat('%p%')
+        else:
+            # L10n: stages of tcplay creating a TrueCrypt container, shown on the progress bar
+            stages = {'passphrase': _('Passphrase sent'),
+                      'repeat': _('Passphrase confirmed'),
+                      'confirm': _('Writing volume header')}
+            progressbar.setFormat(stages.get(progress.get('stage'), ''))
+
+    def format_create_timings(self):
+        """ Helper to display the elapsed time of each finished phase while creating a container
+            :returns: one line per phase, including the average throughput for the fill
+            :rtype: str
+        """
+        phase_names = {'fill': _('Initializing Container File'),
+                       'format': _('Initializing Encryption'),
+                       'unlock': _('Unlocking Container'),
+                       'mkfs': _('Initializing Filesystem'),
+                       'mount': _('Mounting Filesystem'),
+                       'ownership': _('Setting Permissions'),
+                       'first_write': _('First Write'),
+                       'unmount': _('Unmounting Filesystem'),
+                       'close': _('Closing Container')}
+        lines = []
+        for timing in self.create_timings:
+            elapsed, written = timing['elapsed'], timing.get('bytes')
+            line = '{phase}: {duration}'.format(phase=phase_names.get(timing['phase'], timing['phase']),
+                                                duration=format_duration(elapsed))
+            if timing.get('pool'):
+                line += ' (' + _('taken from pool') + ')'
+            elif timing.get('preallocated'):
+                # L10n: quickformat reserves the space of a new container without writing to it
+                line += ' (' + _('{size} MB preallocated').format(size=timing['preallocated'] // 1024 // 1024) + ')'
+            elif written:
+                line += ' (' + _('{rate} MB/s').format(
+                    rate='{0:.1f}'.format(written / max(elapsed, 1e-6) / 1024 / 1024)) + ')'
+            elif timing.get('pbkdf'):
+                # L10n: key derivation profile used for a new container with its argon2 memory and threads
+                line += ' (' + _('{pbkdf}: {memory} MB, {parallel} threads').format(
+                    pbkdf=timing['pbkdf'], memory=timing['pbkdf_memory'] // 1024 // 1024,
+                    parallel=timing['pbkdf_parallel']) + ')'
+                if timing.get('pbkdf_reduced'):
+                    line += ' - ' + _('memory reduced to fit the available RAM')
+                if timing.get('cipher'):
+                    line += ', ' + timing['cipher']
+                if timing.get('sector_size'):
+                    line += ', ' + _('{sector_size} byte sectors').format(sector_size=timing['sector_size'])
+            elif timing.get('root_owner'):
+                saved = load_config('timings.json').get('mount_cycle')
+                # L10n: the filesystem root got its owner and permissions from mkfs, no temporary mount needed
+                line += ' (' + (_('permissions set without mounting, {duration} saved').format(
+                    duration=format_duration(saved)) if saved else _('permissions set without mounting')) + ')'
+            lines.append(line)
+        return '<br>'.join(lines)
+
+    def remember_mount_cycle(self):
+        """ Stores the duration of mounting, setting permissions and unmounting a new filesystem,
+            to be able to show the time saved when mkfs sets owner and permissions of the filesystem root
+        """
+        mount_cycle = sum(timing['elapsed'] for timing in self.create_timings
+                          if timing['phase'] in ('mount', 'ownership', 'unmount'))
+        config = load_config('timings.json')
+        config['mount_cycle'] = mount_cycle
+        try:
+            save_config('timings.json', config)
+        except (IOError, OSError):
+            pass  # only used for information
+
     def get_encrypted_container(self):
         """ Getter for QLineEdit text
             :returns: The container file path
@@ -704,6 +1269,22 @@ class SetupDialog(QDialog):
         mp = self.unlock_mountpoint.text().strip()
         return mp if mp != '' else None
 
+    def get_mount_profile(self):
+        """ Getter for QComboBox selection
+            :returns: The name of the mount profile
+            :rtype: str
+        """
+        return self.unlock_mount_profile.currentData()
+
+    def set_mount_profile(self, mount_profile):
+        """ Selects a mount profile, eg the one remembered for the chosen container or given on the command line
+            :param mount_profile: The name of the mount profile, unknown names are ignored
+            :type mount_profile: str
+        """
+        index = self.unlock_mount_profile.findData(mount_profile)
+        if index >= 0:
+            self.unlock_mount_profile.setCurrentIndex(index)
+
     def show_help_create(self):
         """ Triggered by clicking the help button (create tab) """
         header_text = _('<b>Create a new encrypted container</b>\n')
@@ -720,7 +1301,13 @@ class SetupDialog(QDialog):
                        'To speed up container creation <b>Quickformat</b> can be enabled to use `fallocate` '
                        'instead of initializing the container with random data - this means previous data '
                        'will not be overwritten and some conclusions about encrypted data inside closed '
-                       'containers can be drawn.\n')
+                       'containers can be drawn.\n'
+                       '\n'
+                       'A <b>Thin</b> container (see advanced settings) starts as an empty sparse file and only '
+                       'takes up the disk space of the data stored in it.\n') + \
+            _('\n'
+              'If the initialization gets interrupted, eg by logging out, choose the same '
+              'container file again to resume where it stopped.\n')
         advanced_topics = [
             {'head': _('key file'),
              'text': _('A key file can be used to allow access to an encrypted container instead of a password. '
@@ -744,11 +1331,69 @@ class SetupDialog(QDialog):
                        'The TrueCrypt format is quite popular on Windows/Mac, and can be created '
                        'on Linux if `tcplay` is installed. Please note, that "hidden" TrueCrypt '
                        'partitions are not supported by luckyLUKS!')},
+            {'head': _('unattended'),
+             'text': _('Creating a large container takes hours. To let it run overnight, tick <b>Unattended</b>: '
+                       'the passphrase is asked for before the container gets initialized and all steps '
+                       'will be finished without further interaction. Until the container is created the '
+                       'passphrase is kept in memory of the privileged helper process that is protected '
+                       'from being written to swap.')},
+            {'head': _('I/O priority'),
+             'text': _('Initializing a container writes to the disk as fast as possible and can slow down other '
+                       'programs. With <b>background</b> priority the disk only gets used while no other program '
+                       'needs it. Additionally the write speed can be limited to a fixed number of MB/s, the '
+                       'effective speed is shown while the container is initialized.')},
             {'head': _('filesystem'),
              'text': _('Choose the ntfs filesystem to be able to access your data from Linux, '
                        'Windows and Mac OSX. Since access permissions cannot be mapped from '
                        'ntfs to Linux, access to ntfs devices is usually not restricted '
-                       '-> take care when using unlocked ntfs devices in a multiuser environment!')}
+                       '-> take care when using unlocked ntfs devices in a multiuser environment!')
+                + _('\n\n'
+                    'Each filesystem comes with options tuned for encrypted containers, that are used '
+                    'whenever the container gets mounted as well. Hover over an entry to see its purpose. '
+                    'Only filesystems with the `mkfs` tools installed are offered. The time needed to '
+                    'create the filesystem is shown when done.')},
+            {'head': _('key derivation'),
+             'text': _('To unlock a LUKS container the passphrase gets stretched with a deliberately slow '
+                       'and memory hungry function (argon2id), which makes guessing passphrases expensive. '
+                       '<b>fast</b> unlocks in about a second with 256MB of memory, <b>balanced</b> takes '
+                       'two seconds and up to 1GB, <b>paranoid</b> five seconds and up to 4GB. '
+                       'The memory is never set higher than half of the RAM currently available, '
+                       'keep in mind that computers you want to unlock the container on need that much memory '
+                       'as well. The unlock tab shows how long unlocking a chosen container will take.')},
+            {'head': _('cipher'),
+             'text': _('All offered ciphers are considered safe. Which one is fastest depends on the processor: '
+                       'aes-xts profits from AES instructions of modern processors, adiantum is designed for '
+                       'processors without them, eg in older or low-end devices. On first use the ciphers are '
+                       'measured with `cryptsetup benchmark` and the fastest one gets preselected, the speed is '
+                       'shown next to each cipher. Computers you want to unlock the container on need to support '
+                       'the cipher as well.')},
+            {'head': _('dm-crypt options'),
+             'text': _('By default the kernel queues reads and writes of encrypted devices for worker threads, '
+                       'which evens out the load on slow disks but adds latency on fast SSD and NVMe drives. '
+                       'Bypassing the workqueues usually makes those more responsive. Allowing discards lets the '
+                       'drive know about unused blocks, but reveals which parts of the container are in use. '
+                       'LUKS2 containers store the options in their header, other containers get them on every '
+                       'unlock. Once unlocked, the options can be changed and the latency compared from the '
+                       'main window.')},
+            {'head': _('thin containers'),
+             'text': _('A thin container file is created sparse: it has the full size, but takes up disk space '
+                       'only for the parts the encrypted filesystem has written to. Discards are allowed for thin '
+                       'containers, so space freed inside can be given back to the disk: click <b>Compact</b> in '
+                       'the main window, or choose the `discard` or `trim` mount options to do it automatically.')
+                + _('\n\n'
+                    '<b>This comes at a price:</b> anyone who can read the container file, eg from a backup '
+                    'or a stolen laptop, sees how much data it holds, which regions are in use and how this '
+                    'changes over time, as well as the filesystem type from the pattern of used blocks. '
+                    'The content itself stays encrypted. Also writing to the container can fail when the disk '
+                    'it is stored on runs full, because the space was never reserved. Do not use thin containers '
+                    'if the amount of data stored should stay hidden.')},
+            {'head': _('sector size'),
+             'text': _('The data of the container gets encrypted in sectors. With 4096 byte sectors the CPU '
+                       'needs far fewer operations than with the traditional 512 bytes, which shows in the '
+                       'throughput of fast drives. <b>auto</b> chooses 4096 bytes if the filesystem the container '
+                       'file is stored on uses blocks of at least this size, which is the case for all common '
+                       'Linux filesystems. Click <b>Compare</b> to measure both sizes with a small test container. '
+                       'Containers with 4096 byte sectors need cryptsetup 2.0 or later to be unlocked.')}
         ]
         hd = HelpDialog(self, header_text, basic_help, advanced_topics)
         hd.exec_()
@@ -757,7 +1402,7 @@ class SetupDialog(QDialog):
         """ Triggered by clicking the help button (unlock tab) """
         header_text = _('<b>Unlock an encrypted container</b>\n')
         basic_help = _('Select the encrypted <b>container file</b> by clicking the button next to '
-                       'the textbox. Both LUKS and Truecrypt containers are supported!'
+                       'the textbox. LUKS, TrueCrypt and VeraCrypt containers are supported!'
                        '\n\n'
                        'The <b>device name</b> will be used to identify the unlocked container. '
                        'It can be any name up to 16 unicode characters, as long as it is unique '
@@ -777,7 +1422,14 @@ class SetupDialog(QDialog):
              'text': _('The mount point is the folder on your computer, where you can '
                        'access the files inside the container after unlocking. '
                        'If automatic mounting is configured on your system (eg with udisks), '
-                       'explicitly setting a mountpoint is not neccessary (but still possible).')}
+                       'explicitly setting a mountpoint is not neccessary (but still possible).')},
+            {'head': _('mount options'),
+             'text': _('Performance options used when mounting the container, remembered per container: '
+                       '<b>lazytime</b> writes timestamps and changes less often, <b>durable</b> more often, '
+                       '<b>discard</b> frees deleted blocks on the drive right away and <b>trim</b> all at once '
+                       'when closing (both need the allow_discards dm-crypt option), <b>compress</b> compresses '
+                       'btrfs more. nosuid and nodev are always used. Click <b>Mount options</b> in the main '
+                       'window to compare the profiles on an unlocked container.')}
         ]
         hd = HelpDialog(self, header_text, basic_help, advanced_topics)
         hd.exec_()
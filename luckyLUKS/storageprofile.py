@@ -0,0 +1,266 @@
+"""
+Quick storage performance profile of the directory a new container gets created in:
+sequential write and read throughput, fsync latency and the effect of O_DIRECT at different
+block sizes. Profiles get stored per filesystem and disk, to estimate how long initializing
+a container will take, to pick the block size for the fill and to warn about slow targets.
+
+luckyLUKS Copyright (c) 2014,2015,2022 Jasper van Hoorn (muzius@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details. <http://www.gnu.org/licenses/>
+"""
+
+import os
+import mmap
+import errno
+import tempfile
+from time import monotonic, time
+
+from luckyLUKS.containerfile import MiB, get_filesystem_type, get_physical_devices, \
+    load_config, save_config
+
+# bytes written for the buffered test, each O_DIRECT block size writes half of it
+PROFILE_SIZE = 64 * MiB
+DIRECT_BLOCK_SIZES = (128 * 1024, MiB, 4 * MiB, 16 * MiB)
+FSYNC_SAMPLES = 16
+# network and fuse filesystems: throughput depends on the connection, O_DIRECT often unsupported
+NETWORK_FILESYSTEMS = ('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', '9p', 'ceph', 'glusterfs',
+                       'fuse.sshfs', 'fuse.glusterfs', 'davfs', 'fuse.rclone')
+# below these values a target gets flagged as slow
+SLOW_WRITE_RATE = 20 * MiB
+SLOW_FSYNC_LATENCY = 0.05
+
+
+def get_transport(path):
+    """ Detects targets that are slow by nature: network filesystems and disks attached via USB 1/2
+        :param path: A file or directory on the target
+        :type path: str
+        :returns: 'network', 'usb1', 'usb2', 'usb' or None for local disks
+        :rtype: str or None
+    """
+    filesystem = get_filesystem_type(path) or ''
+    if filesystem in NETWORK_FILESYSTEMS:
+        return 'network'
+    transport = None
+    for disk in get_physical_devices(path):
+        device = os.path.realpath(os.path.join('/sys/block', disk, 'device'))
+        if '/usb' not in device:
+            continue
+        transport = 'usb'
+        # the usb device the disk is attached to knows the negotiated speed in Mbit/s
+        while device != '/sys/devices' and device != '/':
+            try:
+                with open(os.path.join(device, 'speed')) as speed_file:
+                    speed = int(float(speed_file.read().strip()))
+            except (IOError, ValueError):
+                device = os.path.dirname(device)
+                continue
+            if speed <= 12:
+                return 'usb1'
+            if speed <= 480:
+                return 'usb2'
+            break
+    return transport
+
+
+def profile_key(path):
+    """ Profiles are stored per filesystem type and the disks below it
+        :param path: A file or directory on the target
+        :type path: str
+        :rtype: str
+    """
+    return '{filesystem}:{disks}'.format(filesystem=get_filesystem_type(path) or 'unknown',
+                                         disks=','.join(get_physical_devices(path)))
+
+
+def profile_storage(directory, size=PROFILE_SIZE):
+    """ Measures the storage the directory resides on with a temporary test file
+        :param directory: The directory a container will be created in
+        :type directory: str
+        :param size: Bytes written for the buffered sequential write
+        :type size: int
+        :returns: filesystem, disks, transport, write_rate, read_rate and fill_rate in bytes per second,
+                  direct_rates per block size, fsync_latency in seconds, block_size and direct_io for the fill
+        :rtype: dict
+        :raises: OSError
+    """
+    fd, path = tempfile.mkstemp(prefix='.luckyluks-profile-', dir=directory)
+    buf = mmap.mmap(-1, 16 * MiB)  # page aligned, needed for O_DIRECT
+    buf.write(os.urandom(16 * MiB))  # incompressible, like the random data of a container
+    try:
+        # buffered sequential write including the final flush to disk
+        start = monotonic()
+        for offset in range(0, size, MiB):
+            os.pwrite(fd, memoryview(buf)[:MiB], offset)
+        os.fsync(fd)
+        write_rate = size / max(monotonic() - start, 1e-6)
+
+        # fsync latency of small writes, median to ignore outliers
+        latencies = []
+        for sample in range(FSYNC_SAMPLES):
+            start = monotonic()
+            os.pwrite(fd, memoryview(buf)[:4096], sample * 4096)
+            os.fsync(fd)
+            latencies.append(monotonic() - start)
+        fsync_latency = sorted(latencies)[len(latencies) // 2]
+
+        direct_rates = measure_direct_writes(path, size // 2, buf)
+
+        # sequential read of data not in the page cache
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        start = monotonic()
+        offset = 0
+        while offset < size:
+            data = os.pread(fd, MiB, offset)
+            if not data:
+                break
+            offset += len(data)
+        read_rate = offset / max(monotonic() - start, 1e-6)
+    finally:
+        os.close(fd)
+        os.unlink(path)
+        buf.close()
+
+    profile = {'directory': directory,
+               'filesystem': get_filesystem_type(directory),
+               'disks': list(get_physical_devices(directory)),
+               'transport': get_transport(directory),
+               'write_rate': write_rate,
+               'read_rate': read_rate,
+               'fsync_latency': fsync_latency,
+               'direct_rates': {str(block_size): rate for block_size, rate in direct_rates.items()},
+               'time': time()}
+    if direct_rates:
+        block_size, rate = max(direct_rates.items(), key=lambda item: item[1])
+    else:
+        block_size, rate = 4 * MiB, 0
+    # O_DIRECT only pays off if it is at least as fast as going through the page cache
+    profile['direct_io'] = rate >= write_rate * 0.9
+    profile['block_size'] = block_size
+    profile['fill_rate'] = rate if profile['direct_io'] else write_rate
+    return profile
+
+
+def measure_direct_writes(path, size, buf):
+    """ Sequential O_DIRECT writes with different block sizes
+        :param path: The test file
+        :type path: str
+        :param size: Bytes written per block size
+        :type size: int
+        :param buf: Page aligned buffer of at least the largest block size
+        :type buf: :class:`mmap.mmap`
+        :returns: bytes per second per block size, empty if the filesystem does not support O_DIRECT
+        :rtype: dict(int, float)
+        :raises: OSError
+    """
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_DIRECT)
+    except OSError as ose:
+        if ose.errno == errno.EINVAL:  # eg tmpfs
+            return {}
+        raise
+    rates = {}
+    try:
+        for block_size in DIRECT_BLOCK_SIZES:
+            block = memoryview(buf)[:block_size]
+            start = monotonic()
+            try:
+                for offset in range(0, max(size, block_size), block_size):
+                    os.pwrite(fd, block, offset)
+                os.fsync(fd)
+            except OSError as ose:
+                if ose.errno == errno.EINVAL:
+                    return {}  # O_DIRECT accepted on open but not for writes, eg some fuse filesystems
+                raise
+            rates[block_size] = max(size, block_size) / max(monotonic() - start, 1e-6)
+    finally:
+        os.close(fd)
+    return rates
+
+
+def load_storage_profile(path):
+    """ Looks up the stored profile of the storage a path resides on
+        :param path: A file or directory on the target
+        :type path: str
+        :returns: The profile or None if the storage has not been measured yet
+        :rtype: dict or None
+    """
+    try:
+        return load_config('storage.json').get(profile_key(path))
+    except OSError:
+        return None
+
+
+def save_storage_profile(profile):
+    """ Stores a profile for the filesystem and disks it has been measured on
+        :param profile: A profile as returned by profile_storage()
+        :type profile: dict
+        :raises: IOError
+    """
+    profiles = load_config('storage.json')
+    profiles[profile_key(profile['directory'])] = profile
+    save_config('storage.json', profiles)
+
+
+def estimate_fill_time(profile, size):
+    """ :param profile: The profile of the target storage
+        :type profile: dict
+        :param size: The container size in bytes
+        :type size: int
+        :returns: Estimated seconds to initialize a container of this size with random data
+        :rtype: float
+    """
+    return size / max(profile['fill_rate'], 1)
+
+
+def get_warnings(profile):
+    """ :param profile: The profile of the target storage
+        :type profile: dict
+        :returns: Warnings about slow targets for display
+        :rtype: list of str
+    """
+    warnings = []
+    if profile['transport'] == 'network':
+        warnings.append(_('The container is on a network filesystem ({filesystem}): creating and using it '
+                          'depends on the connection and may be slow').format(filesystem=profile['filesystem']))
+    elif profile['transport'] in ('usb1', 'usb2'):
+        warnings.append(_('The disk is connected via USB 2 or older, '
+                          'use a USB 3 port to create large containers much faster'))
+    if profile['fill_rate'] < SLOW_WRITE_RATE:
+        warnings.append(_('Slow target: only {rate} MB/s sequential write').format(
+            rate='{0:.1f}'.format(profile['fill_rate'] / MiB)))
+    if profile['fsync_latency'] > SLOW_FSYNC_LATENCY:
+        warnings.append(_('High sync latency of {latency} ms: expect slow metadata updates').format(
+            latency=int(profile['fsync_latency'] * 1000)))
+    return warnings
+
+
+def format_profile(profile):
+    """ Summary of a storage profile for display
+        :param profile: The profile of the target storage
+        :type profile: dict
+        :returns: One line per measurement
+        :rtype: list of str
+    """
+    lines = [_('{directory}: {filesystem} on {disks}').format(
+        directory=profile['directory'], filesystem=profile['filesystem'], disks=', '.join(profile['disks']))]
+    lines.append(_('sequential write: {rate} MB/s').format(rate='{0:.1f}'.format(profile['write_rate'] / MiB)))
+    lines.append(_('sequential read: {rate} MB/s').format(rate='{0:.1f}'.format(profile['read_rate'] / MiB)))
+    lines.append(_('fsync latency: {latency} ms').format(latency='{0:.1f}'.format(profile['fsync_latency'] * 1000)))
+    if profile['direct_rates']:
+        lines.append(_('O_DIRECT write: {rates}').format(rates=', '.join(
+            '{0} KB {1:.1f} MB/s'.format(int(block_size) // 1024, rate / MiB)
+            for block_size, rate in sorted(profile['direct_rates'].items(), key=lambda item: int(item[0])))))
+    else:
+        lines.append(_('O_DIRECT not supported'))
+    lines.append(_('fill: {block_size} KB blocks, {mode}').format(
+        block_size=profile['block_size'] // 1024,
+        mode='O_DIRECT' if profile['direct_io'] else _('page cache')))
+    return lines + get_warnings(profile)
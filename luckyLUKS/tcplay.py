@@ -0,0 +1,190 @@
+"""
+Drives tcplay through a pseudo-terminal: tcplay reads passphrases and confirmations from
+its controlling terminal, so instead of writing blindly into a pipe with fixed delays
+the answers get sent when the corresponding prompt actually appears.
+
+luckyLUKS Copyright (c) 2014,2015,2022 Jasper van Hoorn (muzius@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details. <http://www.gnu.org/licenses/>
+"""
+
+import os
+import re
+import fcntl
+import errno
+import select
+import signal
+import termios
+import subprocess
+from time import monotonic
+
+# prompts of tcplay that get answered, checked in this order against the unanswered output
+PROMPT_REPEAT_PASSPHRASE = re.compile(r'Repeat passphrase:\s*$')
+PROMPT_PASSPHRASE = re.compile(r'[Pp]assphrase[^:\n]*:\s*$')
+PROMPT_CONFIRM = re.compile(r'\(y/n\)\s*$')
+PROMPT_TEXT = re.compile(r'[^\n:]*[Pp]assphrase[^:\n]*:[ \t]*|[^\n]*\(y/n\)[ \t]*')
+# tcplay prints the progress of a secure erase on SIGUSR1
+ERASE_STARTED = re.compile(r'Securely erasing')
+PROGRESS = re.compile(r'(\d+(?:\.\d+)?)\s*%')
+# tcplay waiting for input that is not handled here gets stopped after this many seconds of silence
+UNKNOWN_PROMPT = re.compile(r'[:?]\s*$')
+UNKNOWN_PROMPT_TIMEOUT = 10
+
+
+class TcplayException(Exception):
+    """ Raised if tcplay fails, carrying its own error messages """
+
+
+class TcplayDriver():
+
+    """ Runs tcplay with a pseudo-terminal as controlling terminal and answers its prompts:
+        passphrase, repeated passphrase and the confirmation before creating a volume.
+        Everything else tcplay prints is collected to report its actual error messages,
+        progress information gets passed to a callback.
+    """
+
+    def __init__(self, cmd, passphrase='', progress_callback=None):
+        """ :param cmd: The tcplay command line
+            :type cmd: list of str
+            :param passphrase: The passphrase sent to every passphrase prompt
+            :type passphrase: str
+            :param progress_callback: Called with the progress in percent (or None for the stage reached)
+                                      and a short status text
+            :type progress_callback: function(percent, status) or None
+        """
+        self.cmd = cmd
+        self.passphrase = passphrase
+        self.progress_callback = progress_callback
+        self.output = ''
+        self._pending = ''  # output since the last answered prompt
+        self._answers = {'passphrase': 0, 'repeat': 0, 'confirm': 0}
+        self._erasing = False
+
+    def run(self):
+        """ Starts tcplay and answers its prompts until it exits
+            :raises: TcplayException
+        """
+        master, slave = os.openpty()
+        # no echo: the passphrase must not show up in the collected output
+        attributes = termios.tcgetattr(slave)
+        attributes[3] &= ~(termios.ECHO | termios.ECHONL)
+        termios.tcsetattr(slave, termios.TCSANOW, attributes)
+        try:
+            process = subprocess.Popen(self.cmd, stdin=slave, stdout=slave, stderr=slave, close_fds=True,
+                                       start_new_session=True, preexec_fn=_set_controlling_terminal)
+        except OSError as ose:
+            os.close(master)
+            os.close(slave)
+            raise TcplayException(str(ose)) from ose
+        os.close(slave)
+        try:
+            self._communicate(process, master)
+        finally:
+            os.close(master)
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        if process.returncode != 0:
+            raise TcplayException(self.get_errors() or
+                                  _('tcplay exited with code {code}').format(code=process.returncode))
+
+    def _communicate(self, process, master):
+        """ Reads from the pseudo-terminal until tcplay closes it
+            :param process: The running tcplay process
+            :type process: :class:`subprocess.Popen`
+            :param master: Master side of the pseudo-terminal
+            :type master: int
+            :raises: TcplayException
+        """
+        last_output = monotonic()
+        while True:
+            readable, __, __ = select.select([master], [], [], 1)
+            if not readable:
+                if self._erasing and process.poll() is None:
+                    process.send_signal(signal.SIGUSR1)  # ask for a progress summary
+                elif (process.poll() is None and UNKNOWN_PROMPT.search(self._pending) and
+                      monotonic() - last_output > UNKNOWN_PROMPT_TIMEOUT):
+                    raise TcplayException(self.get_errors())
+                continue
+            try:
+                data = os.read(master, 4096)
+            except OSError as ose:
+                if ose.errno == errno.EIO:  # all slave fds closed: tcplay exited
+                    break
+                raise
+            if not data:
+                break
+            last_output = monotonic()
+            text = data.decode('utf-8', 'replace').replace('\r\n', '\n')
+            self.output += text
+            self._pending += text
+            self._parse_progress(text)
+            answer = self._get_answer()
+            if answer is not None:
+                os.write(master, (answer + '\n').encode('utf-8'))
+                self._pending = ''
+        process.wait()
+
+    def _get_answer(self):
+        """ Matches the unanswered output against the known prompts
+            :returns: The answer to send or None if tcplay is not waiting for input
+            :rtype: str or None
+            :raises: TcplayException
+        """
+        if PROMPT_REPEAT_PASSPHRASE.search(self._pending):
+            prompt, answer = 'repeat', self.passphrase
+        elif PROMPT_PASSPHRASE.search(self._pending):
+            prompt, answer = 'passphrase', self.passphrase
+        elif PROMPT_CONFIRM.search(self._pending):
+            prompt, answer = 'confirm', 'y'
+        else:
+            return None
+        # asking again means the previous answer was rejected, eg passphrases didn't match
+        if self._answers[prompt] > 0:
+            raise TcplayException(self.get_errors())
+        self._answers[prompt] += 1
+        if self.progress_callback is not None:
+            self.progress_callback(None, prompt)
+        return answer
+
+    def _parse_progress(self, text):
+        """ Passes progress reported by tcplay to the callback
+            :param text: Newly read output
+            :type text: str
+        """
+        if ERASE_STARTED.search(text):
+            self._erasing = True
+        if self.progress_callback is None:
+            return
+        for match in PROGRESS.finditer(text):
+            self.progress_callback(min(100.0, float(match.group(1))), 'progress')
+
+    def get_errors(self):
+        """ :returns: The output of tcplay without prompts, summary and progress lines
+            :rtype: str
+        """
+        # answers are not echoed, so the prompts share lines with the following output
+        output = PROMPT_TEXT.sub('', self.output)
+        lines = []
+        for line in output.splitlines():
+            line = line.strip()
+            if (not line or PROGRESS.search(line) or ERASE_STARTED.search(line) or
+                    line.startswith('-') or line.startswith('Summary of actions')):
+                continue
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+def _set_controlling_terminal():
+    """ Runs in the child before exec: make the pseudo-terminal on stdin the controlling terminal,
+        tcplay opens /dev/tty to read passphrases
+    """
+    fcntl.ioctl(0, termios.TIOCSCTTY, 0)
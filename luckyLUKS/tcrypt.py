@@ -0,0 +1,179 @@
+"""
+Unlocking TrueCrypt and VeraCrypt containers with cryptsetup. Their headers cannot be identified
+without decrypting them, so every format variant (TrueCrypt/VeraCrypt, normal/hidden volume) and every
+header key derivation hash costs a full key derivation. The variant and hash that worked last time get
+tried first, if nothing is known yet the candidates are tried in parallel on the available cores.
+
+luckyLUKS Copyright (c) 2014,2015,2022 Jasper van Hoorn (muzius@gmail.com)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details. <http://www.gnu.org/licenses/>
+"""
+
+import os
+import subprocess
+from time import monotonic, sleep
+
+# variant: format, hidden volume
+TCRYPT_VARIANTS = {
+    'veracrypt': ('veracrypt', False),
+    'truecrypt': ('truecrypt', False),
+    'veracrypt-hidden': ('veracrypt', True),
+    'truecrypt-hidden': ('truecrypt', True),
+}
+# order tried without a hint: VeraCrypt is more common nowadays, hidden volumes are rare
+TCRYPT_VARIANT_NAMES = ['veracrypt', 'truecrypt', 'veracrypt-hidden', 'truecrypt-hidden']
+# header key derivation hashes in order of popularity (sha512 is the default of both)
+TCRYPT_HASHES = {
+    'veracrypt': ['sha512', 'sha256', 'whirlpool', 'streebog', 'ripemd160'],
+    'truecrypt': ['sha512', 'ripemd160', 'whirlpool'],
+}
+POLL_INTERVAL = 0.02
+
+
+def validate_hint(hint):
+    """ :param hint: The variant and hash that unlocked the container last time
+        :type hint: dict or None
+        :returns: The hint as (variant, hash) or None
+        :rtype: tuple or None
+        :raises: ValueError
+    """
+    if hint is None:
+        return None
+    try:
+        variant, hash_name = hint['variant'], hint['hash']
+    except (KeyError, TypeError) as error:
+        raise ValueError(_('Invalid TrueCrypt/VeraCrypt hint')) from error
+    if variant not in TCRYPT_VARIANTS or hash_name not in TCRYPT_HASHES[TCRYPT_VARIANTS[variant][0]]:
+        raise ValueError(_('Invalid TrueCrypt/VeraCrypt hint'))
+    return variant, hash_name
+
+
+def get_candidates(hint=None):
+    """ :param hint: The variant and hash to try first
+        :type hint: tuple or None
+        :returns: All (variant, hash) combinations, the hint first
+        :rtype: list of tuples
+    """
+    candidates = [(variant, hash_name) for variant in TCRYPT_VARIANT_NAMES
+                  for hash_name in TCRYPT_HASHES[TCRYPT_VARIANTS[variant][0]]]
+    if hint in candidates:
+        candidates.remove(hint)
+        candidates.insert(0, hint)
+    return candidates
+
+
+def is_hidden(variant):
+    """ :param variant: A key of TCRYPT_VARIANTS
+        :type variant: str
+        :rtype: bool
+    """
+    return TCRYPT_VARIANTS[variant][1]
+
+
+def cryptsetup_options(variant, hash_name, can_disable_veracrypt=False):
+    """ :param variant: A key of TCRYPT_VARIANTS
+        :type variant: str
+        :param hash_name: The header key derivation hash, limits the hashes cryptsetup tries
+        :type hash_name: str
+        :param can_disable_veracrypt: cryptsetup knows --disable-veracrypt (newer versions check VeraCrypt by default)
+        :type can_disable_veracrypt: bool
+        :returns: Options for cryptsetup open --type tcrypt
+        :rtype: list of str
+    """
+    tc_format, hidden = TCRYPT_VARIANTS[variant]
+    if tc_format == 'veracrypt':
+        options = ['--veracrypt']
+    else:
+        options = ['--disable-veracrypt'] if can_disable_veracrypt else []
+    if hidden:
+        options.append('--tcrypt-hidden')
+    return options + ['--hash', hash_name]
+
+
+def open_parallel(commands, passphrase, concurrency):
+    """ Runs cryptsetup open commands for the same device at most `concurrency` at a time
+        until the first one succeeds, the others get stopped then
+        :param commands: The candidate commands in order of preference
+        :type commands: list of lists of str
+        :param passphrase: Sent to every cryptsetup on stdin
+        :type passphrase: str
+        :param concurrency: Maximum number of processes running at once
+        :type concurrency: int
+        :returns: index of the command that succeeded (None if all failed), its returncode and errors
+                  (of the first command that did not fail with a wrong passphrase if all failed)
+        :rtype: tuple
+    """
+    pending = list(enumerate(commands))
+    running = []
+    failed = None
+    try:
+        while pending or running:
+            while pending and len(running) < max(concurrency, 1):
+                index, command = pending.pop(0)
+                with open(os.devnull, 'w') as DEVNULL:
+                    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=DEVNULL,
+                                               stderr=subprocess.PIPE, universal_newlines=True, close_fds=True)
+                running.append((index, process))
+                try:
+                    process.stdin.write(passphrase)
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass  # cryptsetup exited early, its errors get collected below
+            sleep(POLL_INTERVAL)
+            for index, process in list(running):
+                if process.poll() is None:
+                    continue
+                running.remove((index, process))
+                errors = process.stderr.read()
+                process.stderr.close()
+                if process.returncode == 0:
+                    return index, 0, errors
+                # returncode 2: wrong passphrase for this variant, anything else is worth reporting
+                if failed is None or (failed[1] == 2 and process.returncode != 2):
+                    failed = (None, process.returncode, errors)
+    finally:
+        for index, process in running:
+            process.kill()
+            process.wait()
+            process.stderr.close()
+    return failed
+
+
+def unlock(open_command, passphrase, hint=None, concurrency=1, can_disable_veracrypt=False):
+    """ Tries the hint alone first, then all other candidates in parallel
+        :param open_command: The cryptsetup open --type tcrypt command without variant options
+        :type open_command: list of str
+        :param passphrase: Sent to cryptsetup on stdin
+        :type passphrase: str
+        :param hint: The variant and hash to try first
+        :type hint: tuple or None
+        :param concurrency: Maximum number of cryptsetup processes running at once
+        :type concurrency: int
+        :param can_disable_veracrypt: cryptsetup knows --disable-veracrypt
+        :type can_disable_veracrypt: bool
+        :returns: returncode, errors, the (variant, hash) that succeeded or None, whether it was the hint,
+                  and the elapsed seconds
+        :rtype: tuple
+    """
+    start = monotonic()
+    candidates = get_candidates(hint)
+    rounds = [candidates[:1], candidates[1:]] if hint is not None else [candidates]
+    result = None
+    for round_number, round_candidates in enumerate(rounds):
+        commands = [open_command + cryptsetup_options(variant, hash_name, can_disable_veracrypt)
+                    for variant, hash_name in round_candidates]
+        index, returncode, errors = open_parallel(commands, passphrase, concurrency)
+        if index is not None:
+            hint_matched = hint is not None and round_number == 0
+            return returncode, errors, round_candidates[index], hint_matched, monotonic() - start
+        if result is None or (result[0] == 2 and returncode != 2):
+            result = (returncode, errors)
+    return result[0], result[1], None, False, monotonic() - start
@@ -17,16 +17,180 @@ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 GNU General Public License for more details. <http://www.gnu.org/licenses/>
 """
 
+from time import time
+
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QDialog, QMessageBox, QDialogButtonBox, QStyle, \
     QLabel, QVBoxLayout, QHBoxLayout, QLineEdit, QCheckBox, QLayout, QApplication
 from PyQt5.QtGui import QIcon
 
+from luckyLUKS.containerfile import get_keyslot_hint, remember_keyslot, get_container_settings, \
+    set_container_settings
+
+
+# open/close/quick lock/quick unlock durations remembered per container
+TIMING_HISTORY_LENGTH = 20
+
 
 class UserInputError(Exception):
     """ Raised if user cancels a password dialog """
 
 
+def on_unlock_progress(container_path, key_file, progress):
+    """ Progress callback of unlock commands: remembers the LUKS keyslot or the TrueCrypt/VeraCrypt variant
+        that matched to try it first next time
+        :param container_path: The path of the container file
+        :type container_path: str
+        :param key_file: The path of the key file used to unlock, None for a passphrase
+        :type key_file: str or None
+        :param progress: Progress information from the worker
+        :type progress: dict
+    """
+    if progress.get('phase') == 'keyslot':
+        try:
+            remember_keyslot(container_path, key_file, progress['keyslot'], progress['saved'])
+        except (IOError, OSError):
+            pass  # all keyslots get tried next time
+    elif progress.get('phase') == 'tcrypt':
+        try:
+            set_container_settings(container_path, tcrypt={'variant': progress['variant'], 'hash': progress['hash']})
+        except (IOError, OSError):
+            pass  # all variants get tried next time
+    elif progress.get('phase') == 'timing':
+        try:
+            remember_timing(container_path, progress['action'], progress['phases'])
+        except (IOError, OSError):
+            pass  # only used for display
+
+
+def remember_timing(container_path, action, phases):
+    """ Adds the duration of an open, close, quick lock or quick unlock to the history of a container,
+        only the last TIMING_HISTORY_LENGTH of each action are kept
+        :param container_path: The path of the container file
+        :type container_path: str
+        :param action: One of `open`, `open-ro`, `close`, `lock`, `unlock`
+        :type action: str
+        :param phases: Seconds spent in each phase, without the time spent entering the passphrase
+        :type phases: list of (str, float)
+        :raises: IOError
+    """
+    history = dict(get_container_settings(container_path).get('timing_history', {}))
+    history[action] = (history.get(action, []) + [{'time': int(time()), 'phases': phases}])[-TIMING_HISTORY_LENGTH:]
+    set_container_settings(container_path, timing_history=history)
+
+
+def get_timing_history(container_path, action):
+    """ :param container_path: The path of the container file
+        :type container_path: str
+        :param action: One of `open`, `open-ro`, `close`, `lock`, `unlock`
+        :type action: str
+        :returns: Total seconds of each remembered run, oldest first, and the phases of the last one
+        :rtype: tuple(list of float, list of (str, float))
+    """
+    history = get_container_settings(container_path).get('timing_history', {}).get(action, [])
+    totals = [sum(elapsed for __, elapsed in entry['phases']) for entry in history]
+    return totals, history[-1]['phases'] if history else []
+
+
+def remember_read_throughput(container_path, read_only, rate):
+    """ Stores the last read throughput measured with the container open read-only or read-write
+        :param container_path: The path of the container file
+        :type container_path: str
+        :param read_only: The container was open read-only
+        :type read_only: bool
+        :param rate: Bytes per second
+        :type rate: float
+        :raises: IOError
+    """
+    throughput = dict(get_container_settings(container_path).get('read_throughput', {}))
+    throughput['read-only' if read_only else 'read-write'] = rate
+    set_container_settings(container_path, read_throughput=throughput)
+
+
+def get_phase_time(phases, phase):
+    """ :param phases: Seconds spent in each phase
+        :type phases: list of (str, float)
+        :param phase: Name of the phase eg mount
+        :type phase: str
+        :returns: Seconds spent in the phase or None if not measured
+        :rtype: float or None
+    """
+    return next((elapsed for name, elapsed in phases if name == phase), None)
+
+
+def describe_read_only(container_path):
+    """ Compares mount time and read throughput of read-only and read-write access to a container
+        :param container_path: The path of the container file
+        :type container_path: str
+        :returns: One line per value measured in both modes, empty if none yet
+        :rtype: list of str
+    """
+    lines = []
+    mount_times = [get_phase_time(get_timing_history(container_path, action)[1], 'mount')
+                   for action in ('open-ro', 'open')]
+    if None not in mount_times:
+        # L10n: time to mount the filesystem of a container opened read-only and read-write
+        lines.append(_('Mount read-only {read_only}s, read-write {read_write}s').format(
+            read_only='{0:.2f}'.format(mount_times[0]), read_write='{0:.2f}'.format(mount_times[1])))
+    throughput = get_container_settings(container_path).get('read_throughput', {})
+    if 'read-only' in throughput and 'read-write' in throughput:
+        # L10n: sequential read throughput of a container opened read-only and read-write
+        lines.append(_('Read read-only {read_only} MB/s, read-write {read_write} MB/s').format(
+            read_only='{0:.0f}'.format(throughput['read-only'] / 1024 / 1024),
+            read_write='{0:.0f}'.format(throughput['read-write'] / 1024 / 1024)))
+    return lines
+
+
+def describe_lock_timings(container_path):
+    """ Compares the last quick lock/unlock with close/open of a container for display
+        :param container_path: The path of the container file
+        :type container_path: str
+        :returns: One line per quick action measured along with its counterpart, empty if none measured yet
+        :rtype: str
+    """
+    lines = []
+    # L10n: quick lock/unlock action, its full counterpart and their durations
+    for quick, full, text in (('lock', 'close', _('Quick lock {quick}s, close {full}s')),
+                              ('unlock', 'open', _('Quick unlock {quick}s, open {full}s'))):
+        quick_totals, __ = get_timing_history(container_path, quick)
+        full_totals, __ = get_timing_history(container_path, full)
+        if quick_totals and full_totals:
+            lines.append(text.format(quick='{0:.2f}'.format(quick_totals[-1]), full='{0:.2f}'.format(full_totals[-1])))
+    return '\n'.join(lines)
+
+
+def describe_timing_history(container_path):
+    """ Breakdown of the last open and close into their phases, with median and slowest of the history
+        :param container_path: The path of the container file
+        :type container_path: str
+        :returns: Rich text for display, empty if nothing measured yet
+        :rtype: str
+    """
+    # L10n: actions on a container whose duration gets measured
+    titles = {'open': _('Open'), 'open-ro': _('Open read-only'), 'close': _('Close'), 'lock': _('Quick lock'),
+              'unlock': _('Quick unlock')}
+    sections = []
+    for action in ('open', 'open-ro', 'close', 'lock', 'unlock'):
+        totals, phases = get_timing_history(container_path, action)
+        if not totals:
+            continue
+        lines = ['<b>' + _('{action}: {total}s').format(action=titles[action], total='{0:.2f}'.format(totals[-1])) +
+                 '</b>']
+        lines.append(', '.join('{phase} {elapsed}s'.format(phase=phase, elapsed='{0:.2f}'.format(elapsed))
+                               for phase, elapsed in phases))
+        if len(totals) > 1:
+            ordered = sorted(totals)
+            # L10n: statistics of the remembered durations of an action
+            lines.append(_('median {median}s, slowest {slowest}s of the last {count}').format(
+                median='{0:.2f}'.format(ordered[len(ordered) // 2]), slowest='{0:.2f}'.format(ordered[-1]),
+                count=len(totals)))
+        sections.append('<br>'.join(lines))
+    read_only_lines = describe_read_only(container_path)
+    if read_only_lines:
+        sections.append('<br>'.join(['<b>' + _('Read-only compared with read-write') + '</b>'] + read_only_lines))
+    return '<br><br>'.join(sections)
+
+
 class PasswordDialog(QDialog):
 
     """ Basic dialog with a textbox input field for the password/-phrase and OK/Cancel buttons """
@@ -196,7 +360,8 @@ class UnlockContainerDialog(PasswordDialog):
 
     """ Modified PasswordDialog that communicates with the worker process to unlock an encrypted container """
 
-    def __init__(self, parent, worker, luks_device_name, encrypted_container, key_file=None, mount_point=None):
+    def __init__(self, parent, worker, luks_device_name, encrypted_container, key_file=None, mount_point=None,
+                 perf_flags=None, quick_unlock=False, read_only=False, mount_profile=None):
         """ :param parent: The parent window/dialog used to enable modal behaviour
             :type parent: :class:`PyQt5.QtGui.QWidget`
             :param worker: Communication handler with the worker process
@@ -209,11 +374,20 @@ class UnlockContainerDialog(PasswordDialog):
             :type key_file: str or None
             :param mount_point: The path of an optional mount point
             :type mount_point: str or None
+            :param perf_flags: dm-crypt performance flags to unlock with, None to use those in the header
+            :type perf_flags: list of str or None
+            :param quick_unlock: Resume a quick locked container instead of unlocking it
+            :type quick_unlock: bool
+            :param read_only: Open and mount the container read-only
+            :type read_only: bool
+            :param mount_profile: The mount options added to those of the filesystem, None for the default
+            :type mount_profile: str or None
         """
         super().__init__(parent, _('Initializing ..'), luks_device_name)
 
         self.worker = worker
         self.error_message = ''
+        self.progress_callback = lambda progress: on_unlock_progress(encrypted_container, key_file, progress)
 
         if key_file is not None:
             self.header_text.setText(
@@ -231,15 +405,30 @@ class UnlockContainerDialog(PasswordDialog):
 
         self.waiting_for_response = True
         # call worker
-        self.worker.execute(command={'type': 'request',
-                                     'msg': 'unlock',
-                                     'device_name': luks_device_name,
-                                     'container_path': encrypted_container,
-                                     'mount_point': mount_point,
-                                     'key_file': key_file
-                                     },
+        if quick_unlock:
+            command = {'type': 'request',
+                       'msg': 'resume',
+                       'device_name': luks_device_name,
+                       'container_path': encrypted_container,
+                       'key_file': key_file
+                       }
+        else:
+            command = {'type': 'request',
+                       'msg': 'unlock',
+                       'device_name': luks_device_name,
+                       'container_path': encrypted_container,
+                       'mount_point': mount_point,
+                       'key_file': key_file,
+                       'perf_flags': perf_flags,
+                       'keyslot': get_keyslot_hint(encrypted_container, key_file),
+                       'tcrypt': get_container_settings(encrypted_container).get('tcrypt'),
+                       'read_only': read_only,
+                       'mount_profile': mount_profile
+                       }
+        self.worker.execute(command=command,
                             success_callback=self.on_worker_reply,
-                            error_callback=self.on_error)
+                            error_callback=self.on_error,
+                            progress_callback=self.progress_callback)
 
     def on_accepted(self):
         """ Event handler send password/-phrase if worker ready """
@@ -256,7 +445,8 @@ class UnlockContainerDialog(PasswordDialog):
                                          'msg': str(self.pw_box.text())
                                          },
                                 success_callback=self.on_worker_reply,
-                                error_callback=self.on_error)
+                                error_callback=self.on_error,
+                                progress_callback=self.progress_callback)
 
     def reject(self):
         """ Event handler cancel:
@@ -273,7 +463,7 @@ class UnlockContainerDialog(PasswordDialog):
 
     def on_worker_reply(self, message):
         """ Success-Callback: trigger OK when unlocked, reset dialog if not """
-        if message == 'success':
+        if message == 'success' or isinstance(message, dict):  # unlock responds with the timing of each phase
             self.accept()
         else:
             if self.pw_box.text() == '':  # init
@@ -50,7 +50,7 @@ class WorkerMonitor(QThread):
         """
         super().__init__()
         self.parent = parent
-        self.success_callback, self.error_callback = None, None
+        self.success_callback, self.error_callback, self.progress_callback = None, None, None
         self.modify_sudoers = False
         self.worker = None
         self._spawn_worker()
@@ -204,6 +204,11 @@ class WorkerMonitor(QThread):
                 else:
                     return
                 assert('type' in response and 'msg' in response)
+                # progress of a long running command -> no answer yet, keep callbacks
+                if response['type'] == 'progress':
+                    if self.progress_callback is not None:
+                        QApplication.postEvent(self.parent, WorkerEvent(self.progress_callback, response['msg']))
+                    continue
                 # there should be somebody waiting for an answer!
                 assert(self.success_callback is not None and self.error_callback is not None)
                 # valid response received
@@ -212,7 +217,7 @@ class WorkerMonitor(QThread):
                 else:
                     QApplication.postEvent(self.parent, WorkerEvent(self.success_callback, response['msg']))
                 # reset callbacks
-                self.success_callback, self.error_callback = None, None
+                self.success_callback, self.error_callback, self.progress_callback = None, None, None
 
             except ValueError:
                 # worker didn't return json -> probably crashed, show everything printed to stdout
@@ -233,7 +238,7 @@ class WorkerMonitor(QThread):
                 )
                 return
 
-    def execute(self, command, success_callback, error_callback):
+    def execute(self, command, success_callback, error_callback, progress_callback=None):
         """ Writes command to workers stdin and sets callbacks for listener thread
             :param command: The function to be done by the worker is in command[`msg`]
                             the arguments are passed as named properties command[`device_name`] etc.
@@ -242,6 +247,8 @@ class WorkerMonitor(QThread):
             :type success_callback: function
             :param error_callback: The function to be called if the worker returns an error
             :type error_callback: function
+            :param progress_callback: Optional function to be called with progress information while the worker is busy
+            :type progress_callback: function(dict) or None
         """
         try:
             # valid command obj?
@@ -250,6 +257,7 @@ class WorkerMonitor(QThread):
             assert(self.success_callback is None and self.error_callback is None)
             self.success_callback = success_callback
             self.error_callback = error_callback
+            self.progress_callback = progress_callback
             self.worker.stdin.write(json.dumps(command) + '\n')
             self.worker.stdin.flush()
         except (IOError, AssertionError) as communication_error:
@@ -259,6 +267,19 @@ class WorkerMonitor(QThread):
                             response=_('Error in communication:\n{error}').format(error=str(communication_error)))
             )
 
+    def interrupt(self):
+        """ Asks the worker to stop a running background command early,
+            the callbacks stay in place to receive its answer """
+        try:
+            self.worker.stdin.write(json.dumps({'type': 'abort', 'msg': 'interrupt'}) + '\n')
+            self.worker.stdin.flush()
+        except IOError as communication_error:
+            QApplication.postEvent(
+                self.parent,
+                WorkerEvent(callback=lambda msg: show_alert(self.parent, msg, critical=True),
+                            response=_('Error in communication:\n{error}').format(error=str(communication_error)))
+            )
+
 
 class WorkerEvent(QEvent):
 
@@ -342,3 +363,65 @@ def is_installed(executable):
     return any([os.path.exists(os.path.join(p, executable))
                 for p in os.environ["PATH"].split(os.pathsep) + ['/sbin', '/usr/sbin']
                 ])
+
+
+class StorageProfiler(QThread):
+
+    """ Measure the storage a new container gets created on
+        Worker thread to avoid blocking the ui loop
+    """
+
+    def __init__(self, parent, directory):
+        """ :param parent: The setup dialog to be notified when the measurement is done
+            :type parent: :class:`PyQt5.QtGui.QWidget`
+            :param directory: The directory of the designated container file
+            :type directory: str
+        """
+        super().__init__()
+        self.parent = parent
+        self.directory = directory
+
+    def run(self):
+        """ Runs the profiler and passes a WorkerEvent with the result to the main event loop when finished """
+        from luckyLUKS.storageprofile import profile_storage
+        try:
+            profile = profile_storage(self.directory)
+        except OSError as ose:
+            QApplication.postEvent(
+                self.parent.parent(),
+                WorkerEvent(callback=lambda msg: self.parent.on_storage_profile_failed(msg),
+                            response=_('Error while measuring {directory}:\n{error}').format(
+                                directory=self.directory, error=ose.strerror or str(ose)))
+            )
+        else:
+            QApplication.postEvent(
+                self.parent.parent(),
+                WorkerEvent(callback=lambda msg: self.parent.on_storage_profiled(msg), response=profile)
+            )
+
+
+class BackgroundTask(QThread):
+
+    """ Run a function that might take a few seconds and pass its result to a callback in the ui loop
+        Worker thread to avoid blocking the ui loop
+    """
+
+    def __init__(self, parent, function, callback, *args):
+        """ :param parent: The widget whose parent receives the result event
+            :type parent: :class:`PyQt5.QtGui.QWidget`
+            :param function: The function to be called in the thread
+            :type function: function
+            :param callback: Called in the ui loop with the return value of the function
+            :type callback: function
+            :param args: Arguments passed to the function
+        """
+        super().__init__()
+        self.parent = parent
+        self.function = function
+        self.callback = callback
+        self.args = args
+
+    def run(self):
+        """ Calls the function and passes a WorkerEvent with its result to the main event loop """
+        QApplication.postEvent(self.parent.parent(),
+                               WorkerEvent(callback=self.callback, response=self.function(*self.args)))
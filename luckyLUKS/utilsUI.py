@@ -155,6 +155,22 @@ def show_message(parent, message, title, message_type):
         mb.exec_()
 
 
+def format_duration(seconds):
+    """ Helper to format a duration for display
+        :param seconds: The duration in seconds
+        :type seconds: float
+        :returns: seconds with one decimal if below one minute, [h:]mm:ss otherwise
+        :rtype: str
+    """
+    if seconds < 60:
+        return _('{seconds} s').format(seconds='{0:.1f}'.format(seconds))
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return '{0}:{1:02d}:{2:02d}'.format(hours, minutes, seconds)
+    return '{0}:{1:02d}'.format(minutes, seconds)
+
+
 class QExpander(QWidget):
 
     """A Qt implementation similar to GtkExpander."""
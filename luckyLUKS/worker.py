@@ -3,7 +3,7 @@ Because access to /dev/mapper is restricted to root, administrator privileges ar
 to handle encrypted containers as block devices. The GUI will be run from a normal
 user account while all calls to cryptsetup and mount will be executed from a separate
 worker process with administrator privileges. Everything that runs with elevated privs
-is included in this module.
+is included in this module and the low level container file handling in containerfile.py
 
 Copyright (c) 2014,2015,2022 Jasper van Hoorn (muzius@gmail.com)
 
@@ -20,6 +20,7 @@ GNU General Public License for more details.
 
 import subprocess
 import os
+import re
 import json
 import sys
 import traceback
@@ -29,10 +30,35 @@ import warnings
 import threading
 import signal
 import random
+import syslog
+import mmap
+import ctypes
+import tempfile
 from uuid import uuid4
-from time import sleep
+from time import sleep, monotonic
 import queue
 
+from luckyLUKS.containerfile import FillEngine, FillException, FillJournal, ContainerPool, MiB, JOURNAL_SUFFIX, \
+    POOL_FILLING_SUFFIX, get_allocated_size, get_fill_parameters, get_fragmentation, get_device_io_hints, \
+    prepare_container_file
+from luckyLUKS.fsprofiles import ROOT_MODE, MOUNT_PROFILES, build_mount_options, get_mount_profile, get_profile, \
+    measure_metadata, xfs_protofile
+from luckyLUKS.tcplay import TcplayDriver, TcplayException
+from luckyLUKS.pbkdf import MEMORY_SHARE, get_pbkdf_profile, get_available_memory, get_cpu_count
+from luckyLUKS import tcrypt
+from luckyLUKS.luksheader import LuksHeaderException, read_header
+from luckyLUKS.ciphers import get_cipher
+from luckyLUKS.dmcrypt import SECTOR_SIZES, WORKQUEUE_FLAGS, choose_sector_size, cryptsetup_options, \
+    find_mount_point, measure_read_latency, measure_read_throughput, measure_throughput, measure_write_latency, \
+    parse_active_flags, validate_flags
+
+# test file written to a new filesystem to measure its first-write throughput
+FIRST_WRITE_SIZE = 64 * MiB
+# scratch container used to compare encryption sector sizes
+SECTOR_BENCHMARK_SIZE = 256 * MiB
+# read from an unlocked container to compare read-only and read-write access
+READ_BENCHMARK_SIZE = 256 * MiB
+
 
 class WorkerException(Exception):
     """ Used to catch error messages from shell calls to give feedback via gtk-gui """
@@ -42,6 +68,100 @@ class UserAbort(Exception):
     """ Worker gets notified about user canceling the command -> no response needed """
 
 
+class Interrupted(Exception):
+    """ Worker gets notified to stop a background command early, eg to handle a request of the user """
+
+
+class LockedSecret():
+
+    """ Keeps a passphrase for an unattended command in memory that is locked against swapping
+        and excluded from core dumps, wiped when no longer needed. The short lived python strings
+        passed to cryptsetup/tcplay are still regular memory, but the passphrase does not sit
+        in swappable memory for the hours it takes to fill a large container.
+    """
+
+    def __init__(self, secret):
+        """ :param secret: The passphrase
+            :type secret: str
+        """
+        data = secret.encode('utf-8')
+        self._length = len(data)
+        self._size = (self._length // mmap.PAGESIZE + 1) * mmap.PAGESIZE
+        self._buffer = mmap.mmap(-1, self._size)
+        if hasattr(mmap, 'MADV_DONTDUMP'):  # python >= 3.8
+            self._buffer.madvise(mmap.MADV_DONTDUMP)
+        c_buffer = ctypes.c_char.from_buffer(self._buffer)
+        self._address = ctypes.addressof(c_buffer)
+        del c_buffer  # release export of the buffer, otherwise the mmap cannot be closed
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._locked = self._libc.mlock(ctypes.c_void_p(self._address), ctypes.c_size_t(self._size)) == 0
+        self._buffer[:self._length] = data
+
+    def get(self):
+        """ :returns: The passphrase
+            :rtype: str
+        """
+        return self._buffer[:self._length].decode('utf-8')
+
+    def wipe(self):
+        """ Overwrite the passphrase and release the locked memory """
+        if self._buffer.closed:
+            return
+        self._buffer[:] = bytes(self._size)
+        if self._locked:
+            self._libc.munlock(ctypes.c_void_p(self._address), ctypes.c_size_t(self._size))
+        self._buffer.close()
+
+
+class PhaseTimer():
+
+    """ Measures the elapsed time of the phases of a long running command with a monotonic clock.
+        Every finished phase gets reported to the UI and logged to syslog,
+        to be able to see where the time is actually spent on a given machine.
+    """
+
+    def __init__(self, report, description):
+        """ :param report: Function to send the timing of a finished phase to the UI, None to only log it
+            :type report: function(**progress) or None
+            :param description: Prefix for log messages eg the command and container path
+            :type description: str
+        """
+        self.report = report
+        self.description = description
+        self.timings = []
+        self._phase, self._start = None, None
+
+    def start(self, phase):
+        """ Start timing a phase
+            :param phase: Name of the phase eg fill, format, unlock, mkfs
+            :type phase: str
+        """
+        self._phase, self._start = phase, monotonic()
+
+    def done(self, **details):
+        """ Stop timing the current phase, report and log its duration
+            :param details: Additional values to be reported eg bytes written
+            :type details: dict
+            :returns: The elapsed time in seconds
+            :rtype: float
+        """
+        elapsed = monotonic() - self._start
+        self.timings.append((self._phase, elapsed))
+        if self.report is not None:
+            self.report(phase=self._phase, elapsed=elapsed, done=True, **details)
+        syslog.syslog(syslog.LOG_INFO, '{description}: {phase} took {elapsed:.2f}s {details}'.format(
+            description=self.description, phase=self._phase, elapsed=elapsed,
+            details=' '.join('{0}={1}'.format(key, value) for key, value in sorted(details.items()))).strip())
+        self._phase = None
+        return elapsed
+
+    def log_total(self):
+        """ Log the summed up duration of all phases """
+        syslog.syslog(syslog.LOG_INFO, '{description}: finished in {total:.2f}s ({phases})'.format(
+            description=self.description, total=sum(elapsed for __, elapsed in self.timings),
+            phases=', '.join('{0} {1:.2f}s'.format(phase, elapsed) for phase, elapsed in self.timings)))
+
+
 def com_thread(cmdqueue):
     """ Monitors the incoming pipe and puts commands in a queue. Linux signals cannot be sent
         from the parent to a privileged childprocess, so to send sigterm this thread detects if the parent
@@ -80,6 +200,9 @@ def run():
         sys.stdout.write('ESTABLISHED')
         sys.stdout.flush()
 
+    # phase timings of long running commands get logged to syslog (stdout is used for ipc)
+    syslog.openlog('luckyLUKS', syslog.LOG_PID, syslog.LOG_USER)
+
     # start thread to monitor the incomming pipe, communicate via queue
     cmdqueue = queue.Queue()
     worker = WorkerHelper(cmdqueue)
@@ -90,31 +213,78 @@ def run():
 
     with warnings.catch_warnings():
         warnings.filterwarnings('error')  # catch warnings to keep them from messing up the pipe
+        secret = None
         while True:
             response = {'type': 'response', 'msg': 'success'}  # return success unless exception
             try:
                 # arbitrary timeout needed to be able to get instant KeyboardInterrupt
                 # pythons queue.get() without timeout prefers not to be interrupted by KeyboardInterrupt :)
                 cmd = cmdqueue.get(timeout=32767)
+                if cmd['type'] == 'abort':
+                    continue  # interrupt for a background command that already finished -> no response needed
+                # passphrase supplied with an unattended command -> move to locked memory right away
+                secret = cmd.pop('passphrase', None)
+                if secret is not None:
+                    secret = LockedSecret(secret)
                 if cmd['msg'] == 'status':
                     is_unlocked = worker.check_status(cmd['device_name'], cmd['container_path'],
                                                       cmd['key_file'], cmd['mount_point'])
                     if not is_unlocked and cmd['key_file'] is not None:  # if keyfile used try to unlock on startup
                         worker.unlock_container(cmd['device_name'], cmd['container_path'],
-                                                cmd['key_file'], cmd['mount_point'])
+                                                cmd['key_file'], cmd['mount_point'],
+                                                perf_flags=cmd.get('perf_flags'), keyslot=cmd.get('keyslot'),
+                                                tcrypt_hint=cmd.get('tcrypt'), read_only=cmd.get('read_only', False),
+                                                mount_profile=cmd.get('mount_profile'))
                         response['msg'] = 'unlocked'
+                    elif is_unlocked and worker.is_suspended(cmd['device_name']):
+                        response['msg'] = 'suspended'
                     else:
                         response['msg'] = 'unlocked' if is_unlocked else 'closed'
                 elif cmd['msg'] == 'unlock':
-                    worker.unlock_container(cmd['device_name'], cmd['container_path'],
-                                            cmd['key_file'], cmd['mount_point'])
+                    timings = worker.unlock_container(cmd['device_name'], cmd['container_path'],
+                                                      cmd['key_file'], cmd['mount_point'],
+                                                      perf_flags=cmd.get('perf_flags'), keyslot=cmd.get('keyslot'),
+                                                      tcrypt_hint=cmd.get('tcrypt'),
+                                                      read_only=cmd.get('read_only', False),
+                                                      mount_profile=cmd.get('mount_profile'))
+                    response['msg'] = {'timings': timings}
+                elif cmd['msg'] == 'unlock_all':
+                    response['msg'] = worker.unlock_containers(cmd['containers'])
                 elif cmd['msg'] == 'close':
-                    worker.close_container(cmd['device_name'], cmd['container_path'])
+                    response['msg'] = {'timings': worker.close_container(cmd['device_name'], cmd['container_path'],
+                                                                         cmd.get('mount_profile'))}
+                elif cmd['msg'] == 'suspend':
+                    worker.suspend_container(cmd['device_name'], cmd['container_path'])
+                elif cmd['msg'] == 'resume':
+                    worker.resume_container(cmd['device_name'], cmd['container_path'], cmd.get('key_file'))
                 elif cmd['msg'] == 'create':
                     worker.create_container(cmd['device_name'], cmd['container_path'],
                                             cmd['container_size'], cmd['filesystem_type'],
                                             cmd['encryption_format'], cmd['key_file'],
-                                            cmd['quickformat'])
+                                            cmd['quickformat'], cmd.get('direct_io', True),
+                                            cmd.get('resume', False), cmd.get('unattended', False), secret,
+                                            cmd.get('pool_dir'), cmd.get('io_priority', 'normal'),
+                                            cmd.get('rate_limit', 0), cmd.get('benchmark', False),
+                                            cmd.get('fill_chunk_size', 0), cmd.get('pbkdf_profile'),
+                                            cmd.get('cipher'), cmd.get('perf_flags'), cmd.get('sector_size', 0),
+                                            cmd.get('thin', False))
+                elif cmd['msg'] == 'pool_fill':
+                    response['msg'] = worker.fill_pool(cmd['pool_dir'], cmd['pool_sizes'], cmd['pool_quota'],
+                                                       cmd.get('pool_rate_limit', 0))
+                elif cmd['msg'] == 'perf_flags':
+                    response['msg'] = worker.set_perf_flags(cmd['device_name'], cmd['container_path'],
+                                                            cmd['perf_flags'])
+                elif cmd['msg'] == 'compact':
+                    response['msg'] = worker.compact_container(cmd['device_name'], cmd['container_path'])
+                elif cmd['msg'] == 'mount_benchmark':
+                    response['msg'] = worker.benchmark_mount_profiles(cmd['device_name'], cmd['container_path'],
+                                                                      cmd.get('mount_profile'))
+                elif cmd['msg'] == 'read_benchmark':
+                    response['msg'] = worker.benchmark_read(cmd['device_name'], cmd['container_path'])
+                elif cmd['msg'] == 'perf_benchmark':
+                    response['msg'] = worker.benchmark_perf_flags(cmd['device_name'], cmd['container_path'])
+                elif cmd['msg'] == 'sector_benchmark':
+                    response['msg'] = worker.benchmark_sector_sizes(cmd['container_dir'], cmd.get('cipher'))
                 elif cmd['msg'] == 'authorize':
                     worker.modify_sudoers(os.getenv("SUDO_UID"), nopassword=True)
                 else:
@@ -133,23 +303,42 @@ def run():
                 sys.exit(0)
             except Exception:  # catch ANY exception (including warnings) to show via gui
                 response = {'type': 'error', 'msg': ''.join(traceback.format_exception(*sys.exc_info()))}
+            finally:
+                if secret is not None:
+                    secret.wipe()
+                    secret = None
+                if worker.is_background_priority:
+                    worker.set_background_priority(False)
             sys.stdout.write(json.dumps(response) + '\n')
             sys.stdout.flush()
 
 
 class WorkerHelper():
 
-    """ accepts 5 commands:
+    """ accepts 13 commands:
         -> check_status() validates the input and returns the current state (unlocked/closed) of the container
         -> unlock_container() asks for the passphrase and tries to unlock and mount a container
+        -> unlock_containers() unlocks and mounts several containers with key files concurrently, eg at login
         -> close_container() closes and unmounts a container
+        -> suspend_container()/resume_container() quick lock and unlock a container, keeping it mounted
         -> create_container() initializes a new encrypted LUKS container and sets up the filesystem
+        -> set_perf_flags() changes the dm-crypt performance flags of an unlocked container
+        -> compact_container() gives the space freed inside an unlocked thin container back to the disk
+        -> benchmark_mount_profiles() compares a metadata-heavy workload on a mounted container across mount profiles
+        -> benchmark_read() measures the read throughput of an unlocked container (read-only or read-write)
+        -> benchmark_perf_flags() compares the I/O latency of an unlocked container with and without workqueues
+        -> benchmark_sector_sizes() compares the throughput of 512 and 4096 byte encryption sectors
+        -> fill_pool() prepares container files filled with random data in the background for later creates
         -> modify_sudoers() adds sudo access to the program without password for the current user (/etc/sudoers.d/)
     """
 
     def __init__(self, cmdqueue=None):
         """ Check tcplay installation """
         self.cmdqueue = cmdqueue
+        self.is_background_priority = False
+        self._can_disable_veracrypt = None
+        # unlock_containers() reports progress from several threads
+        self._output_lock = threading.Lock()
         self.is_tc_installed = any([os.path.exists(os.path.join(p, 'tcplay'))
                                     for p in os.environ["PATH"].split(os.pathsep)])
 
@@ -174,7 +363,25 @@ class WorkerHelper():
 
         return response['msg']
 
-    def check_status(self, device_name, container_path, key_file=None, mount_point=None):
+    def report_progress(self, **progress):
+        """ Sends progress information of a long running command to the UI, no response expected
+            :param progress: named progress values eg phase, bytes done, total bytes and bytes per second
+            :type progress: dict
+        """
+        with self._output_lock:
+            sys.stdout.write(json.dumps({'type': 'progress', 'msg': progress}) + '\n')
+            sys.stdout.flush()
+
+    def report_tcplay_progress(self, percent, stage):
+        """ Passes the progress of tcplay creating a TrueCrypt container to the UI
+            :param percent: Progress reported by tcplay or None if only a prompt got answered
+            :type percent: float or None
+            :param stage: The answered prompt (passphrase, repeat, confirm) or `progress`
+            :type stage: str
+        """
+        self.report_progress(phase='format', percent=percent, stage=stage)
+
+    def check_status(self, device_name, container_path, key_file=None, mount_point=None, read_only=None):
         """
             Validates the input and returns the current state (unlocked/closed) of the container.
             The checks are sufficient to keep users from shooting themselves in the foot and
@@ -190,6 +397,9 @@ class WorkerHelper():
             :type key_file: str or None
             :param mount_point: The path of an optional mount point
             :type mount_point: str or None
+            :param read_only: The container is going to be opened read-only (True) or read-write (False),
+                              an unlocked container has to be open in the same mode. None to accept both
+            :type read_only: bool or None
             :returns: True if LUKS device is active/unlocked
             :rtype: bool
             :raises: WorkerException
@@ -217,6 +427,11 @@ class WorkerHelper():
                                         'using a different container\n'
                                         'Please change the name to unlock this container')
                                       .format(file_path=container_path, device_name=device_name))
+            if read_only is not None and read_only != self.is_read_only(device_name):
+                raise WorkerException(_('<b>{device_name}</b> is already unlocked {mode}.\n'
+                                        'Please close it first to change the access mode')
+                                      .format(device_name=device_name,
+                                              mode=_('read-write') if read_only else _('read-only')))
 
         # container is not unlocked
         else:
@@ -261,6 +476,13 @@ class WorkerHelper():
                     .format(file_path=container_path, existing_device=existing_device_name)
                 )
 
+            # containers on read-only media (eg optical discs, read-only network shares) cannot be opened read-write
+            if read_only is False and os.statvfs(container_path).f_flag & os.ST_RDONLY:
+                raise WorkerException(
+                    _('Container file is on a read-only filesystem:\n{file_path}\n\n'
+                      'Please open it read-only').format(file_path=container_path)
+                )
+
             # validate key_file if given
             if (key_file is not None and
                 any([(not os.path.exists(key_file)),
@@ -292,8 +514,9 @@ class WorkerHelper():
 
         return is_unlocked
 
-    def unlock_container(self, device_name, container_path, key_file=None, mount_point=None, pw_callback=None):
-        """ Unlocks LUKS or Truecrypt containers.
+    def unlock_container(self, device_name, container_path, key_file=None, mount_point=None, pw_callback=None,
+                         perf_flags=None, keyslot=None, tcrypt_hint=None, read_only=False, mount_profile=None):
+        """ Unlocks LUKS, TrueCrypt or VeraCrypt containers.
             Validates input and keeps asking
             for the passphrase until successfull unlock,
             followed by an optional mount.
@@ -307,88 +530,391 @@ class WorkerHelper():
             :type mount_point: str or None
             :param pw_callback: A callback function that returns the password for unlocking
             :type pw_callback: function()
+            :param perf_flags: dm-crypt performance flags (see dmcrypt.PERF_FLAGS), stored in the header of LUKS2
+                               containers. None to use the flags already stored in the header
+            :type perf_flags: list of str or None
+            :param keyslot: The LUKS keyslot to try first, eg the one that matched on the last unlock
+            :type keyslot: int or None
+            :param tcrypt_hint: The TrueCrypt/VeraCrypt variant and hash to try first (see tcrypt.TCRYPT_VARIANTS)
+            :type tcrypt_hint: dict or None
+            :param read_only: Open and mount read-only: the container file can be on read-only or shared media,
+                              nothing gets written to it (no journal replay, atime updates or header changes)
+            :type read_only: bool
+            :param mount_profile: The mount options added to those of the filesystem (see fsprofiles.MOUNT_PROFILES),
+                                  None for the default
+            :type mount_profile: str or None
+            :returns: Seconds spent in each phase (check, header, losetup, open, mount), without waiting for
+                      the passphrase. Empty if the container was unlocked already
+            :rtype: list of (str, float)
             :raises: WorkerException
         """
-        is_unlocked = self.check_status(device_name, container_path, key_file, mount_point)
+        # the create command has its own timing of the whole unlock -> only log the phases
+        timer = PhaseTimer(None, 'unlock ' + container_path)
+        timer.start('check')
+        read_only = bool(read_only)
+        is_unlocked = self.check_status(device_name, container_path, key_file, mount_point, read_only)
+        if keyslot is not None and (not isinstance(keyslot, int) or not 0 <= keyslot < 32):
+            raise WorkerException(_('Invalid keyslot: {keyslot}').format(keyslot=str(keyslot)))
+        try:
+            tcrypt_hint = tcrypt.validate_hint(tcrypt_hint)
+        except ValueError as ve:
+            raise WorkerException(str(ve)) from ve
+        if perf_flags is not None:
+            try:
+                perf_flags = validate_flags(perf_flags)
+            except ValueError as ve:
+                raise WorkerException(str(ve)) from ve
+        if get_mount_profile(mount_profile) is None:
+            raise WorkerException(_('Unknown mount profile: {profile}').format(profile=str(mount_profile)))
         if not is_unlocked:  # just return if unlocked -> does not mount an already unlocked container
             if pw_callback is None:
                 pw_callback = lambda: self.communicate('getPassword')
+            timer.done()
+            timer.start('header')
+            # check if LUKS container, try TrueCrypt/VeraCrypt otherwise (tc container cannot be identified by design)
+            luks_header = self.read_luks_header(container_path)
+            container_is_luks = luks_header is not None
+            timer.done()
+            timer.start('losetup')
             # workaround udisks-daemon crash (udisksd from udisks2 is okay): although cryptsetup is able to handle
             # loopback device creation/teardown itself, using this crashes udisks-daemon
             # -> manual loopback device handling here
             # TODO: could be removed, udisks is replaced with udisks2 since ~2016
-            try:
-                loop_dev = subprocess.check_output(
-                    ['losetup', '-f', '--show', container_path],
-                    stderr=subprocess.PIPE, universal_newlines=True
-                ).strip()
-            except subprocess.CalledProcessError as cpe:
-                # most likely no more loopdevices available
-                raise WorkerException(cpe.output) from cpe
+            loop_dev = self.attach_loopback_device(
+                container_path, luks_header['sector_size'] if container_is_luks else 512, read_only)
+            timer.done()
             crypt_initialized = False
 
             try:
-                # check if LUKS container, try Truecrypt otherwise (tc container cannot be identified by design)
-                container_is_luks = (subprocess.call(['cryptsetup', 'isLuks', container_path]) == 0)
                 if container_is_luks:
-                    open_command = ['cryptsetup', 'open', loop_dev, device_name]
+                    # verbose: reports the keyslot that matched
+                    open_command = ['cryptsetup', 'open', '--verbose', loop_dev, device_name]
                 else:
+                    keyslot = None
                     open_command = ['cryptsetup', 'open', '--type', 'tcrypt', loop_dev, device_name]
+                if read_only:
+                    open_command.append('--readonly')
+                if perf_flags is not None:
+                    open_command += cryptsetup_options(perf_flags)
+                    # only write the header if the flags changed
+                    if (container_is_luks and luks_header['version'] == 2 and perf_flags != luks_header['flags'] and
+                            not read_only):
+                        open_command.append('--persistent')
 
-                with open(os.devnull) as DEVNULL:
+                if key_file is not None:
+                    open_command += ['--key-file', key_file]
+                while not is_unlocked:
                     if key_file is None:
-                        while not is_unlocked:
-                            p = subprocess.Popen(
-                                open_command,
-                                stdin=subprocess.PIPE, stderr=subprocess.PIPE, stdout=DEVNULL,
-                                universal_newlines=True, close_fds=True
-                            )
-                            __, errors = p.communicate(pw_callback())
-                            if p.returncode == 0:
-                                is_unlocked = True
-                            elif p.returncode == 2:  # cryptsetup: no permission (bad passphrase)
-                                continue
-                            else:
-                                raise WorkerException(errors)
+                        passphrase = pw_callback()
                     else:
-                        open_command += ['--key-file', key_file]
-                        p = subprocess.Popen(
-                            open_command,
-                            stdin=subprocess.PIPE, stderr=subprocess.PIPE, stdout=DEVNULL,
-                            universal_newlines=True, close_fds=True
-                        )
-                        if container_is_luks:
-                            __, errors = p.communicate()
-                        else:
-                            # tcplay with keyfile only means empty password
-                            __, errors = p.communicate('\n')
-                        if p.returncode != 0:
-                            if p.returncode == 2:
-                                # error message from cryptsetup is a bit ambiguous
-                                raise WorkerException(_('Open container failed.\nPlease check key file'))
-                            raise WorkerException(errors)
+                        # tcplay with keyfile only means empty password
+                        passphrase = '' if container_is_luks else '\n'
+                    # only the attempt that succeeds counts, not the time spent entering passphrases
+                    timer.start('open')
+                    if container_is_luks:
+                        returncode, output, errors, elapsed = self.open_device(open_command, passphrase, keyslot)
+                        hint_matched = keyslot is not None and returncode == 0
+                        if returncode != 0 and keyslot is not None:
+                            # another keyslot than last time or the keyslot got removed -> let cryptsetup try all
+                            returncode, output, errors, elapsed = self.open_device(open_command, passphrase)
+                    else:
+                        returncode, errors, variant, hint_matched, elapsed = tcrypt.unlock(
+                            open_command, passphrase, tcrypt_hint, get_cpu_count(), self.can_disable_veracrypt())
+                    passphrase = None
+                    if returncode == 0:
+                        is_unlocked = True
+                    elif returncode == 2 and key_file is None:  # cryptsetup: no permission (bad passphrase)
+                        continue
+                    elif returncode == 2:
+                        # error message from cryptsetup is a bit ambiguous
+                        raise WorkerException(_('Open container failed.\nPlease check key file'))
+                    else:
+                        raise WorkerException(errors)
+                timer.done()
+                if container_is_luks:
+                    self.report_keyslot(container_path, luks_header, output, elapsed, hint_matched)
+                else:
+                    self.report_tcrypt_variant(container_path, variant, elapsed, hint_matched)
                 crypt_initialized = True
             finally:
                 if not crypt_initialized:
                     self.detach_loopback_device(loop_dev)
 
             if mount_point is not None:  # only mount if optional parameter mountpoint is set
+                timer.start('mount')
                 try:
                     subprocess.check_output(
-                        ['mount', '-o', 'nosuid,nodev', self.get_device_mapper_name(device_name), mount_point],
+                        ['mount', '-o', self.get_mount_options(device_name, read_only, mount_profile),
+                         self.get_device_mapper_name(device_name), mount_point],
                         stderr=subprocess.STDOUT, universal_newlines=True)
                 except subprocess.CalledProcessError as cpe:
                     raise WorkerException(cpe.output) from cpe
+                timer.done()
+            timer.log_total()
+            self.report_timings('open-ro' if read_only else 'open', timer.timings)
+        return timer.timings
+
+    def unlock_containers(self, containers):
+        """ Unlocks and mounts several containers with key files at once, eg at the start of a desktop session.
+            Each unlock runs in its own thread: the key derivations run in parallel on the available cores
+            instead of one after the other. As many unlocks as there are cpus run at the same time, fewer if their
+            Argon2 keyslots would need more than MEMORY_SHARE of the available memory together.
+            :param containers: device_name, container_path, key_file and optional mount_point, perf_flags,
+                               keyslot, tcrypt (hints, see unlock_container()), read_only and mount_profile
+                               of each container
+            :type containers: list of dict
+            :returns: results with container_path, device_name, state (unlocked, already unlocked or failed),
+                      error, elapsed seconds and the timings of each phase in the order given,
+                      and the total wall time in seconds
+            :rtype: dict
+            :raises: WorkerException
+        """
+        if not isinstance(containers, list) or not all(isinstance(container, dict) for container in containers):
+            raise WorkerException(_('Error in communication:\n{error}').format(error='containers'))
+        start = monotonic()
+        concurrency = get_cpu_count()
+        memory_budget = int(get_available_memory() * MEMORY_SHARE)
+        results = [None] * len(containers)
+        scheduler = threading.Condition()
+        running = {'unlocks': 0, 'memory': 0}
+
+        def can_start(memory):
+            # a single unlock always starts, cryptsetup decides whether its keyslot fits into memory
+            if running['unlocks'] == 0:
+                return True
+            if running['unlocks'] >= concurrency:
+                return False
+            return memory_budget == 0 or running['memory'] + memory <= memory_budget
+
+        def unlock(index, container):
+            result = {'container_path': container.get('container_path'), 'device_name': container.get('device_name'),
+                      'error': None, 'elapsed': 0, 'timings': []}
+            memory = self.get_unlock_memory(container.get('container_path'), container.get('keyslot'))
+            with scheduler:
+                scheduler.wait_for(lambda: can_start(memory))
+                running['unlocks'] += 1
+                running['memory'] += memory
+            unlock_start = monotonic()
+            try:
+                if container.get('key_file') is None:
+                    raise WorkerException(_('No key file given, only containers with key files can be '
+                                            'unlocked unattended'))
+                result['timings'] = self.unlock_container(
+                    container['device_name'], container['container_path'], container['key_file'],
+                    container.get('mount_point'), perf_flags=container.get('perf_flags'),
+                    keyslot=container.get('keyslot'), tcrypt_hint=container.get('tcrypt'),
+                    read_only=container.get('read_only', False), mount_profile=container.get('mount_profile'))
+                result['state'] = 'unlocked' if result['timings'] else 'already unlocked'
+            except WorkerException as we:
+                result['state'], result['error'] = 'failed', str(we)
+            except KeyError as ke:
+                result['state'] = 'failed'
+                result['error'] = _('Error in communication:\n{error}').format(error=str(ke))
+            except Exception:  # report and go on with the other containers
+                result['state'], result['error'] = 'failed', ''.join(traceback.format_exception(*sys.exc_info()))
+            finally:
+                result['elapsed'] = monotonic() - unlock_start
+                with scheduler:
+                    running['unlocks'] -= 1
+                    running['memory'] -= memory
+                    scheduler.notify_all()
+            results[index] = result
+
+        threads = [threading.Thread(target=unlock, args=(index, container))
+                   for index, container in enumerate(containers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        total = monotonic() - start
+        # elapsed times include the contention of the concurrent unlocks: their sum is no serial estimate
+        syslog.syslog(syslog.LOG_INFO, 'unlock {count} containers: finished in {total:.2f}s, '
+                      'sum of parallel elapsed times {elapsed:.2f}s'.format(
+                          count=len(results), total=total, elapsed=sum(result['elapsed'] for result in results)))
+        return {'results': results, 'total': total}
+
+    def get_unlock_memory(self, container_path, keyslot=None):
+        """ Estimates the memory needed to unlock a container: cryptsetup tries the keyslots one after the
+            other, so the largest Argon2 keyslot counts unless the keyslot that will match is known
+            :param container_path: The path of the container file
+            :type container_path: str
+            :param keyslot: The LUKS keyslot tried first
+            :type keyslot: int or None
+            :returns: Memory in bytes, 0 for PBKDF2 keyslots, TrueCrypt/VeraCrypt and unreadable containers
+            :rtype: int
+        """
+        try:
+            header = read_header(container_path)
+        except (IOError, OSError, TypeError, LuksHeaderException):
+            return 0
+        if header is None:
+            return 0
+        keyslots = [entry for entry in header['keyslots'] if entry['keyslot'] == keyslot] or header['keyslots']
+        return max([entry.get('memory', 0) for entry in keyslots] or [0])
+
+    def open_device(self, open_command, passphrase, keyslot=None):
+        """ Runs cryptsetup open once
+            :param open_command: The cryptsetup command
+            :type open_command: list of str
+            :param passphrase: Sent to cryptsetup on stdin
+            :type passphrase: str
+            :param keyslot: Only try this LUKS keyslot
+            :type keyslot: int or None
+            :returns: returncode, output and errors of cryptsetup and the elapsed seconds
+            :rtype: tuple
+        """
+        if keyslot is not None:
+            open_command = open_command + ['--key-slot', str(keyslot)]
+        start = monotonic()
+        p = subprocess.Popen(
+            open_command,
+            stdin=subprocess.PIPE, stderr=subprocess.PIPE, stdout=subprocess.PIPE,
+            universal_newlines=True, close_fds=True
+        )
+        output, errors = p.communicate(passphrase)
+        return p.returncode, output, errors, monotonic() - start
+
+    def report_keyslot(self, container_path, luks_header, output, elapsed, hint_matched):
+        """ Tells the UI which keyslot unlocked the container, to try it first next time.
+            Without the hint cryptsetup derives the key of every keyslot before the matching one as well,
+            the time saved is estimated from the duration of the unlock.
+            :param container_path: The path of the container file
+            :type container_path: str
+            :param luks_header: The header information, see luksheader.read_header()
+            :type luks_header: dict
+            :param output: Output of the verbose cryptsetup open
+            :type output: str
+            :param elapsed: Duration of the successful cryptsetup open in seconds
+            :type elapsed: float
+            :param hint_matched: The container got unlocked with the keyslot tried first
+            :type hint_matched: bool
+        """
+        match = re.search(r'Key slot (\d+) unlocked', output)
+        if match is None:
+            return
+        keyslot = int(match.group(1))
+        saved = 0
+        if hint_matched:
+            saved = elapsed * len([other for other in luks_header['keyslots'] if other['keyslot'] < keyslot])
+        self.report_progress(phase='keyslot', container_path=container_path, keyslot=keyslot,
+                             hint_matched=hint_matched, elapsed=elapsed, saved=saved)
+        syslog.syslog(syslog.LOG_INFO, 'unlock {path}: keyslot {keyslot} in {elapsed:.2f}s, hint {hint}, '
+                      '{saved:.2f}s saved'.format(path=container_path, keyslot=keyslot, elapsed=elapsed,
+                                                  hint='matched' if hint_matched else 'not used', saved=saved))
+
+    def report_tcrypt_variant(self, container_path, variant, elapsed, hint_matched):
+        """ Tells the UI which TrueCrypt/VeraCrypt variant and hash unlocked the container, to try them first
+            next time. Hidden volumes are never reported: remembering them would reveal their existence.
+            :param container_path: The path of the container file
+            :type container_path: str
+            :param variant: The variant and hash that succeeded
+            :type variant: tuple
+            :param elapsed: Duration of unlocking in seconds
+            :type elapsed: float
+            :param hint_matched: The container got unlocked with the variant tried first
+            :type hint_matched: bool
+        """
+        if tcrypt.is_hidden(variant[0]):
+            return
+        self.report_progress(phase='tcrypt', container_path=container_path, variant=variant[0], hash=variant[1],
+                             hint_matched=hint_matched, elapsed=elapsed)
+        syslog.syslog(syslog.LOG_INFO, 'unlock {path}: {variant} {hash} in {elapsed:.2f}s, hint {hint}'.format(
+            path=container_path, variant=variant[0], hash=variant[1], elapsed=elapsed,
+            hint='matched' if hint_matched else 'not used'))
+
+    def can_disable_veracrypt(self):
+        """ Newer cryptsetup versions check for VeraCrypt headers by default, TrueCrypt candidates
+            only need to derive the TrueCrypt header key if it can be turned off
+            :returns: cryptsetup knows --disable-veracrypt
+            :rtype: bool
+        """
+        if self._can_disable_veracrypt is None:
+            try:
+                self._can_disable_veracrypt = '--disable-veracrypt' in subprocess.check_output(
+                    ['cryptsetup', '--help'], stderr=subprocess.STDOUT, universal_newlines=True)
+            except (OSError, subprocess.CalledProcessError):
+                self._can_disable_veracrypt = False
+        return self._can_disable_veracrypt
+
+    def get_mount_options(self, device_name, read_only=False, mount_profile=None, remount=False):
+        """ Combines the mount options of the filesystem profile matching the filesystem of an unlocked container
+            with those of the mount profile
+            :param device_name: The device mapper name
+            :type device_name: str
+            :param read_only: Mount read-only
+            :type read_only: bool
+            :param mount_profile: The name of the mount profile, None for the default
+            :type mount_profile: str or None
+            :param remount: Options for mount -o remount, see fsprofiles.build_mount_options()
+            :type remount: bool
+            :returns: The mount options, always including `nosuid,nodev`
+            :rtype: str
+            :raises: WorkerException
+        """
+        filesystem = self.get_filesystem_type(device_name)
+        features = self.get_filesystem_features(device_name) if filesystem in ('ext4', 'ext3', 'ext2') else None
+        try:
+            return build_mount_options(filesystem, mount_profile, read_only, remount, features)
+        except ValueError as ve:
+            raise WorkerException(str(ve)) from ve
 
-    def close_container(self, device_name, container_path):
+    def get_filesystem_type(self, device_name):
+        """ :param device_name: The device mapper name
+            :type device_name: str
+            :returns: The filesystem type of an unlocked container as reported by blkid, None if unknown
+            :rtype: str or None
+        """
+        try:
+            return subprocess.check_output(
+                ['blkid', '-o', 'value', '-s', 'TYPE', self.get_device_mapper_name(device_name)],
+                stderr=subprocess.STDOUT, universal_newlines=True).strip() or None
+        except (subprocess.CalledProcessError, OSError):
+            return None
+
+    def get_filesystem_features(self, device_name):
+        """ :param device_name: The device mapper name
+            :type device_name: str
+            :returns: The features of an ext2/3/4 filesystem in an unlocked container (eg has_journal),
+                      None if they cannot be read
+            :rtype: list of str or None
+        """
+        try:
+            with open(os.devnull, 'w') as DEVNULL:
+                output = subprocess.check_output(['dumpe2fs', '-h', self.get_device_mapper_name(device_name)],
+                                                 stderr=DEVNULL, universal_newlines=True)
+        except (subprocess.CalledProcessError, OSError):
+            return None
+        for line in output.splitlines():
+            if line.startswith('Filesystem features:'):
+                return line.split(':', 1)[1].split()
+        return None
+
+    def close_container(self, device_name, container_path, mount_profile=None):
         """ Validates input and tries to unmount /dev/mapper/<name> and close container
             :param device_name: The device mapper name
             :type device_name: str
             :param container_path: The path of the container file
             :type container_path: str
+            :param mount_profile: The mount profile of the container, trims freed blocks before unmounting
+                                  if the profile asks for it
+            :type mount_profile: str or None
+            :returns: Seconds spent in each phase (check, trim, umount, close, losetup). Empty if not unlocked
+            :rtype: list of (str, float)
             :raises: WorkerException
         """
+        timer = PhaseTimer(None, 'close ' + container_path)
+        timer.start('check')
         if self.check_status(device_name, container_path):  # just return if not unlocked
+            if self.is_suspended(device_name):
+                # unmounting would block on the suspended device
+                raise WorkerException(_('The container is quick locked,\nplease unlock it before closing'))
+            timer.done()
+            profile = get_mount_profile(mount_profile)
+            if profile is not None and profile.trim_on_close:
+                timer.start('trim')
+                self.trim_container(device_name)
+                timer.done()
+            timer.start('umount')
             # for all mounting /dev/mapper/device_name is used
             try:
                 # unfortunately, umount returns the same errorcode for device not mounted and device busy
@@ -402,6 +928,8 @@ class WorkerHelper():
             except subprocess.CalledProcessError as cpe:
                 if 'not mounted' not in cpe.output:  # ignore if not mounted and proceed with closing the container
                     raise WorkerException(_('Unable to close container, device is busy')) from cpe
+            timer.done()
+            timer.start('close')
             # get reference to loopback device before closing the container
             associated_loop = self.get_loopback_device(device_name)
             try:
@@ -411,23 +939,201 @@ class WorkerHelper():
                 )
             except subprocess.CalledProcessError as cpe:
                 raise WorkerException(cpe.output) from cpe
+            timer.done()
+            timer.start('losetup')
             # remove loopback device
             sleep(0.2)  # give udisks some time to process closing of container ..
             self.detach_loopback_device(associated_loop)
+            timer.done()
+            timer.log_total()
+            self.report_timings('close', timer.timings)
+        return timer.timings
+
+    def trim_container(self, device_name):
+        """ Tells the drive about all blocks freed in the filesystem of a mounted container at once (batched trim).
+            Only reaches the drive if the container has been unlocked with the allow_discards dm-crypt option,
+            failures get logged only: closing the container is more important.
+            :param device_name: The device mapper name
+            :type device_name: str
+        """
+        mount_point = find_mount_point(self.get_device_mapper_name(device_name))
+        if mount_point is None or self.is_read_only(device_name):
+            return
+        try:
+            output = subprocess.check_output(['fstrim', '--verbose', mount_point],
+                                             stderr=subprocess.STDOUT, universal_newlines=True)
+            syslog.syslog(syslog.LOG_INFO, 'close {device}: {output}'.format(device=device_name, output=output.strip()))
+        except (subprocess.CalledProcessError, OSError) as error:
+            syslog.syslog(syslog.LOG_WARNING, 'close {device}: fstrim failed: {error}'.format(
+                device=device_name, error=getattr(error, 'output', None) or str(error)))
+
+    def compact_container(self, device_name, container_path):
+        """ Gives the space freed inside a mounted container back to the disk: fstrim discards the unused blocks
+            of the filesystem, dm-crypt passes them on if allowed and the loopback device punches holes
+            into the container file for them
+            :param device_name: The device mapper name
+            :type device_name: str
+            :param container_path: The path of the container file
+            :type container_path: str
+            :returns: apparent size, allocated disk space before and after in bytes and the seconds fstrim took
+            :rtype: dict
+            :raises: WorkerException
+        """
+        if not self.check_status(device_name, container_path):
+            raise WorkerException(_('The container has to be unlocked to compact it'))
+        if self.is_suspended(device_name):
+            raise WorkerException(_('The container is quick locked,\nplease unlock it before compacting'))
+        if self.is_read_only(device_name):
+            raise WorkerException(_('Read-only containers cannot be compacted'))
+        if 'allow_discards' not in self.get_active_flags(device_name):
+            raise WorkerException(_('Discards are not allowed for this container:\n'
+                                    'enable `allow_discards` in the dm-crypt options to compact it'))
+        mount_point = find_mount_point(self.get_device_mapper_name(device_name))
+        if mount_point is None:
+            raise WorkerException(_('The container has to be mounted to compact it'))
+        before = get_allocated_size(container_path)
+        start = monotonic()
+        try:
+            output = subprocess.check_output(['fstrim', '--verbose', mount_point],
+                                             stderr=subprocess.STDOUT, universal_newlines=True)
+        except subprocess.CalledProcessError as cpe:
+            raise WorkerException(cpe.output) from cpe
+        except OSError as ose:
+            raise WorkerException(str(ose)) from ose
+        elapsed = monotonic() - start
+        after = get_allocated_size(container_path)
+        syslog.syslog(syslog.LOG_INFO, 'compact {container}: {output}, {before} -> {after} bytes allocated'.format(
+            container=container_path, output=output.strip(), before=before['allocated'], after=after['allocated']))
+        return {'apparent': after['apparent'], 'allocated_before': before['allocated'],
+                'allocated': after['allocated'], 'elapsed': elapsed}
+
+    def report_timings(self, action, timings):
+        """ Sends the duration of an open, close, quick lock or quick unlock to the UI, kept in a per container history
+            :param action: One of `open`, `close`, `lock`, `unlock`
+            :type action: str
+            :param timings: Seconds spent in each phase
+            :type timings: list of (str, float)
+        """
+        self.report_progress(phase='timing', action=action, elapsed=sum(elapsed for __, elapsed in timings),
+                             phases=timings)
+
+    def suspend_container(self, device_name, container_path):
+        """ Quick lock: flushes and suspends the device mapper device and wipes the volume key from kernel memory.
+            Loopback device and mount stay in place, processes accessing the container block until it gets resumed.
+            :param device_name: The device mapper name
+            :type device_name: str
+            :param container_path: The path of the container file
+            :type container_path: str
+            :raises: WorkerException
+        """
+        if not self.check_status(device_name, container_path):
+            raise WorkerException(_('The container needs to be unlocked\nto lock it quickly'))
+        if self.read_luks_header(container_path) is None:
+            raise WorkerException(_('Only LUKS containers can be locked quickly'))
+        if self.is_suspended(device_name):
+            return
+        start = monotonic()
+        try:
+            subprocess.check_output(['cryptsetup', 'luksSuspend', device_name],
+                                    stderr=subprocess.STDOUT, universal_newlines=True)
+        except subprocess.CalledProcessError as cpe:
+            raise WorkerException(cpe.output) from cpe
+        elapsed = monotonic() - start
+        self.report_timings('lock', [('suspend', elapsed)])
+        syslog.syslog(syslog.LOG_INFO, 'quick lock {path} in {elapsed:.2f}s'.format(path=container_path,
+                                                                                    elapsed=elapsed))
+
+    def resume_container(self, device_name, container_path, key_file=None, pw_callback=None):
+        """ Quick unlock: resumes a suspended container, keeps asking for the passphrase until it matches
+            :param device_name: The device mapper name
+            :type device_name: str
+            :param container_path: The path of the container file
+            :type container_path: str
+            :param key_file: The path to an optional keyfile to be used for the container
+            :type key_file: str or None
+            :param pw_callback: A callback function that returns the password for unlocking
+            :type pw_callback: function()
+            :raises: WorkerException
+        """
+        if not self.check_status(device_name, container_path, key_file):
+            raise WorkerException(_('The container has been closed'))
+        if not self.is_suspended(device_name):
+            return
+        if pw_callback is None:
+            def pw_callback():
+                return self.communicate('getPassword')
+        resume_command = ['cryptsetup', 'luksResume', device_name]
+        if key_file is not None:
+            resume_command += ['--key-file', key_file]
+        start, waited = monotonic(), 0
+        while True:
+            if key_file is None:
+                wait_start = monotonic()
+                passphrase = pw_callback()
+                waited += monotonic() - wait_start
+            else:
+                passphrase = ''
+            p = subprocess.Popen(resume_command, stdin=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 stdout=subprocess.PIPE, universal_newlines=True, close_fds=True)
+            __, errors = p.communicate(passphrase)
+            passphrase = None
+            if p.returncode == 0:
+                break
+            elif p.returncode == 2 and key_file is None:  # bad passphrase
+                continue
+            elif p.returncode == 2:
+                raise WorkerException(_('Open container failed.\nPlease check key file'))
+            else:
+                raise WorkerException(errors)
+        elapsed = monotonic() - start - waited
+        self.report_timings('unlock', [('resume', elapsed)])
+        syslog.syslog(syslog.LOG_INFO, 'quick unlock {path} in {elapsed:.2f}s'.format(path=container_path,
+                                                                                      elapsed=elapsed))
+
+    def is_suspended(self, device_name):
+        """ :param device_name: The device mapper name
+            :type device_name: str
+            :returns: True if the device mapper device is suspended (quick locked)
+            :rtype: bool
+        """
+        dm_device = os.path.basename(os.path.realpath(self.get_device_mapper_name(device_name)))
+        try:
+            with open('/sys/block/{dm_device}/dm/suspended'.format(dm_device=dm_device)) as suspended:
+                return suspended.read().strip() == '1'
+        except IOError:
+            return False
+
+    def is_read_only(self, device_name):
+        """ :param device_name: The device mapper name
+            :type device_name: str
+            :returns: True if the device mapper device has been opened read-only
+            :rtype: bool
+        """
+        dm_device = os.path.basename(os.path.realpath(self.get_device_mapper_name(device_name)))
+        try:
+            with open('/sys/block/{dm_device}/ro'.format(dm_device=dm_device)) as read_only:
+                return read_only.read().strip() == '1'
+        except IOError:
+            return False
 
     def create_container(self, device_name, container_path, container_size,
-                         filesystem_type, enc_format, key_file=None, quickformat=False):
+                         filesystem_type, enc_format, key_file=None, quickformat=False, direct_io=True,
+                         resume=False, unattended=False, secret=None, pool_dir=None,
+                         io_priority='normal', rate_limit=0, benchmark=False, fill_chunk_size=0,
+                         pbkdf_profile=None, cipher=None, perf_flags=None, sector_size=0, thin=False):
         """ Creates a new LUKS2 container with requested size and filesystem after validating parameters
             Three step process: asks for passphrase after initializing container with random bits,
-            and signals successful LUKS initialization before writing the filesystem
+            and signals successful LUKS initialization before writing the filesystem.
+            In unattended mode the passphrase or key file gets supplied up front
+            and all three steps run without waiting for the UI.
             :param device_name: The device mapper name, used as filesystem label as well
             :type device_name: str
             :param container_path: The path of the container file to be created
             :type container_path: str
             :param container_size: The size the new container in KB
             :type container_size: int
-            :param filesystem_type: The type of the filesystem inside the new container
-                                    (supported: 'ext4', 'ext2', 'ntfs')
+            :param filesystem_type: The name of the filesystem profile used inside the new container
+                                    (see fsprofiles.FILESYSTEM_PROFILES)
             :type filesystem_type: str
             :param enc_format: The type of the encryption format used for the new container
                                (supported: 'LUKS', 'TrueCrypt')
@@ -436,6 +1142,35 @@ class WorkerHelper():
             :type key_file: str or None
             :param quickformat: Use fallocate instead of initializing container with random data
             :type quickformat: bool
+            :param direct_io: Bypass the page cache while initializing the container with random data
+            :type direct_io: bool
+            :param resume: Continue an interrupted create of this container from the checkpoint in its journal
+            :type resume: bool
+            :param unattended: Run fill, format and mkfs without round trips to the UI
+            :type unattended: bool
+            :param secret: The passphrase for an unattended create if no key file is used
+            :type secret: :class:`LockedSecret` or None
+            :param pool_dir: Claim a pre-filled container file from this pool directory if available
+            :type pool_dir: str or None
+            :param io_priority: Run with idle I/O class and lowest CPU priority if 'background'
+            :type io_priority: str
+            :param rate_limit: Maximum bytes per second written while initializing the container, 0 for no limit
+            :type rate_limit: int
+            :param benchmark: Measure the first-write throughput of the new filesystem
+            :type benchmark: bool
+            :param fill_chunk_size: Block size for initializing the container from the storage profile, 0 for auto
+            :type fill_chunk_size: int
+            :param pbkdf_profile: Name of the key derivation profile for LUKS, None for the cryptsetup defaults
+            :type pbkdf_profile: str or None
+            :param cipher: Name of the cipher for LUKS, None for the cryptsetup default
+            :type cipher: str or None
+            :param perf_flags: dm-crypt performance flags to store in the LUKS2 header, None for none
+            :type perf_flags: list of str or None
+            :param sector_size: Encryption sector size for LUKS in bytes, 0 to use 4096 if the filesystem allows it
+            :type sector_size: int
+            :param thin: Create a sparse container file that takes up disk space only as it gets written to,
+                         discards get passed through so freed space can be given back (LUKS only)
+            :type thin: bool
             :raises: WorkerException
         """
         # STEP0: #########################################################################
@@ -478,9 +1213,33 @@ class WorkerHelper():
             container_dir = os.path.expanduser('~' + os.getenv("SUDO_USER"))
             container_path = os.path.join(container_dir, os.path.basename(container_path))
 
+        # validate journal if resuming an interrupted create
+        journal = FillJournal(container_path, opener=self.open_as_user)
+        parameters = {'size': container_size, 'filesystem_type': filesystem_type,
+                      'encryption_format': enc_format, 'quickformat': quickformat, 'thin': bool(thin)}
+        resume_offset, space_allocated = 0, 0
+        if resume:
+            checkpoint = journal.read()
+            if checkpoint is not None:
+                checkpoint.setdefault('thin', False)  # journals of earlier versions record only thin containers
+            # evaluated lazily: stat only if the file exists
+            if (checkpoint is None
+                    or not os.path.isfile(container_path)
+                    or os.path.islink(container_path)
+                    or os.stat(container_path).st_uid != int(os.getenv("SUDO_UID"))
+                    or any([checkpoint.get(key) != value for key, value in parameters.items()])):
+                raise WorkerException(
+                    _('Cannot resume creating the container:\n{file_path}\n\n'
+                      'The container file or its journal does not match\n'
+                      'the requested parameters').format(file_path=container_path)
+                )
+            resume_offset = min(int(checkpoint['offset']), container_size)
+            space_allocated = os.stat(container_path).st_blocks * 512
+
         free_space = os.statvfs(container_dir)
-        free_space = free_space.f_bavail * free_space.f_bsize
-        if container_size > free_space:
+        free_space = free_space.f_bavail * free_space.f_bsize + space_allocated
+        # thin containers only need space for the data written to them
+        if container_size > free_space and not thin:
             raise WorkerException(
                 _('Not enough free disc space for container:\n\n'
                   '{space_needed} MB needed\n{space_available} MB available')
@@ -497,12 +1256,49 @@ class WorkerHelper():
                     _('Key file not accessible\nor path does not exist:\n\n{file_path}').format(file_path=key_file)
                 )
 
+        if unattended and key_file is None and secret is None:
+            raise WorkerException(_('Please supply a passphrase or key file\n'
+                                    'to create a container unattended'))
+
         # validate encryption_format and filesystem
-        # TODO: exFAT?
-        if filesystem_type not in ['ext4', 'ext2', 'ntfs']:
+        profile = get_profile(filesystem_type)
+        if profile is None:
             raise WorkerException(
                 _('Unknown filesystem type: {filesystem_type}').format(filesystem_type=str(filesystem_type))
             )
+        if container_size < profile.min_size:
+            raise WorkerException(
+                _('Container size too small for {filesystem_type}\n'
+                  'Please choose at least {min_size}MB').format(filesystem_type=profile.name,
+                                                                min_size=profile.min_size // MiB)
+            )
+        if io_priority not in ['normal', 'background']:
+            raise WorkerException(_('Unknown I/O priority: {io_priority}').format(io_priority=str(io_priority)))
+        pbkdf = get_pbkdf_profile(pbkdf_profile) if pbkdf_profile is not None else None
+        if pbkdf_profile is not None and pbkdf is None:
+            raise WorkerException(_('Unknown key derivation profile: {pbkdf_profile}').format(
+                pbkdf_profile=str(pbkdf_profile)))
+        cipher_candidate = get_cipher(cipher) if cipher is not None else None
+        if cipher is not None and cipher_candidate is None:
+            raise WorkerException(_('Unknown cipher: {cipher}').format(cipher=str(cipher)))
+        try:
+            perf_flags = validate_flags(perf_flags) if perf_flags is not None else None
+        except ValueError as ve:
+            raise WorkerException(str(ve)) from ve
+        if thin:
+            if enc_format != 'LUKS':
+                raise WorkerException(_('Thin containers are only supported for the LUKS format'))
+            # discards punch holes into the container file: keeps it sparse and lets compact_container() work
+            perf_flags = validate_flags((perf_flags or []) + ['allow_discards'])
+        if sector_size not in (0,) + SECTOR_SIZES:
+            raise WorkerException(_('Unknown sector size: {sector_size}').format(sector_size=str(sector_size)))
+        if enc_format != 'LUKS':
+            sector_size = 512
+        elif sector_size == 0:
+            sector_size = choose_sector_size(container_dir, container_size)
+        elif container_size % sector_size:
+            raise WorkerException(_('The container size has to be a multiple\n'
+                                    'of the sector size ({sector_size} bytes)').format(sector_size=sector_size))
         if enc_format == 'Truecrypt' and not self.is_tc_installed:
             raise WorkerException(_('If you want to use TrueCrypt containers\n'
                                     'make sure `cryptsetup` is at least version 1.6 (`cryptsetup --version`)\n'
@@ -511,53 +1307,87 @@ class WorkerHelper():
         # STEP1: ##########################################################
         # create container file by filling allocated space with random bits
         #
-
-        # runas user to fail on access restictions
-        if quickformat:
-            # does not fail if the output file already exists, but check is in setupUI.on_save_file() anyway
-            cmd = ['sudo', '-u', os.getenv("SUDO_USER"),
-                   'fallocate', '-x', '-l', str(container_size), container_path]
+        if io_priority == 'background':
+            # inherited by the fill threads and all tools started from here on, restored after the command
+            self.set_background_priority(True)
+        timer = PhaseTimer(self.report_progress, 'create ' + container_path)
+        timer.start('fill')
+        filled_bytes, from_pool, preallocated = container_size - resume_offset, False, 0
+
+        if resume and resume_offset >= container_size:
+            pass  # container file already initialized, continue with formatting
+        elif thin:
+            # sparse file: nothing gets written, disk space is allocated as the container gets used
+            try:
+                fd = self.open_as_user(container_path, os.O_WRONLY | os.O_CREAT | os.O_NOFOLLOW |
+                                       (0 if resume else os.O_EXCL))
+                try:
+                    prepare_container_file(fd, container_size, sparse=True)
+                finally:
+                    os.close(fd)
+            except OSError as ose:
+                raise WorkerException(str(ose)) from ose
+            filled_bytes = 0
+            journal.write(container_size, **parameters)
+        elif not quickformat and not resume and pool_dir is not None and \
+                self.claim_pool_file(pool_dir, container_size, container_path):
+            # pool file already filled with random data, continue with formatting
+            filled_bytes, from_pool = 0, True
+            journal.write(container_size, **parameters)
+        elif quickformat:
+            # open as user to fail on access restictions, disable copy-on-write before allocating the space
+            try:
+                fd = self.open_as_user(container_path, os.O_WRONLY | os.O_CREAT | os.O_NOFOLLOW |
+                                       (0 if resume else os.O_EXCL))
+                try:
+                    prepare_container_file(fd, container_size, emulate=True)
+                finally:
+                    os.close(fd)
+            except OSError as ose:
+                raise WorkerException(str(ose)) from ose
+            # space reserved but nothing written: no throughput to report
+            filled_bytes, preallocated = 0, container_size
+            journal.write(container_size, **parameters)
         else:
-            count = str(int(container_size / 1024 / 1024)) + 'K'
-            # oflag=excl -> fail if the output file already exists
-            cmd = ['sudo', '-u', os.getenv("SUDO_USER"),
-                   'dd', 'if=/dev/urandom', 'of=' + container_path,
-                   'bs=1K', 'count=' + count, 'conv=excl']
+            self.fill_container(container_path, container_size, journal, parameters, direct_io,
+                                resume_offset if resume else None, rate_limit=int(rate_limit),
+                                chunk_size=int(fill_chunk_size))
+        timer.done(bytes=filled_bytes, pool=from_pool, preallocated=preallocated, **self.get_layout(container_path))
 
-        with open(os.devnull) as DEVNULL:
-            p = subprocess.Popen(cmd, stderr=subprocess.PIPE, stdout=DEVNULL, universal_newlines=True, close_fds=True)
-            __, errors = p.communicate()
-        if p.returncode != 0:
-            # 'sudo -u' might add this -> don't display
-            raise WorkerException(errors.replace('Sessions still open, not unmounting', '').strip())
-            # TODO: this can only work with english locale,
-            # but this errormessage doesn't seem to be localized in sudo yet ..
-            # get rid of the problem (strip env?) or remove msg in all languages
-
-        # setup loopback device with created container
-        try:
-            reserved_loopback_device = subprocess.check_output(
-                ['losetup', '-f', '--show', container_path],
-                stderr=subprocess.PIPE, universal_newlines=True
-            ).strip()
-        except subprocess.CalledProcessError as cpe:
-            raise WorkerException(cpe.output) from cpe
+        # setup loopback device with created container, logical block size matching the encryption sectors
+        reserved_loopback_device = self.attach_loopback_device(container_path, sector_size)
 
         # STEP2: ######################################################
         # ask user for password and initialize LUKS/TrueCrypt container
         #
         resp = ''
         try:
-            if key_file is None:
+            if unattended:
+                resp = secret.get() if key_file is None else ''
+            elif key_file is None:
                 resp = self.communicate('getPassword')
             else:
                 self.communicate('containerDone')
 
+            timer.start('format')
+            format_details = {}
             if enc_format == 'LUKS':
 
-                cmd = ['cryptsetup', 'luksFormat', '--type', 'luks2', '-q', reserved_loopback_device]
+                cmd = ['cryptsetup', 'luksFormat', '--type', 'luks2', '-q', '--sector-size', str(sector_size),
+                       reserved_loopback_device]
+                format_details['sector_size'] = sector_size
                 if key_file is not None:
                     cmd += ['--key-file', key_file]
+                if pbkdf is not None:
+                    # fit argon2 memory to the RAM available right now: asking for more would force swapping
+                    pbkdf_parameters = pbkdf.get_parameters()
+                    cmd += pbkdf.cryptsetup_options(pbkdf_parameters)
+                    format_details.update(pbkdf=pbkdf.name, pbkdf_memory=pbkdf_parameters['memory'],
+                                          pbkdf_parallel=pbkdf_parameters['parallel'],
+                                          pbkdf_reduced=pbkdf_parameters['reduced'])
+                if cipher_candidate is not None:
+                    cmd += cipher_candidate.cryptsetup_options()
+                    format_details['cipher'] = cipher_candidate.name
                 with open(os.devnull) as DEVNULL:
                     p = subprocess.Popen(cmd,
                                          stdin=subprocess.PIPE, stderr=subprocess.PIPE, stdout=DEVNULL,
@@ -568,35 +1398,22 @@ class WorkerHelper():
 
             elif enc_format == 'TrueCrypt':
 
-                with open(os.devnull) as DEVNULL:
-                    # secure erase already done with dd, no need to use tcplay for that
-                    cmd = ['tcplay', '-c', '-d', reserved_loopback_device, '--insecure-erase']
-                    if key_file is not None:
-                        cmd += ['--keyfile', key_file]
-                    p = subprocess.Popen(cmd,
-                                         stdin=subprocess.PIPE, stderr=subprocess.PIPE, stdout=DEVNULL,
-                                         universal_newlines=True, close_fds=True)
-                    # tcplay needs the password twice & confirm -> using sleep instead of parsing output
-                    # ugly, but crypt-init takes ages with truecrypt anyways
-                    sleep(1)
-                    p.stdin.write(resp + '\n')
-                    p.stdin.flush()
-                    sleep(1)
-                    p.stdin.write(resp + '\n')
-                    p.stdin.flush()
-                    sleep(1)
-                    p.stdin.write('y\n')  # .. until tcplay gets localized :)
-                    p.stdin.flush()
-                    p.stdin.close()
-                    p.stderr.close()
-                    p.wait()
-
-                if p.returncode != 0:
-                    raise WorkerException('TCPLAY ERROR')
+                # secure erase already done with dd, no need to use tcplay for that
+                cmd = ['tcplay', '-c', '-d', reserved_loopback_device, '--insecure-erase']
+                if key_file is not None:
+                    cmd += ['--keyfile', key_file]
+                # tcplay needs the password twice & confirm -> answer its prompts on a pseudo-terminal
+                tcplay = TcplayDriver(cmd, resp, self.report_tcplay_progress)
+                try:
+                    tcplay.run()
+                except TcplayException as tce:
+                    raise WorkerException(str(tce)) from tce
 
             else:
                 raise WorkerException(_('Unknown encryption format: {enc_fmt}').format(enc_fmt=enc_format))
-            self.communicate('formatDone')  # signal status
+            timer.done(**format_details)
+            if not unattended:
+                self.communicate('formatDone')  # signal status
         finally:  # cleanup loopback device
             self.detach_loopback_device(reserved_loopback_device)
 
@@ -604,40 +1421,615 @@ class WorkerHelper():
         # open encrypted container and format with filesystem
         #
         pw_callback = lambda: resp
+        timer.start('unlock')
         self.unlock_container(device_name=device_name,
                               container_path=container_path,
                               key_file=key_file,
-                              pw_callback=pw_callback)
+                              pw_callback=pw_callback,
+                              perf_flags=perf_flags)
         resp = None  # get rid of pw
+        timer.done()
 
-        # fs-root of created ext-filesystem should belong to the user
+        # fs-root of created filesystem should belong to the user and not be accessible by others:
+        # set by mkfs if supported, otherwise on a temporary mount
         device_mapper_name = self.get_device_mapper_name(device_name)
-        if filesystem_type == 'ext4':
-            cmd = ['mkfs.ext4', '-L', device_name, '-O', '^has_journal', '-m', '0', '-q', device_mapper_name]
-        elif filesystem_type == 'ext2':
-            cmd = ['mkfs.ext2', '-L', device_name, '-m', '0', '-q', device_mapper_name]
-        elif filesystem_type == 'ntfs':
-            cmd = ['mkfs.ntfs', '-L', device_name, '-Q', '-q', device_mapper_name]
-        try:
-            subprocess.check_output(cmd, stderr=subprocess.STDOUT, universal_newlines=True)
+        timer.start('mkfs')
+        root_owner_set = self.make_filesystem(profile, device_mapper_name, device_name, container_size, sector_size)
+        timer.done(profile=profile.name, root_owner=root_owner_set)
+
+        if (profile.supports_permissions and not root_owner_set) or benchmark:
+            timer.start('mount')
+            tmp_mount = tempfile.mkdtemp(prefix='luckyluks-')  # private: mode 0700
+            try:
+                try:
+                    subprocess.check_output(
+                        ['mount', '-o', profile.get_mount_options(), device_mapper_name, tmp_mount],
+                        stderr=subprocess.STDOUT, universal_newlines=True
+                    )
+                except subprocess.CalledProcessError as cpe:
+                    raise WorkerException(cpe.output) from cpe
+                timer.done()
+
+                if profile.supports_permissions and not root_owner_set:
+                    timer.start('ownership')
+                    os.chown(tmp_mount, int(os.getenv("SUDO_UID")), int(os.getenv("SUDO_GID")))
+                    os.chmod(tmp_mount, ROOT_MODE)
+                    timer.done()
+
+                if benchmark:
+                    timer.start('first_write')
+                    timer.done(bytes=self.measure_first_write(tmp_mount))
+
+                timer.start('unmount')
+                try:
+                    subprocess.check_output(['umount', tmp_mount], stderr=subprocess.STDOUT,
+                                            universal_newlines=True)
+                except subprocess.CalledProcessError as cpe:
+                    raise WorkerException(cpe.output) from cpe
+            finally:
+                if not os.path.ismount(tmp_mount):
+                    os.rmdir(tmp_mount)
+            timer.done()
+
+        timer.start('close')
+        self.close_container(device_name, container_path)
+        timer.done()
+        journal.remove()
+        timer.log_total()
+
+    def set_perf_flags(self, device_name, container_path, perf_flags):
+        """ Changes the dm-crypt performance flags of an unlocked container without closing it,
+            LUKS2 containers keep them in their header for the next unlock
+            :param device_name: The device mapper name
+            :type device_name: str
+            :param container_path: The path of the container file
+            :type container_path: str
+            :param perf_flags: The flags to set (see dmcrypt.PERF_FLAGS), all others get removed
+            :type perf_flags: list of str
+            :returns: The flags active now
+            :rtype: list of str
+            :raises: WorkerException
+        """
+        if not self.check_status(device_name, container_path) or self.is_suspended(device_name):
+            raise WorkerException(_('The container needs to be unlocked\nto change its dm-crypt options'))
+        try:
+            perf_flags = validate_flags(perf_flags)
+        except ValueError as ve:
+            raise WorkerException(str(ve)) from ve
+        self.refresh_container(device_name, perf_flags, persistent=self.is_luks2(container_path))
+        return self.get_active_flags(device_name)
+
+    def benchmark_mount_profiles(self, device_name, container_path, mount_profile=None):
+        """ Runs a metadata-heavy workload (many small files) on a mounted container once per mount profile,
+            remounting it with the options of each profile. The container gets remounted with the options of its
+            own profile afterwards. Profiles without options for the filesystem are measured once as `default`.
+            :param device_name: The device mapper name
+            :type device_name: str
+            :param container_path: The path of the container file
+            :type container_path: str
+            :param mount_profile: The mount profile the container has been mounted with
+            :type mount_profile: str or None
+            :returns: Per profile its name, the mount options and the seconds per step of the workload
+            :rtype: list of dicts
+            :raises: WorkerException
+        """
+        if not self.check_status(device_name, container_path) or self.is_suspended(device_name):
+            raise WorkerException(_('The container needs to be unlocked\nto compare mount profiles'))
+        if self.is_read_only(device_name):
+            raise WorkerException(_('The container is open read-only,\nmount profiles cannot be compared'))
+        mount_point = find_mount_point(self.get_device_mapper_name(device_name))
+        if mount_point is None:
+            raise WorkerException(_('The container needs to be mounted\nto compare mount profiles'))
+        filesystem = self.get_filesystem_type(device_name)
+        results = []
+        try:
+            measured = []
+            for profile in MOUNT_PROFILES:
+                options = profile.get_options(filesystem)
+                if options in measured:
+                    continue  # same options as a profile measured already
+                measured.append(options)
+                self.remount(mount_point, self.get_mount_options(device_name, False, profile.name, remount=True))
+                try:
+                    timings = measure_metadata(mount_point)
+                except OSError as ose:
+                    raise WorkerException(str(ose)) from ose
+                results.append({'profile': profile.name, 'options': options, 'timings': timings})
+                syslog.syslog(syslog.LOG_INFO, 'mount benchmark {path}: {profile} {total:.2f}s ({steps})'.format(
+                    path=container_path, profile=profile.name, total=sum(elapsed for __, elapsed in timings),
+                    steps=', '.join('{0} {1:.2f}s'.format(step, elapsed) for step, elapsed in timings)))
+        finally:
+            self.remount(mount_point, self.get_mount_options(device_name, False, mount_profile, remount=True))
+        return results
+
+    def remount(self, mount_point, options):
+        """ :param mount_point: The mount point of an unlocked container
+            :type mount_point: str
+            :param options: The new mount options
+            :type options: str
+            :raises: WorkerException
+        """
+        try:
+            subprocess.check_output(['mount', '-o', 'remount,' + options, mount_point],
+                                    stderr=subprocess.STDOUT, universal_newlines=True)
         except subprocess.CalledProcessError as cpe:
             raise WorkerException(cpe.output) from cpe
 
-        # remove group/other read/execute rights from fs root if possible
-        if filesystem_type != 'ntfs':
-            tmp_mount = os.path.join('/tmp/', str(uuid4()))
-            os.mkdir(tmp_mount)
+    def benchmark_read(self, device_name, container_path):
+        """ Measures the sequential read throughput of an unlocked container, to compare read-only
+            and read-write access. Only reads, at most READ_BENCHMARK_SIZE from the start of the device.
+            :param device_name: The device mapper name
+            :type device_name: str
+            :param container_path: The path of the container file
+            :type container_path: str
+            :returns: read_only (the access mode the container is open with) and rate in bytes per second
+            :rtype: dict
+            :raises: WorkerException
+        """
+        if not self.check_status(device_name, container_path) or self.is_suspended(device_name):
+            raise WorkerException(_('The container needs to be unlocked\nto measure its read throughput'))
+        try:
+            rate = measure_read_throughput(self.get_device_mapper_name(device_name), READ_BENCHMARK_SIZE)
+        except OSError as ose:
+            raise WorkerException(str(ose)) from ose
+        return {'read_only': self.is_read_only(device_name), 'rate': rate}
+
+    def benchmark_perf_flags(self, device_name, container_path):
+        """ Measures random 4K read latency of an unlocked container, and synchronous write latency if it is
+            mounted, once with the kernel workqueues and once bypassing them. The other flags stay unchanged
+            and the original flags get restored afterwards.
+            :param device_name: The device mapper name
+            :type device_name: str
+            :param container_path: The path of the container file
+            :type container_path: str
+            :returns: Per configuration the active flags and median/p99 read and write latency in seconds
+            :rtype: list of dicts
+            :raises: WorkerException
+        """
+        if not self.check_status(device_name, container_path) or self.is_suspended(device_name):
+            raise WorkerException(_('The container needs to be unlocked\nto measure its latency'))
+        device = self.get_device_mapper_name(device_name)
+        mount_point = find_mount_point(device)
+        original_flags = self.get_active_flags(device_name)
+        other_flags = [flag for flag in original_flags if flag not in WORKQUEUE_FLAGS]
+        results = []
+        try:
+            for config, flags in (('workqueue', other_flags), ('no_workqueue', other_flags + WORKQUEUE_FLAGS)):
+                self.refresh_container(device_name, validate_flags(flags))
+                # persistent flags of a LUKS2 header might still apply -> report what is active
+                result = {'config': config, 'flags': self.get_active_flags(device_name)}
+                try:
+                    result['read'] = measure_read_latency(device)
+                    if mount_point is not None:
+                        result['write'] = measure_write_latency(mount_point)
+                except OSError as ose:
+                    raise WorkerException(str(ose)) from ose
+                results.append(result)
+        finally:
+            self.refresh_container(device_name, original_flags)
+        return results
+
+    def refresh_container(self, device_name, perf_flags, persistent=False):
+        """ Reloads the mapping of an unlocked container with new flags. Needs the volume key in the kernel
+            keyring (default for LUKS2), LUKS1 and TrueCrypt containers get new flags on their next unlock.
+            :param device_name: The device mapper name
+            :type device_name: str
+            :param perf_flags: Validated flags
+            :type perf_flags: list of str
+            :param persistent: Store the flags in the LUKS2 header as well
+            :type persistent: bool
+            :raises: WorkerException
+        """
+        cmd = ['cryptsetup', 'refresh', device_name] + cryptsetup_options(perf_flags)
+        if self.is_read_only(device_name):
+            cmd.append('--readonly')  # the header of a read-only container stays untouched
+        elif persistent:
+            cmd.append('--persistent')
+        try:
+            with open(os.devnull) as DEVNULL:
+                # no passphrase: fail right away if the volume key is not in the keyring
+                subprocess.check_output(cmd, stdin=DEVNULL, stderr=subprocess.STDOUT, universal_newlines=True)
+        except subprocess.CalledProcessError as cpe:
+            raise WorkerException(
+                _('Unable to change the dm-crypt options of the unlocked container,\n'
+                  'they will be used on the next unlock:\n\n{error}').format(error=cpe.output.strip())
+            ) from cpe
+
+    def benchmark_sector_sizes(self, container_dir, cipher=None):
+        """ Compares the throughput of 512 and 4096 byte encryption sectors on a scratch LUKS2 container
+            in the given directory, formatted with a random key and a minimal key derivation
+            :param container_dir: The directory new containers get created in
+            :type container_dir: str
+            :param cipher: Name of the cipher to measure, None for the cryptsetup default
+            :type cipher: str or None
+            :returns: write and read in bytes per second per sector size and the sector size chosen by default
+            :rtype: dict
+            :raises: WorkerException
+        """
+        cipher_candidate = get_cipher(cipher) if cipher is not None else None
+        if cipher is not None and cipher_candidate is None:
+            raise WorkerException(_('Unknown cipher: {cipher}').format(cipher=str(cipher)))
+        scratch_path = os.path.join(container_dir, '.luckyluks-sectors-' + uuid4().hex)
+        try:
+            # created as user to fail on access restrictions
+            fd = self.open_as_user(scratch_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW)
             try:
-                subprocess.check_output(
-                    ['mount', '-o', 'nosuid,nodev', device_mapper_name, tmp_mount],
-                    stderr=subprocess.STDOUT, universal_newlines=True
-                )
-            except subprocess.CalledProcessError as cpe:
-                raise WorkerException(cpe.output) from cpe
-            os.chown(tmp_mount, int(os.getenv("SUDO_UID")), int(os.getenv("SUDO_GID")))
-            os.chmod(tmp_mount, 0o700)
+                prepare_container_file(fd, SECTOR_BENCHMARK_SIZE, emulate=True)
+            finally:
+                os.close(fd)
+        except OSError as ose:
+            raise WorkerException(str(ose)) from ose
 
-        self.close_container(device_name, container_path)
+        results = {'default': choose_sector_size(container_dir, SECTOR_BENCHMARK_SIZE)}
+        device_name = 'luckyluks-' + uuid4().hex[:8]
+        try:
+            for sector_size in SECTOR_SIZES:
+                loop_dev = self.attach_loopback_device(scratch_path, sector_size)
+                try:
+                    key = os.urandom(64)
+                    format_cmd = ['cryptsetup', 'luksFormat', '--type', 'luks2', '-q', '--sector-size',
+                                  str(sector_size), '--pbkdf', 'pbkdf2', '--pbkdf-force-iterations', '1000',
+                                  '--key-file', '-', loop_dev]
+                    if cipher_candidate is not None:
+                        format_cmd += cipher_candidate.cryptsetup_options()
+                    with open(os.devnull) as DEVNULL:
+                        for cmd in (format_cmd, ['cryptsetup', 'open', '--key-file', '-', loop_dev, device_name]):
+                            p = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=DEVNULL,
+                                                 stderr=subprocess.PIPE, close_fds=True)
+                            __, errors = p.communicate(key)
+                            if p.returncode != 0:
+                                raise WorkerException(errors.decode('utf-8', 'replace'))
+                        try:
+                            results[str(sector_size)] = measure_throughput(self.get_device_mapper_name(device_name))
+                        except OSError as ose:
+                            raise WorkerException(str(ose)) from ose
+                        finally:
+                            subprocess.call(['cryptsetup', 'close', device_name], stdout=DEVNULL, stderr=DEVNULL)
+                finally:
+                    self.detach_loopback_device(loop_dev)
+        finally:
+            os.unlink(scratch_path)
+        return results
+
+    def make_filesystem(self, profile, device, device_name, container_size, sector_size=512):
+        """ Creates the filesystem of a new container with the options of its profile, aligned to the
+            encryption sector size of the unlocked device. Owner and mode of the filesystem root get set
+            by mkfs if the filesystem supports it, which saves mounting the new filesystem.
+            :param profile: The filesystem profile
+            :type profile: :class:`fsprofiles.FilesystemProfile`
+            :param device: The unlocked device mapper device
+            :type device: str
+            :param device_name: The device mapper name, used as filesystem label
+            :type device_name: str
+            :param container_size: The size of the container in bytes
+            :type container_size: int
+            :param sector_size: The encryption sector size in bytes
+            :type sector_size: int
+            :returns: True if owner and mode of the filesystem root have been set
+            :rtype: bool
+            :raises: WorkerException
+        """
+        io_hints = get_device_io_hints(device) or {}
+        uid, gid = int(os.getenv("SUDO_UID")), int(os.getenv("SUDO_GID"))
+        root_owner, protofile = None, None
+        if profile.can_set_root_owner() and profile.filesystem == 'xfs':
+            fd, protofile = tempfile.mkstemp(prefix='luckyluks-', suffix='.proto')
+            with os.fdopen(fd, 'w') as proto:
+                proto.write(xfs_protofile(uid, gid))
+        elif profile.can_set_root_owner():
+            root_owner = (uid, gid)
+
+        try:
+            subprocess.check_output(
+                profile.mkfs_command(device, device_name, container_size,
+                                     max(sector_size, io_hints.get('logical_block_size', 512)),
+                                     io_hints.get('optimal_io_size', 0),
+                                     root_owner, protofile),
+                stderr=subprocess.STDOUT, universal_newlines=True
+            )
+        except subprocess.CalledProcessError as cpe:
+            raise WorkerException(cpe.output) from cpe
+        finally:
+            if protofile is not None:
+                os.unlink(protofile)
+
+        if not profile.can_set_root_owner():
+            return False
+        cmd = profile.root_mode_command(device)
+        if cmd is not None:
+            # debugfs exits with 0 even if a request failed, but prints nothing except its version on success
+            try:
+                output = subprocess.check_output(cmd, stderr=subprocess.STDOUT, universal_newlines=True)
+            except (subprocess.CalledProcessError, OSError):
+                return False
+            if [line for line in output.splitlines() if line.strip() and not line.startswith('debugfs ')]:
+                return False
+        return True
+
+    def fill_container(self, container_path, container_size, journal, parameters, direct_io=True,
+                       start_offset=None, interruptible=False, rate_limit=0, chunk_size=0):
+        """ Creates the container file and fills it with random data using the parallel fill engine.
+            Number of threads and chunk size get adapted to the device the container is written to,
+            progress is reported to the UI in bytes per second. The offset up to which the data is synced
+            to disk gets recorded regularly in a journal, to be able to resume an interrupted fill.
+            :param container_path: The path of the container file to be created
+            :type container_path: str
+            :param container_size: The size the new container in bytes
+            :type container_size: int
+            :param journal: Sidecar journal to record checkpoints
+            :type journal: :class:`containerfile.FillJournal`
+            :param parameters: The create parameters stored with each checkpoint
+            :type parameters: dict
+            :param direct_io: Bypass the page cache using O_DIRECT if supported
+            :type direct_io: bool
+            :param start_offset: Resume filling an existing container file from this offset
+            :type start_offset: int or None
+            :param interruptible: Stop early if the UI sends an interrupt
+            :type interruptible: bool
+            :param rate_limit: Maximum bytes per second, 0 for no limit
+            :type rate_limit: int
+            :param chunk_size: Chunk size measured by the storage profiler, 0 to derive it from the device
+            :type chunk_size: int
+            :raises: WorkerException, Interrupted
+        """
+        threads, device_chunk_size = get_fill_parameters(os.path.dirname(container_path))
+        if not 0 < chunk_size <= 16 * MiB or chunk_size % 4096:  # ignore a bogus block size from the UI
+            chunk_size = device_chunk_size
+        try:
+            if start_offset is not None:
+                fd = self.open_as_user(container_path, os.O_WRONLY | os.O_NOFOLLOW)
+            else:  # O_EXCL -> fail if the output file already exists
+                fd = self.open_as_user(container_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+                start_offset = 0
+        except OSError as ose:
+            raise WorkerException(str(ose)) from ose
+
+        try:
+            # contiguous extents and no copy-on-write keep the loop mounted container from fragmenting
+            prepare_container_file(fd, container_size)
+        except OSError as ose:
+            os.close(fd)
+            raise WorkerException(str(ose)) from ose
+
+        engine = FillEngine(fd, container_size, threads, chunk_size, direct_io, start_offset, rate_limit)
+        start_time = monotonic()
+
+        def report_fill_progress(written, rate):
+            """ Sends bytes written, current and average rate in bytes per second and remaining seconds """
+            if interruptible:
+                self.check_interrupt()
+            elapsed = monotonic() - start_time
+            average = written / max(elapsed, 1e-6)
+            self.report_progress(phase='fill', bytes=start_offset + written, total=container_size,
+                                 rate=rate, average=average, elapsed=elapsed, rate_limit=rate_limit,
+                                 eta=(container_size - start_offset - written) / average if average else None)
+
+        try:
+            journal.write(start_offset, **parameters)
+            engine.run(progress_callback=report_fill_progress,
+                       checkpoint_callback=lambda offset: journal.write(offset, **parameters))
+            journal.write(container_size, **parameters)
+        except (FillException, OSError) as error:
+            raise WorkerException(str(error)) from error
+        except (KeyboardInterrupt, Interrupted):
+            # worker gets terminated or interrupted -> save the last durable offset before quitting
+            engine.checkpoint(lambda offset: journal.write(offset, **parameters))
+            raise
+        finally:
+            os.close(fd)
+
+    def measure_first_write(self, mount_point):
+        """ Writes a test file of random data to a freshly created filesystem and syncs it to disk.
+            The elapsed time reported with the bytes written gives the first-write throughput of the profile.
+            :param mount_point: Where the new filesystem is mounted
+            :type mount_point: str
+            :returns: bytes written
+            :rtype: int
+        """
+        free_space = os.statvfs(mount_point)
+        test_size = min(FIRST_WRITE_SIZE, free_space.f_bavail * free_space.f_bsize // 4) // MiB * MiB
+        if test_size == 0:
+            return 0
+        test_path = os.path.join(mount_point, '.luckyluks-first-write')
+        block = os.urandom(MiB)  # incompressible, like the encrypted data of other containers
+        fd = os.open(test_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            for __ in range(test_size // MiB):
+                os.write(fd, block)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+            os.unlink(test_path)
+        return test_size
+
+    def get_layout(self, container_path):
+        """ Collects the on-disk layout of a container file for the phase timings
+            :param container_path: The path of the container file
+            :type container_path: str
+            :returns: filesystem type, NOCOW attribute and number of fragments if the extent map is available
+            :rtype: dict
+        """
+        try:
+            fragmentation = get_fragmentation(container_path)
+        except OSError:
+            return {}
+        return {'filesystem': fragmentation['filesystem'], 'nocow': fragmentation['nocow'],
+                'fragments': fragmentation['fragments']}
+
+    def check_interrupt(self):
+        """ Checks without blocking if the UI asked to stop a background command.
+            Other messages are left in the queue for the main loop, an abort behind them is seen on the next check
+            :raises: Interrupted
+        """
+        try:
+            cmd = self.cmdqueue.get_nowait()
+        except queue.Empty:
+            return
+        if cmd.get('type') == 'abort':
+            raise Interrupted()
+        self.cmdqueue.put(cmd)
+
+    def fill_pool(self, pool_dir, pool_sizes, pool_quota, rate_limit=0):
+        """ Fills missing container files of the configured sizes in the pool directory of the user.
+            Runs with idle I/O and lowest CPU priority and stops early if the UI sends an interrupt,
+            unfinished pool files get resumed the next time.
+            :param pool_dir: The pool directory
+            :type pool_dir: str
+            :param pool_sizes: Number of pool files to keep per container size in bytes
+            :type pool_sizes: list of [size, count]
+            :param pool_quota: Maximum disk space used by the pool in bytes, 0 for no limit
+            :type pool_quota: int
+            :param rate_limit: Maximum bytes per second written, 0 for no limit
+            :type rate_limit: int
+            :returns: 'interrupted' if stopped early, 'success' otherwise
+            :rtype: str
+            :raises: WorkerException
+        """
+        self.validate_pool_dir(pool_dir)
+        pool = ContainerPool(pool_dir, {int(size): int(count) for size, count in pool_sizes}, int(pool_quota))
+
+        self.set_background_priority(True)
+        try:
+            for path, size in pool.missing():
+                if not path.endswith(POOL_FILLING_SUFFIX):
+                    path = self.rename_unfinished_pool_file(path)
+                journal = FillJournal(path, opener=self.open_as_user)
+                start_offset, allocated = None, 0
+                if os.path.exists(path):
+                    checkpoint = journal.read()
+                    start_offset = min(int(checkpoint['offset']), size) if checkpoint is not None else 0
+                    allocated = os.stat(path).st_blocks * 512
+                # skip files that would exceed the quota or the free disk space
+                free_space = os.statvfs(pool_dir)
+                free_space = free_space.f_bavail * free_space.f_bsize
+                if size - allocated > free_space or (pool.quota and pool.usage() - allocated + size > pool.quota):
+                    continue
+                self.fill_container(path, size, journal, {'size': size, 'pool': True},
+                                    start_offset=start_offset, interruptible=True, rate_limit=int(rate_limit))
+                journal.remove()
+                # only now the file can be claimed: a crash before leaves it to be filled again
+                try:
+                    self.run_as_user(os.rename, path, ContainerPool.completed_path(path))
+                except OSError as ose:
+                    raise WorkerException(str(ose)) from ose
+        except Interrupted:
+            return 'interrupted'
+        finally:
+            self.set_background_priority(False)
+        return 'success'
+
+    def rename_unfinished_pool_file(self, path):
+        """ Moves an unfinished pool file of an earlier version and its journal to the temporary name
+            pool files get filled under, so it cannot be claimed before it is completely filled
+            :param path: The path of the unfinished pool file
+            :type path: str
+            :returns: The new path
+            :rtype: str
+            :raises: WorkerException
+        """
+        filling_path = path + POOL_FILLING_SUFFIX
+        try:
+            # the file first: without its journal it would look completely filled under the old name
+            self.run_as_user(os.rename, path, filling_path)
+            if os.path.exists(path + JOURNAL_SUFFIX):
+                self.run_as_user(os.rename, path + JOURNAL_SUFFIX, filling_path + JOURNAL_SUFFIX)
+        except OSError as ose:
+            raise WorkerException(str(ose)) from ose
+        return filling_path
+
+    def claim_pool_file(self, pool_dir, container_size, container_path):
+        """ Takes a completely filled container file of the requested size from the pool.
+            The pool file gets renamed first to claim it atomically (in case several luckyLUKS
+            processes share a pool), then linked to the container path without overwriting anything.
+            :param pool_dir: The pool directory
+            :type pool_dir: str
+            :param container_size: The size of the new container in bytes
+            :type container_size: int
+            :param container_path: The path of the container file to be created
+            :type container_path: str
+            :returns: True if a pool file was claimed
+            :rtype: bool
+        """
+        try:
+            self.validate_pool_dir(pool_dir)
+        except WorkerException:
+            return False
+        candidate = ContainerPool(pool_dir).find_complete(container_size,
+                                                          os.stat(os.path.dirname(container_path)).st_dev)
+        if candidate is None:
+            return False
+        claimed = candidate + '.claimed-' + uuid4().hex
+        try:
+            self.run_as_user(os.rename, candidate, claimed)
+        except OSError:
+            return False  # claimed by someone else
+        try:
+            self.run_as_user(os.link, claimed, container_path)  # fails if the container file exists
+        except OSError:
+            self.run_as_user(os.rename, claimed, candidate)
+            return False
+        self.run_as_user(os.unlink, claimed)
+        return True
+
+    def validate_pool_dir(self, pool_dir):
+        """ Checks that the pool directory belongs to the calling user
+            :param pool_dir: The pool directory
+            :type pool_dir: str
+            :raises: WorkerException
+        """
+        if (not os.path.isdir(pool_dir) or os.path.islink(pool_dir)
+                or os.stat(pool_dir).st_uid != int(os.getenv("SUDO_UID"))):
+            raise WorkerException(_('Pool directory not accessible\nor path does not exist:\n\n{pool_dir}')
+                                  .format(pool_dir=pool_dir))
+
+    def set_background_priority(self, background):
+        """ Lowers or restores CPU and I/O priority of the calling thread.
+            On Linux both are per thread and get inherited by threads started afterwards,
+            eg the writer threads of the fill engine.
+            :param background: Use lowest CPU priority and idle I/O class or restore the defaults
+            :type background: bool
+        """
+        self.is_background_priority = background
+        os.setpriority(os.PRIO_PROCESS, 0, 19 if background else 0)
+        with open(os.devnull) as DEVNULL:
+            # ioprio of the main thread: its thread id equals the process id
+            subprocess.call(['ionice', '-c', '3' if background else '0', '-p', str(os.getpid())],
+                            stdout=DEVNULL, stderr=subprocess.STDOUT)
+
+    def open_as_user(self, path, flags, mode=0o600):
+        """ Opens a file with the rights of the calling user
+            :param path: The path of the file
+            :type path: str
+            :param flags: Flags passed to os.open
+            :type flags: int
+            :param mode: Permissions if the file gets created
+            :type mode: int
+            :returns: file descriptor
+            :rtype: int
+            :raises: OSError
+        """
+        return self.run_as_user(os.open, path, flags, mode)
+
+    def run_as_user(self, function, *args):
+        """ Calls a filesystem function with the effective uid/gids of the calling user
+            to fail on access restrictions, like running a command with `sudo -u` would do
+            :param function: The function to call eg os.open or os.rename
+            :type function: function
+            :param args: Arguments passed to the function
+            :returns: The return value of the function
+            :raises: OSError
+        """
+        uid, gid = int(os.getenv("SUDO_UID")), int(os.getenv("SUDO_GID"))
+        root_groups = os.getgroups()
+        os.setgroups(os.getgrouplist(os.getenv("SUDO_USER"), gid))
+        os.setegid(gid)
+        os.seteuid(uid)
+        try:
+            return function(*args)
+        finally:
+            os.seteuid(0)
+            os.setegid(0)
+            os.setgroups(root_groups)
 
     def modify_sudoers(self, user_id, nopassword=False):
         """ Adds sudo access to the program (without password) for the current user (/etc/sudoers.d/)
@@ -694,6 +2086,67 @@ class WorkerHelper():
             )
         return returncode == 0
 
+    def is_luks2(self, container_path):
+        """ :param container_path: The path of the container file
+            :type container_path: str
+            :returns: True if the container has a LUKS2 header
+            :rtype: bool
+            :raises: WorkerException
+        """
+        luks_header = self.read_luks_header(container_path)
+        return luks_header is not None and luks_header['version'] == 2
+
+    def read_luks_header(self, container_path):
+        """ Reads the LUKS header in-process instead of running `cryptsetup luksDump`
+            :param container_path: The path of the container file
+            :type container_path: str
+            :returns: The header information, see luksheader.read_header(), None if not a LUKS container
+            :rtype: dict or None
+            :raises: WorkerException
+        """
+        try:
+            return read_header(container_path)
+        except (OSError, LuksHeaderException) as error:
+            raise WorkerException(_('Cannot read the header of {container_path}:\n{error}').format(
+                container_path=container_path, error=str(error))) from error
+
+    def attach_loopback_device(self, container_path, sector_size=512, read_only=False):
+        """ Sets up the next free loopback device for a container file
+            :param container_path: The path of the container file
+            :type container_path: str
+            :param sector_size: Logical block size of the loopback device, matching the encryption sector size
+            :type sector_size: int
+            :param read_only: Set up a read-only loopback device
+            :type read_only: bool
+            :returns: The loopback device path (eg /dev/loop2)
+            :rtype: str
+            :raises: WorkerException
+        """
+        cmd = ['losetup', '-f', '--show']
+        if sector_size != 512:
+            cmd += ['--sector-size', str(sector_size)]
+        if read_only:
+            cmd.append('--read-only')
+        try:
+            return subprocess.check_output(cmd + [container_path],
+                                           stderr=subprocess.PIPE, universal_newlines=True).strip()
+        except subprocess.CalledProcessError as cpe:
+            # most likely no more loopdevices available
+            raise WorkerException(cpe.stderr or cpe.output) from cpe
+
+    def get_active_flags(self, device_name):
+        """ :param device_name: The device mapper name
+            :type device_name: str
+            :returns: The dm-crypt performance flags of the unlocked container
+            :rtype: list of str
+        """
+        try:
+            return parse_active_flags(subprocess.check_output(
+                ['cryptsetup', 'status', device_name],
+                stderr=subprocess.STDOUT, universal_newlines=True))
+        except subprocess.CalledProcessError:
+            return []
+
     def detach_loopback_device(self, loopback_device):
         """ Detaches given loopback device
             :param loopback_device: The loopback device path (eg /dev/loop2)